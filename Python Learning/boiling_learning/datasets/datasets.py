@@ -1,22 +1,39 @@
+import bisect
 import collections
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import dataclasses
 from dataclasses import dataclass
 import enum
 from fractions import Fraction
 import functools
+import hashlib
+import itertools
+import os
+from pathlib import Path
 import pprint
+import threading
+import time
 from typing import (
+    Any,
     Callable,
     Container,
+    Dict,
+    Hashable,
     Iterable,
+    Iterator,
+    List,
+    Mapping,
     Optional,
     Sequence,
+    Tuple,
     Union
 )
 import warnings
 
 import funcy
 import more_itertools as mit
+import numpy as np
 from sklearn.model_selection import train_test_split
 import tensorflow as tf
 from tensorflow.data.experimental import AUTOTUNE
@@ -24,15 +41,21 @@ from tensorflow.data.experimental import AUTOTUNE
 import boiling_learning.utils as bl_utils
 import boiling_learning.utils.mathutils as mathutils
 from boiling_learning.utils.utils import PathType
+from boiling_learning.utils.dtypes import DTypePolicy
 from boiling_learning.utils.functional import Pack
+import boiling_learning.io as bl_io
 from boiling_learning.io.io import DatasetTriplet
+from boiling_learning.io.json_encoders import GenericJSONEncoder
 import boiling_learning.preprocessing as bl_preprocessing
 from boiling_learning.preprocessing.transformers import (
     Creator,
     DictImageTransformer,
     Transformer,
+    execution_report,
+    fuse_transformers,
     # PackTransformerEncoder
 )
+from boiling_learning.management.LookupTable import file_lock
 from boiling_learning.management.Manager import Manager
 
 _sentinel = object()
@@ -124,6 +147,58 @@ SplitSubset.FROM_STR = {
 }
 
 
+class SplitMethod(enum.Enum):
+    WINDOW = 'window'
+    INTERLEAVE = 'interleave'
+    HASH = 'hash'
+
+
+def _stable_hash(*keys: Hashable) -> int:
+    # Python's *hash* is salted per process, so it cannot be used for reproducible splits
+    digest = hashlib.sha256(repr(keys).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], byteorder='big')
+
+
+def index_train_val_test_split(
+        indices: Iterable[int],
+        splits: DatasetSplitter,
+        method: Union[str, SplitMethod] = SplitMethod.INTERLEAVE,
+        key: Hashable = None
+) -> Tuple[List[int], Optional[List[int]], List[int]]:
+    """Assign each index to a split without touching the data it refers to.
+
+    With *SplitMethod.INTERLEAVE*, the i-th index goes to the same split as the i-th element
+    in *tf_train_val_test_split*. With *SplitMethod.HASH*, the assignment depends only on
+    *(key, index)*, so it is stable even if indices are added or removed.
+    """
+    method = SplitMethod(method)
+
+    if splits.val == 0:
+        proportions = mathutils.proportional_ints(splits.train, splits.test)
+    else:
+        proportions = mathutils.proportional_ints(splits.train, splits.val, splits.test)
+    window_shift = sum(proportions)
+    boundaries = tuple(itertools.accumulate(proportions))
+
+    buckets = tuple([] for _ in proportions)
+    for position, index in enumerate(indices):
+        if method is SplitMethod.INTERLEAVE:
+            slot = position % window_shift
+        elif method is SplitMethod.HASH:
+            slot = _stable_hash(key, index) % window_shift
+        else:
+            raise ValueError(f'index splitting is not available for method {method}.')
+
+        buckets[bisect.bisect_right(boundaries, slot)].append(index)
+
+    if splits.val == 0:
+        train_indices, test_indices = buckets
+        return train_indices, None, test_indices
+    else:
+        train_indices, val_indices, test_indices = buckets
+        return train_indices, val_indices, test_indices
+
+
 def train_val_test_split(
         dataset,
         n_samples,
@@ -192,6 +267,447 @@ def tf_concatenate(datasets: Iterable[tf.data.Dataset]) -> tf.data.Dataset:
     return ds
 
 
+class InterleaveWeights(enum.Enum):
+    UNIFORM = 'uniform'
+    LENGTH = 'length'
+
+
+def interleave_weights(
+        datasets: Sequence[tf.data.Dataset],
+        mode: Union[str, InterleaveWeights] = InterleaveWeights.LENGTH,
+        categories: Optional[Sequence[Hashable]] = None
+) -> List[float]:
+    """Sampling weights for interleaving *datasets*.
+
+    With *mode* UNIFORM every dataset is equally likely to be sampled, while with LENGTH
+    the probabilities are proportional to the dataset lengths, so that all datasets are
+    exhausted at roughly the same time. If *categories* are given (one per dataset), each
+    category gets the same total weight, which is then split between its datasets according
+    to *mode*.
+    """
+    mode = InterleaveWeights(mode)
+
+    if mode is InterleaveWeights.UNIFORM:
+        weights = [1.0] * len(datasets)
+    else:
+        weights = [
+            float(tf.data.experimental.cardinality(dataset))
+            for dataset in datasets
+        ]
+        if any(weight < 0 for weight in weights):
+            raise ValueError(
+                'length-proportional weights require datasets with known cardinality.'
+            )
+
+    if categories is not None:
+        if len(categories) != len(datasets):
+            raise ValueError('there must be exactly one category per dataset.')
+
+        category_totals = collections.defaultdict(float)
+        for category, weight in zip(categories, weights):
+            category_totals[category] += weight
+        weights = [
+            weight / category_totals[category] if category_totals[category] else 0.0
+            for category, weight in zip(categories, weights)
+        ]
+
+    total = sum(weights)
+    if total <= 0:
+        raise ValueError('interleave weights must not all be zero.')
+    return [weight / total for weight in weights]
+
+
+def tf_interleave(
+        datasets: Sequence[tf.data.Dataset],
+        weights: Optional[Sequence[float]] = None,
+        seed: Optional[int] = None,
+        buffer_size: int = AUTOTUNE
+) -> tf.data.Dataset:
+    """Randomly interleave *datasets* according to *weights*.
+
+    Unlike *tf_concatenate*, which nests one level per dataset and reads them one after
+    the other, every dataset is prefetched on its own so that several of them are decoded
+    concurrently, and consecutive elements come from different datasets. This yields well
+    mixed batches with small shuffle buffers. If *weights* is None, datasets are sampled
+    proportionally to their lengths when those are known, and uniformly otherwise.
+    """
+    datasets = list(datasets)
+
+    if not datasets:
+        raise ValueError('argument *datasets* must be a non-empty iterable.')
+
+    if weights is None:
+        try:
+            weights = interleave_weights(datasets, InterleaveWeights.LENGTH)
+        except ValueError:
+            weights = interleave_weights(datasets, InterleaveWeights.UNIFORM)
+    elif len(weights) != len(datasets):
+        raise ValueError('there must be exactly one weight per dataset.')
+
+    # datasets that are never sampled do not contribute any element
+    cardinalities = [
+        int(tf.data.experimental.cardinality(dataset))
+        for dataset, weight in zip(datasets, weights)
+        if weight > 0
+    ]
+
+    datasets = [dataset.prefetch(buffer_size) for dataset in datasets]
+    ds = tf.data.experimental.sample_from_datasets(datasets, weights=list(weights), seed=seed)
+
+    if all(cardinality >= 0 for cardinality in cardinalities):
+        ds = ds.apply(tf.data.experimental.assert_cardinality(sum(cardinalities)))
+    return ds
+
+
+def map_images(
+        ds: tf.data.Dataset,
+        func: Callable[[tf.Tensor], tf.Tensor]
+) -> tf.data.Dataset:
+    """Apply *func* to the images of a dataset of (image, data) pairs."""
+    return ds.map(
+        lambda image, data: (func(image), data),
+        num_parallel_calls=AUTOTUNE
+    )
+
+
+def echo_dataset(ds: tf.data.Dataset, factor: int) -> tf.data.Dataset:
+    """Repeat each element of *ds* *factor* times in a row.
+
+    Data echoing reuses upstream work when decoding and preprocessing are slower than the
+    training step. Echoed elements should be shuffled afterwards.
+    """
+    if factor < 1:
+        raise ValueError(f'*factor* must be a positive integer. Got {factor}')
+    if factor == 1:
+        return ds
+
+    def _repeat(*element):
+        element = element if len(element) > 1 else element[0]
+        return tf.data.Dataset.from_tensors(element).repeat(factor)
+
+    count = int(tf.data.experimental.cardinality(ds))
+    ds = ds.flat_map(_repeat)
+    if count >= 0:
+        ds = ds.apply(tf.data.experimental.assert_cardinality(count * factor))
+    return ds
+
+
+def apply_transformers(
+        ds: tf.data.Dataset,
+        transformers: Iterable[Transformer],
+        batch_size: Optional[int] = None,
+        batched: bool = False,
+        fuse: bool = True
+) -> tf.data.Dataset:
+    """Map *transformers* over the elements of *ds*.
+
+    If *fuse*, consecutive transformers sharing the same execution mode are applied in a single map.
+    If *batched*, *ds* is expected to be batched already, and all *transformers* must be batchable.
+    Otherwise, if *batch_size* is given, batchable transformers are applied to temporary batches of
+    *batch_size* elements instead of one element at a time.
+    """
+    transformers = tuple(transformers)
+
+    if batched and not all(transformer.batchable for transformer in transformers):
+        raise ValueError('all transformers must be batchable to be applied to a batched dataset.')
+
+    if fuse:
+        transformers = fuse_transformers(transformers)
+
+    for transformer in transformers:
+        map_fn = transformer.as_tf_function(pack_tuple=True)
+
+        if batch_size is not None and not batched and transformer.batchable:
+            ds = ds.batch(batch_size).map(map_fn, num_parallel_calls=AUTOTUNE).unbatch()
+        else:
+            ds = ds.map(map_fn, num_parallel_calls=AUTOTUNE)
+
+    return ds
+
+
+def benchmark_dataset(
+        dataset: tf.data.Dataset,
+        num_elements: Optional[int] = None,
+        num_epochs: int = 1,
+        is_batched: bool = False
+) -> Dict[str, float]:
+    """Iterate over *dataset* and measure how many elements per second it yields.
+
+    If *is_batched*, the elements in each batch are counted instead of the batches.
+    """
+    if num_elements is not None:
+        dataset = dataset.take(num_elements)
+
+    count = 0
+    with bl_utils.elapsed_timer() as timer:
+        for _ in range(num_epochs):
+            for elem in dataset:
+                if is_batched:
+                    count += int(tf.nest.flatten(elem)[0].shape[0])
+                else:
+                    count += 1
+
+    return {
+        'elements': count,
+        'seconds': timer.duration,
+        'throughput': count / timer.duration
+    }
+
+
+def measure_input_wait(
+        dataset: tf.data.Dataset,
+        num_batches: int,
+        step_time: float = 0.0
+) -> Dict[str, float]:
+    """Measure how long a training loop consuming *num_batches* batches of *dataset* waits for them.
+
+    Every *next* call on the iterator of *dataset* is timed, and *step_time* seconds are spent
+    between calls in place of a training step, so that prefetching can overlap with it. The
+    iterator is consumed directly, outside Keras, so that nothing is added to the input path.
+    """
+    if num_batches < 1:
+        raise ValueError(f'*num_batches* must be a positive integer. Got {num_batches}')
+
+    iterator = iter(dataset)
+    input_wait = 0.0
+    count = 0
+    with bl_utils.elapsed_timer() as timer:
+        for _ in range(num_batches):
+            start = time.perf_counter()
+            try:
+                next(iterator)
+            except StopIteration:
+                break
+            input_wait += time.perf_counter() - start
+            count += 1
+            if step_time > 0:
+                time.sleep(step_time)
+
+    return {
+        'batches': count,
+        'input_wait': input_wait,
+        'seconds': timer.duration,
+        'input_wait_fraction': input_wait / timer.duration if timer.duration else 0.0
+    }
+
+
+def echo_input_wait(
+        dataset: tf.data.Dataset,
+        echo: int,
+        batch_size: int,
+        num_batches: int,
+        step_time: float = 0.0,
+        shuffle_size: Optional[int] = None
+) -> Dict[str, Any]:
+    """Measure the input wait of training on *dataset* without and with data echoing.
+
+    Both pipelines batch, and optionally shuffle, the elements of *dataset* the same way, but one
+    of them echoes each element *echo* times first (see *echo_dataset*). The same number of
+    batches is consumed from both (see *measure_input_wait*), and *input_wait_saved* is how many
+    seconds of waiting echoing saved.
+    """
+    def _pipeline(echo_factor: int) -> tf.data.Dataset:
+        ds = echo_dataset(dataset, echo_factor)
+        if shuffle_size is not None:
+            ds = ds.shuffle(shuffle_size)
+        return ds.batch(batch_size).prefetch(AUTOTUNE)
+
+    echo_off = measure_input_wait(_pipeline(1), num_batches, step_time=step_time)
+    echo_on = measure_input_wait(_pipeline(echo), num_batches, step_time=step_time)
+    return {
+        'echo_off': echo_off,
+        'echo_on': echo_on,
+        'input_wait_saved': echo_off['input_wait'] - echo_on['input_wait']
+    }
+
+
+class PreprocessingCache:
+    """Content-addressed store of preprocessed datasets.
+
+    A stored dataset is identified by the fingerprint of its source description together with the
+    ordered descriptions of the transformers applied to it. When providing a pipeline, the longest
+    cached prefix is loaded, the remaining transformers are applied and the intermediate results
+    at the *cut points* of the pipeline are stored as well, so that other pipelines sharing a prefix
+    reuse it. If *max_bytes* is given, the least recently used datasets, intermediate or not, are
+    evicted to keep the cache within budget. The cache may be shared by several processes: its
+    index is locked while it is modified.
+    """
+
+    def __init__(
+            self,
+            path: PathType,
+            max_bytes: Optional[int] = None
+    ):
+        self.path = bl_utils.ensure_dir(path)
+        self.max_bytes = max_bytes
+        self._index_path = self.path / 'index.json'
+        self._lock_path = self.path / 'index.lock'
+        self._entries_path = bl_utils.ensure_dir(self.path / 'entries')
+
+    def fingerprints(
+            self,
+            source_description: Mapping[str, Any],
+            transformers: Iterable[Transformer]
+    ) -> List[str]:
+        '''Return the fingerprints of every prefix of the pipeline, from the bare source to the full pipeline.
+        '''
+        descriptions = [transformer.describe() for transformer in transformers]
+        return [
+            bl_utils.json_fingerprint(
+                {
+                    'source': source_description,
+                    'transformers': descriptions[:n_transformers]
+                },
+                encoder=GenericJSONEncoder
+            )
+            for n_transformers in range(len(descriptions) + 1)
+        ]
+
+    @staticmethod
+    def default_cut_points(transformers: Sequence[Transformer]) -> List[int]:
+        '''Numbers of leading *transformers* after which the result is worth storing.
+
+        Those are the transformers that are not graph-safe, which run in Python and are the most
+        expensive to apply again, and the last one.
+        '''
+        cut_points = [
+            n_transformers
+            for n_transformers, transformer in enumerate(transformers, start=1)
+            if not transformer.graph_safe
+        ]
+        if transformers and cut_points[-1:] != [len(transformers)]:
+            cut_points.append(len(transformers))
+        return cut_points
+
+    def _load_index(self) -> Dict[str, dict]:
+        if self._index_path.is_file():
+            return bl_io.load_json(self._index_path)
+        else:
+            return {}
+
+    def _save_index(self, index: Mapping[str, dict]) -> None:
+        # readers never see a partially written index: the new one is written aside and renamed
+        temp_path = self._index_path.with_name(
+            f'{self._index_path.stem}.{os.getpid()}.{threading.get_ident()}.tmp.json'
+        )
+        try:
+            bl_io.save_json(index, temp_path)
+            os.replace(temp_path, self._index_path)
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+
+    @contextmanager
+    def _locked_index(self) -> Iterator[Dict[str, dict]]:
+        '''Hold the index so that no other process modifies it while in context, then save it.'''
+        with file_lock(self._lock_path):
+            index = self._load_index()
+            yield index
+            self._save_index(index)
+
+    def entry_path(self, fingerprint: str) -> Path:
+        return self._entries_path / fingerprint
+
+    def __contains__(self, fingerprint: str) -> bool:
+        return fingerprint in self._load_index()
+
+    def size(self) -> int:
+        return sum(entry['bytes'] for entry in self._load_index().values())
+
+    def provide(
+            self,
+            source_description: Mapping[str, Any],
+            source: tf.data.Dataset,
+            transformers: Sequence[Transformer],
+            batch_size: Optional[int] = None,
+            cut_points: Optional[Iterable[int]] = None
+    ) -> tf.data.Dataset:
+        '''Dataset resulting from applying *transformers* to *source*, reusing the longest cached prefix.
+
+        The result after the first *n* transformers is stored for each *n* in *cut_points*, by default
+        *default_cut_points*. The full pipeline is always stored.
+        '''
+        transformers = tuple(transformers)
+        fingerprints = self.fingerprints(source_description, transformers)
+
+        if cut_points is None:
+            cut_points = self.default_cut_points(transformers)
+        cut_points = sorted(set(cut_points) | {len(transformers)})
+        if cut_points[0] < 0 or cut_points[-1] > len(transformers):
+            raise ValueError(f'cut points must be between 0 and {len(transformers)}. Got {cut_points}.')
+
+        with self._locked_index() as index:
+            n_cached = mit.last(
+                (n for n, fingerprint in enumerate(fingerprints) if fingerprint in index),
+                None
+            )
+            if n_cached is not None:
+                index[fingerprints[n_cached]]['last_access'] = time.time()
+
+        if n_cached is None:
+            ds = source
+            n_applied = 0
+        else:
+            ds = bl_io.load_dataset(self.entry_path(fingerprints[n_cached]))
+            n_applied = n_cached
+
+        for n_transformers in cut_points:
+            if n_cached is not None and n_transformers <= n_cached:
+                continue
+
+            ds = apply_transformers(ds, transformers[n_applied:n_transformers], batch_size=batch_size)
+            ds = self._store(ds, fingerprints[n_transformers], n_transformers)
+            n_applied = n_transformers
+
+        return ds
+
+    def _store(self, ds: tf.data.Dataset, fingerprint: str, n_transformers: int) -> tf.data.Dataset:
+        path = self.entry_path(fingerprint)
+        # other processes may be storing the same dataset: each one writes its own copy aside
+        temp_path = path.with_name(f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        bl_io.save_dataset(ds, temp_path)
+        n_bytes = bl_utils.disk_usage(temp_path)
+
+        with self._locked_index() as index:
+            if fingerprint in index and path.is_dir():
+                bl_utils.rmdir(temp_path, recursive=True, missing_ok=True)
+            else:
+                bl_utils.rmdir(path, recursive=True, missing_ok=True)
+                os.replace(temp_path, path)
+
+            now = time.time()
+            index[fingerprint] = {
+                'bytes': n_bytes,
+                'created': index.get(fingerprint, {}).get('created', now),
+                'last_access': now,
+                'n_transformers': n_transformers
+            }
+            self._evict(index, keep=fingerprint)
+
+        return bl_io.load_dataset(path)
+
+    def _evict(self, index: Dict[str, dict], keep: str) -> None:
+        if self.max_bytes is None:
+            return
+
+        total = sum(entry['bytes'] for entry in index.values())
+        lru_first = sorted(
+            (fingerprint for fingerprint in index if fingerprint != keep),
+            key=lambda fingerprint: index[fingerprint]['last_access']
+        )
+        for fingerprint in lru_first:
+            if total <= self.max_bytes:
+                break
+            total -= index.pop(fingerprint)['bytes']
+            bl_utils.rmdir(self.entry_path(fingerprint), recursive=True, missing_ok=True)
+
+    def clear(self) -> None:
+        with self._locked_index() as index:
+            for fingerprint in index:
+                bl_utils.rmdir(self.entry_path(fingerprint), recursive=True, missing_ok=True)
+            index.clear()
+
+
 def tf_train_val_test_split(
         ds: tf.data.Dataset,
         splits: DatasetSplitter,
@@ -266,6 +782,319 @@ def tf_train_val_test_split_concat(
     return ds_train, ds_val, ds_test
 
 
+@dataclass(frozen=True)
+class StratifiedSampler:
+    """Select a stratified subset of frames, binned by the values of a target column.
+
+    *bins* is either a number of equal-width bins or a sequence of bin edges, and values
+    outside the edges fall in the first or last bins. If *size* is None, every frame is
+    selected unless *balanced*, in which case every bin is reduced to the size of the
+    smallest non-empty bin. Otherwise, *size* frames are selected, either proportionally to
+    the bin counts or, if *balanced*, as evenly among bins as possible. Selection is
+    deterministic given *seed*. Frames whose target is NaN are never selected, and the report
+    counts them apart.
+    """
+    column: str
+    bins: Union[int, Tuple[float, ...]] = 10
+    size: Optional[int] = None
+    balanced: bool = False
+    seed: int = 0
+
+    def bin_edges(self, values: Sequence[float]) -> np.ndarray:
+        if isinstance(self.bins, int):
+            values = np.asarray(values, dtype=float)
+            return np.histogram_bin_edges(values[~np.isnan(values)], bins=self.bins)
+        else:
+            return np.asarray(self.bins, dtype=float)
+
+    def assign_bins(self, values: Sequence[float]) -> np.ndarray:
+        edges = self.bin_edges(values)
+        return np.digitize(values, edges[1:-1])
+
+    def _quotas(self, counts: np.ndarray) -> np.ndarray:
+        nonempty = counts > 0
+        if self.size is None:
+            if self.balanced:
+                return np.where(nonempty, counts[nonempty].min(), 0) if nonempty.any() else counts
+            return counts
+
+        size = min(self.size, int(counts.sum()))
+        if self.balanced:
+            quotas = np.zeros_like(counts)
+            remaining = size
+            # water-filling: bins smaller than their fair share give the rest to the others
+            while remaining > 0:
+                open_bins = np.flatnonzero(quotas < counts)
+                share = max(remaining // len(open_bins), 1)
+                for bin_index in open_bins:
+                    extra = min(share, counts[bin_index] - quotas[bin_index], remaining)
+                    quotas[bin_index] += extra
+                    remaining -= extra
+                    if remaining == 0:
+                        break
+            return quotas
+        else:
+            # largest remainder apportionment
+            exact = counts * size / counts.sum()
+            quotas = np.floor(exact).astype(int)
+            leftover = size - quotas.sum()
+            for bin_index in np.argsort(quotas - exact)[:leftover]:
+                quotas[bin_index] += 1
+            return quotas
+
+    def select(self, values: Sequence[float]) -> np.ndarray:
+        '''Sorted positions of the selected values.'''
+        values = np.asarray(values, dtype=float)
+        # NaN targets cannot be binned
+        valid_positions = np.flatnonzero(~np.isnan(values))
+        values = values[valid_positions]
+        if values.size == 0:
+            return np.array([], dtype=int)
+
+        bin_indices = self.assign_bins(values)
+        n_bins = len(self.bin_edges(values)) - 1
+        counts = np.bincount(bin_indices, minlength=n_bins)
+        quotas = self._quotas(counts)
+
+        rng = np.random.default_rng(self.seed)
+        selected = [
+            rng.choice(np.flatnonzero(bin_indices == bin_index), size=quota, replace=False)
+            for bin_index, quota in enumerate(quotas)
+            if quota > 0
+        ]
+        if not selected:
+            return np.array([], dtype=int)
+        return valid_positions[np.sort(np.concatenate(selected))]
+
+    def report(self, values: Sequence[float], positions: Sequence[int]) -> Dict[str, Dict[str, int]]:
+        '''Available and selected counts for each bin, and the number of dropped NaN targets.'''
+        values = np.asarray(values, dtype=float)
+        valid = ~np.isnan(values)
+        edges = self.bin_edges(values)
+        n_bins = len(edges) - 1
+        bin_indices = self.assign_bins(values[valid])
+        available = np.bincount(bin_indices, minlength=n_bins)
+
+        selected_mask = np.zeros(len(values), dtype=bool)
+        selected_mask[np.asarray(positions, dtype=int)] = True
+        selected = np.bincount(bin_indices[selected_mask[valid]], minlength=n_bins)
+
+        report = {
+            f'[{edges[bin_index]:g}, {edges[bin_index + 1]:g}]': {
+                'available': int(available[bin_index]),
+                'selected': int(selected[bin_index])
+            }
+            for bin_index in range(n_bins)
+        }
+        report['dropped (NaN)'] = {
+            'available': int((~valid).sum()),
+            'selected': 0
+        }
+        return report
+
+    def sample_frames(
+            self,
+            image_dataset: bl_preprocessing.ImageDataset,
+            query: Optional[bl_preprocessing.ExperimentVideo.Query] = None
+    ) -> Tuple[Dict[str, List[int]], Dict[str, Dict[str, int]]]:
+        '''Select frames across all videos in *image_dataset*, before decoding any of them.
+
+        Return the selected frame indices of each video and the per-bin report.
+        '''
+        frames = []
+        values = []
+        for name, ev in image_dataset.items():
+            df = ev.make_dataframe(recalculate=False)
+            df = df.set_index(ev.column_names.index, drop=False)
+            if query is None:
+                indices = sorted(df.index)
+            else:
+                indices = ev.query_indices(query)
+            frames.extend((name, index) for index in indices)
+            values.extend(df.loc[indices, self.column].tolist())
+
+        positions = self.select(values)
+        selected = collections.defaultdict(list)
+        for position in positions:
+            name, index = frames[position]
+            selected[name].append(index)
+
+        return dict(selected), self.report(values, positions)
+
+    def describe(self) -> Dict[str, Any]:
+        return dataclasses.asdict(self)
+
+
+def experiment_video_train_val_test_split(
+        experiment_video: bl_preprocessing.ExperimentVideo,
+        splits: DatasetSplitter,
+        method: Union[str, SplitMethod] = SplitMethod.INTERLEAVE,
+        query: Optional[bl_preprocessing.ExperimentVideo.Query] = None,
+        indices: Optional[Iterable[int]] = None,
+        shuffle: bool = False,
+        seed: Optional[int] = None
+) -> DatasetTriplet:
+    """Split an *ExperimentVideo* into train, val and test datasets before decoding any frame.
+
+    Contrary to *tf_train_val_test_split*, which iterates the full dataset once per split, the split
+    indices are computed from the video dataframe, so each split decodes only its own frames. If
+    *indices* is given, only those frames are split, and if *query* is given, only the matching
+    frames are. If *shuffle*, the extracted frame files of each split are reshuffled in every
+    iteration, before decoding (see *ExperimentVideo.as_tf_dataset*).
+    """
+    if indices is None:
+        df = experiment_video.make_dataframe(recalculate=False)
+        indices = df[experiment_video.column_names.index].tolist()
+    if query is not None:
+        matching = frozenset(experiment_video.query_indices(query))
+        indices = [index for index in indices if index in matching]
+    indices = sorted(indices)
+
+    train_indices, val_indices, test_indices = index_train_val_test_split(
+        indices,
+        splits,
+        method=method,
+        key=experiment_video.name
+    )
+
+    ds_train = experiment_video.as_tf_dataset(indices=train_indices, shuffle=shuffle, seed=seed)
+    if val_indices is None:
+        ds_val = None
+    else:
+        ds_val = experiment_video.as_tf_dataset(indices=val_indices, shuffle=shuffle, seed=seed)
+    ds_test = experiment_video.as_tf_dataset(indices=test_indices, shuffle=shuffle, seed=seed)
+
+    return ds_train, ds_val, ds_test
+
+
+def dataset_fingerprint(ds: tf.data.Dataset) -> str:
+    """Fingerprint of the element spec and of the contents of the finite dataset *ds*.
+
+    The fingerprint does not depend on the order of the elements, so it identifies datasets read
+    in a non-deterministic order, e.g. from parallel shards. Computing it takes one pass over *ds*.
+    """
+    element_digests = sorted(
+        hashlib.sha256(b''.join(
+            np.ascontiguousarray(value).tobytes()
+            for value in tf.nest.flatten(element)
+        )).hexdigest()
+        for element in ds.as_numpy_iterator()
+    )
+
+    hasher = hashlib.sha256(str(ds.element_spec).encode())
+    for element_digest in element_digests:
+        hasher.update(element_digest.encode())
+    return hasher.hexdigest()
+
+
+def _seeded_augmentation(
+        ds: tf.data.Dataset,
+        data_augmentors: Sequence[Transformer],
+        seed: int
+) -> tf.data.Dataset:
+    def map_fn(index, element):
+        # every element gets its own seeds, derived from *seed* and its position alone, so
+        # that the results depend neither on the global seed nor on the order of execution
+        seeds = tf.random.experimental.stateless_split(
+            tf.stack([tf.constant(seed, tf.int64), index]),
+            num=len(data_augmentors)
+        )
+        for data_augmentor, augmentor_seed in zip(data_augmentors, tf.unstack(seeds)):
+            if data_augmentor.seedable:
+                element = data_augmentor(element, stateless_seed=augmentor_seed)
+            else:
+                element = data_augmentor(element)
+        return element
+
+    return ds.enumerate().map(map_fn, num_parallel_calls=AUTOTUNE)
+
+
+def materialize_augmentations(
+        ds: tf.data.Dataset,
+        data_augmentors: Sequence[Transformer],
+        num_variants: int,
+        path: PathType,
+        source_description: Any = None,
+        seed: int = 0,
+        dtype_policy: Optional[DTypePolicy] = None,
+        max_workers: Optional[int] = None
+) -> tf.data.Dataset:
+    """Precompute *num_variants* augmented copies of *ds* and sample one of them per epoch.
+
+    Variants are stored under *path*, in a directory keyed by *source_description*, the
+    augmentor descriptions, *num_variants* and *seed*, so that changing any of these creates
+    new variants. *source_description* must identify the contents of *ds*, e.g. the id of the
+    *Manager* entry it comes from; if it is None, the contents are fingerprinted with
+    *dataset_fingerprint*. Augmentors must be graph-safe, and seedable ones (see *Transformer*)
+    are given stateless seeds derived from *seed*, the variant and the element, so variants do
+    not depend on the global seed. Variants are written concurrently. The returned dataset
+    picks a random variant in every iteration, trading disk space for the CPU time of online
+    augmentation.
+    """
+    if num_variants < 1:
+        raise ValueError(f'*num_variants* must be a positive integer. Got {num_variants}')
+    python_augmentors = [data_augmentor.name for data_augmentor in data_augmentors if not data_augmentor.graph_safe]
+    if python_augmentors:
+        raise ValueError(
+            f'materialized augmentations cannot seed augmentors that are not graph-safe: {python_augmentors}'
+        )
+
+    if source_description is None:
+        source_description = {'fingerprint': dataset_fingerprint(ds)}
+
+    key = bl_utils.json_fingerprint(
+        {
+            'source': source_description,
+            'augmentors': [data_augmentor.describe() for data_augmentor in data_augmentors],
+            'num_variants': num_variants,
+            'seed': seed
+        },
+        encoder=GenericJSONEncoder
+    )
+    variants_path = bl_utils.ensure_dir(path) / key
+    variant_paths = [variants_path / f'variant_{k}' for k in range(num_variants)]
+
+    missing = [
+        k
+        for k, variant_path in enumerate(variant_paths)
+        if bl_io.load_dataset_metadata(variant_path) is None
+    ]
+    if missing:
+        variant_seeds = tf.random.Generator.from_seed(seed).uniform_full_int(
+            (num_variants,),
+            dtype=tf.int64
+        ).numpy().tolist()
+
+        pipelines = []
+        for k in missing:
+            variant = ds
+            if dtype_policy is not None:
+                variant = map_images(variant, dtype_policy.to_compute)
+            variant = _seeded_augmentation(variant, data_augmentors, variant_seeds[k])
+            if dtype_policy is not None:
+                variant = map_images(variant, dtype_policy.to_storage)
+            pipelines.append(variant)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(
+                bl_io.save_dataset,
+                pipelines,
+                [variant_paths[k] for k in missing]
+            ))
+
+    variants = [bl_io.load_dataset(variant_path) for variant_path in variant_paths]
+    count = int(tf.data.experimental.cardinality(variants[0]))
+
+    choice = tf.data.Dataset.range(num_variants).shuffle(num_variants, seed=seed, reshuffle_each_iteration=True)
+    ds = choice.take(1).flat_map(
+        lambda k: tf.data.experimental.choose_from_datasets(
+            variants,
+            tf.data.Dataset.from_tensors(k).repeat(count)
+        )
+    )
+    return ds.apply(tf.data.experimental.assert_cardinality(count))
+
+
 @Creator.make('experiment_video_dataset_creator', expand_pack_on_call=True)
 def experiment_video_dataset_creator(
         experiment_video: bl_preprocessing.ExperimentVideo,
@@ -273,17 +1102,72 @@ def experiment_video_dataset_creator(
         data_preprocessors: Sequence[Transformer],
         dataset_size: Optional[int] = None,
         snapshot_path: Optional[PathType] = None,
-        num_shards: Optional[int] = None
+        num_shards: Optional[int] = None,
+        split_method: Union[str, SplitMethod] = SplitMethod.WINDOW,
+        preprocessing_batch_size: Optional[int] = None,
+        preprocessing_cache: Optional[PreprocessingCache] = None,
+        dtype_policy: Optional[DTypePolicy] = None,
+        query: Optional[bl_preprocessing.ExperimentVideo.Query] = None,
+        indices: Optional[Sequence[int]] = None,
+        shuffle: bool = False,
+        shuffle_seed: Optional[int] = None
 ):
-    ds = experiment_video.as_tf_dataset()
+    """Create the train, validation and test datasets of *experiment_video*.
+
+    If *shuffle*, the extracted frame files of each split are reshuffled in every iteration before
+    decoding, deterministically if *shuffle_seed* is given. Window splits are then computed on
+    the indices (see *index_train_val_test_split*), since shuffling a dataset before splitting
+    it by position would mix the splits.
+    """
+    split_method = SplitMethod(split_method)
 
-    for t in data_preprocessors:
-        ds = ds.map(
-            t.as_tf_py_function(pack_tuple=True),
-            num_parallel_calls=AUTOTUNE
+    if split_method is SplitMethod.WINDOW and not shuffle:
+        ds = experiment_video.as_tf_dataset(query=query, indices=indices)
+        ds_train, ds_val, ds_test = tf_train_val_test_split(ds, splits)
+    else:
+        ds_train, ds_val, ds_test = experiment_video_train_val_test_split(
+            experiment_video,
+            splits,
+            # interleaved index splits assign frames exactly as window splits do
+            method=SplitMethod.INTERLEAVE if split_method is SplitMethod.WINDOW else split_method,
+            query=query,
+            indices=indices,
+            shuffle=shuffle,
+            seed=shuffle_seed
         )
 
-    ds_train, ds_val, ds_test = tf_train_val_test_split(ds, splits)
+    if preprocessing_cache is None:
+        def _preprocess(ds: tf.data.Dataset, split: str) -> tf.data.Dataset:
+            return apply_transformers(ds, data_preprocessors, batch_size=preprocessing_batch_size)
+    else:
+        source_description = {
+            'experiment_video': experiment_video.describe(),
+            'splits': funcy.walk_values(str, dataclasses.asdict(splits)),
+            'split_method': split_method.value
+        }
+        if query is not None:
+            source_description['query'] = query.describe()
+        if indices is not None:
+            source_description['indices'] = bl_utils.json_fingerprint(list(indices))
+
+        def _preprocess(ds: tf.data.Dataset, split: str) -> tf.data.Dataset:
+            return preprocessing_cache.provide(
+                {**source_description, 'split': split},
+                ds,
+                data_preprocessors,
+                batch_size=preprocessing_batch_size
+            )
+
+    ds_train = _preprocess(ds_train, 'train')
+    if ds_val is not None:
+        ds_val = _preprocess(ds_val, 'val')
+    ds_test = _preprocess(ds_test, 'test')
+
+    if dtype_policy is not None:
+        ds_train = map_images(ds_train, dtype_policy.to_storage)
+        if ds_val is not None:
+            ds_val = map_images(ds_val, dtype_policy.to_storage)
+        ds_test = map_images(ds_test, dtype_policy.to_storage)
 
     if dataset_size is not None:
         ds_train = ds_train.take(dataset_size)
@@ -323,6 +1207,39 @@ def experiment_video_dataset_creator(
     return (ds_train, ds_val, ds_test)
 
 
+@dataclass(frozen=True)
+class VideoDatasetTiming:
+    name: str
+    elem_id: str
+    start: float
+    duration: float
+    thread: str
+
+
+@dataclass(frozen=True)
+class DatasetCreationReport:
+    timings: Tuple[VideoDatasetTiming, ...]
+    num_workers: int
+    duration: float
+
+    @property
+    def total_video_duration(self) -> float:
+        return sum(timing.duration for timing in self.timings)
+
+    @property
+    def speedup(self) -> float:
+        return self.total_video_duration / self.duration if self.duration else 1.0
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            'num_workers': self.num_workers,
+            'duration': self.duration,
+            'total_video_duration': self.total_video_duration,
+            'speedup': self.speedup,
+            'videos': [dataclasses.asdict(timing) for timing in self.timings]
+        }
+
+
 @Creator.make('dataset_creator', expand_pack_on_call=True)
 def dataset_creator(
         experiment_video_dataset_manager: Manager,
@@ -332,31 +1249,120 @@ def dataset_creator(
         dataset_size: Optional[int] = None,
         snapshot_path: Optional[PathType] = None,
         num_shards: Optional[int] = None,
+        split_method: Union[str, SplitMethod] = SplitMethod.WINDOW,
+        preprocessing_batch_size: Optional[int] = None,
+        preprocessing_cache: Optional[PreprocessingCache] = None,
+        interleave: Optional[Union[str, InterleaveWeights]] = None,
+        interleave_category: Optional[str] = None,
+        interleave_seed: Optional[int] = None,
+        shuffle: bool = False,
+        shuffle_seed: Optional[int] = None,
+        dtype_policy: Optional[DTypePolicy] = None,
+        query: Optional[bl_preprocessing.ExperimentVideo.Query] = None,
+        sampler: Optional[StratifiedSampler] = None,
+        num_workers: Optional[int] = None,
+        storage_num_shards: Optional[int] = None,
+        storage_compression: Optional[str] = None,
+        num_parallel_reads: Optional[int] = None,
         verbose: int = 0,
         save: bool = True,
         load: bool = True,
-        reload_after_save: bool = False
+        reload_after_save: bool = False,
+        return_report: bool = False
 ):
+    """Create the train, validation and test datasets for all videos in *image_dataset*.
+
+    Each experiment video dataset is provided by *experiment_video_dataset_manager*. If
+    *interleave* is None, the resulting datasets are concatenated video by video. Otherwise,
+    they are interleaved with weights given by *interleave* (see *InterleaveWeights*),
+    optionally equalized among the values of the video category *interleave_category*. These
+    only affect how the per-video datasets are combined, so they are left out of the per-video
+    entries, which are shared by every combination, and are described by the parameters of the
+    *dataset_creator* call alone.
+
+    If *query* is given, only its matching frames of its matching videos are used. If *sampler* is
+    given, a stratified subset of those frames is selected across all videos before decoding. If
+    *shuffle*, frame indices are shuffled before decoding (see *experiment_video_dataset_creator*).
+    Entries saved by the manager keep a single order, so load them with *loader_dataset* with
+    *shuffle* to reshuffle them in every iteration.
+
+    If *storage_num_shards* or *storage_compression* are given, the per-video datasets are saved
+    with that layout (see *save_dataset*) instead of with the manager's saver, and if
+    *num_parallel_reads* is given, they are loaded reading that many shards in parallel.
+
+    With *num_workers* > 1, up to that many videos (and at most the number of CPUs) are created and
+    snapshotted concurrently, in threads. Entries are allocated in video order beforehand, so ids
+    and the order in which videos are combined do not depend on *num_workers*. If
+    *return_report*, a *DatasetCreationReport* with per-video timings is returned along with the
+    datasets.
+    """
     experiment_video_dataset_params = bl_utils.Parameters(params=collections.defaultdict(dict))
     experiment_video_dataset_params[['creator', {'desc', 'value'}, 'dataset_size']] = dataset_size
     experiment_video_dataset_params[['creator', {'desc', 'value'}, 'num_shards']] = num_shards
     experiment_video_dataset_params[['creator', 'desc', 'splits']] = dataclasses.asdict(splits)
     experiment_video_dataset_params[['creator', 'value', 'splits']] = splits
+    experiment_video_dataset_params[['creator', 'desc', 'split_method']] = SplitMethod(split_method).value
+    experiment_video_dataset_params[['creator', 'value', 'split_method']] = SplitMethod(split_method)
+    experiment_video_dataset_params[['creator', 'value', 'preprocessing_batch_size']] = preprocessing_batch_size
+    experiment_video_dataset_params[['creator', 'value', 'preprocessing_cache']] = preprocessing_cache
+    if dtype_policy is not None:
+        experiment_video_dataset_params[['creator', 'desc', 'dtype_policy']] = dtype_policy.describe()
+    experiment_video_dataset_params[['creator', 'value', 'dtype_policy']] = dtype_policy
+    if query is not None:
+        experiment_video_dataset_params[['creator', 'desc', 'query']] = query.describe()
+        image_dataset = image_dataset.query(query)
+    experiment_video_dataset_params[['creator', 'value', 'query']] = query
+    if storage_num_shards is not None or storage_compression is not None:
+        experiment_video_dataset_params[['creator', 'desc', 'storage']] = {
+            'num_shards': storage_num_shards,
+            'compression': storage_compression
+        }
+        if save is True:
+            save = bl_io.saver_dataset_triplet(bl_io.saver_dataset(storage_num_shards, storage_compression))
+    if num_parallel_reads is not None and load is True:
+        load = bl_io.loader_dataset_triplet(bl_io.loader_dataset(num_parallel_reads=num_parallel_reads))
+    if shuffle:
+        experiment_video_dataset_params[['creator', 'desc', 'shuffle']] = {'seed': shuffle_seed}
+    experiment_video_dataset_params[['creator', 'value', 'shuffle']] = shuffle
+    experiment_video_dataset_params[['creator', 'value', 'shuffle_seed']] = shuffle_seed
+    if sampler is not None:
+        sampled_indices, sampling_report = sampler.sample_frames(image_dataset, query=query)
+        if verbose:
+            print('--- sampling report ---')
+            pprint.pprint(sampling_report)
+        sampled_dataset = bl_preprocessing.ImageDataset(
+            image_dataset.name,
+            image_dataset.column_names,
+            image_dataset.column_types
+        )
+        sampled_dataset.add(*(image_dataset[name] for name in sampled_indices))
+        image_dataset = sampled_dataset
 
-    ds_dict = {}
+    # entries are allocated sequentially, in video order, so that ids are deterministic
+    video_requests = []
     for name, ev in image_dataset.items():
-        data_preprocessors = [
+        if sampler is not None:
+            indices = sampled_indices[name]
+            # the selection depends on every video, so its outcome must be part of the description
+            experiment_video_dataset_params[['creator', 'desc', 'sampler']] = {
+                **sampler.describe(),
+                'indices': bl_utils.json_fingerprint(indices)
+            }
+            experiment_video_dataset_params[['creator', 'value', 'indices']] = indices
+        video_preprocessors = [
             data_preprocessor[name]
             if isinstance(data_preprocessor, DictImageTransformer)
             else data_preprocessor
             for data_preprocessor in data_preprocessors
         ]
+        if verbose >= 2:
+            print(name, 'execution report:', execution_report(video_preprocessors))
         experiment_video_dataset_params[['creator', 'desc', 'experiment_video']] = ev.name
         experiment_video_dataset_params[['creator', 'value', 'experiment_video']] = ev
         experiment_video_dataset_params[['creator', 'desc', 'data_preprocessors']] = [
-            data_preprocessor.describe() for data_preprocessor in data_preprocessors
+            data_preprocessor.describe() for data_preprocessor in video_preprocessors
         ]
-        experiment_video_dataset_params[['creator', 'value', 'data_preprocessors']] = data_preprocessors
+        experiment_video_dataset_params[['creator', 'value', 'data_preprocessors']] = video_preprocessors
         dataset_id = experiment_video_dataset_manager.provide_entry(
             creator_description=Pack(kwargs=experiment_video_dataset_params[['creator', 'desc']]),
             post_processor_description=Pack(),
@@ -366,18 +1372,71 @@ def dataset_creator(
         workspace_path = experiment_video_dataset_manager.elem_workspace(dataset_id)
         experiment_video_dataset_params[['creator', 'value', 'snapshot_path']] = workspace_path / 'snapshot'
 
+        if experiment_video_dataset_manager.post_processor is not None:
+            # the post-processed element has an entry of its own
+            dataset_id = experiment_video_dataset_manager.provide_entry(
+                creator_description=Pack(kwargs=experiment_video_dataset_params[['creator', 'desc']]),
+                post_processor=experiment_video_dataset_manager.post_processor,
+                post_processor_description=Pack(),
+                include=True,
+                missing_ok=True
+            )
+
+        # packs copy the parameters, which are modified again for the next video
+        video_requests.append((
+            name,
+            dataset_id,
+            Pack(kwargs=experiment_video_dataset_params[['creator', 'value']])
+        ))
+
+    if num_workers is None:
+        num_workers = 1
+    num_workers = max(1, min(num_workers, os.cpu_count() or 1, len(video_requests) or 1))
+
+    def _provide(name: str, dataset_id: str, creator_params: Pack) -> Tuple[DatasetTriplet, VideoDatasetTiming]:
         with warnings.catch_warnings():
             warnings.filterwarnings('ignore', category=ResourceWarning)
 
-            with bl_utils.elapsed_timer() as timer:
-                ds_dict[name] = experiment_video_dataset_manager.provide_elem(
-                    creator_description=Pack(kwargs=experiment_video_dataset_params[['creator', 'desc']]),
-                    creator_params=Pack(kwargs=experiment_video_dataset_params[['creator', 'value']]),
-                    save=save,
-                    load=load,
-                    reload_after_save=reload_after_save
-                )
-            print(name, 'took', timer.duration)
+            start = time.perf_counter()
+            triplet = experiment_video_dataset_manager.provide_elem(
+                elem_id=dataset_id,
+                creator_params=creator_params,
+                save=save,
+                load=load,
+                reload_after_save=reload_after_save
+            )
+            duration = time.perf_counter() - start
+
+        timing = VideoDatasetTiming(
+            name=name,
+            elem_id=dataset_id,
+            start=start,
+            duration=duration,
+            thread=threading.current_thread().name
+        )
+        return triplet, timing
+
+    with bl_utils.elapsed_timer() as timer:
+        if num_workers == 1:
+            results = [_provide(*request) for request in video_requests]
+        else:
+            with ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix='dataset_creator') as executor:
+                # *map* returns results in submission order, whatever order they finish in
+                results = list(executor.map(lambda request: _provide(*request), video_requests))
+
+    ds_dict = {
+        name: triplet
+        for (name, _, _), (triplet, _) in zip(video_requests, results)
+    }
+    report = DatasetCreationReport(
+        timings=tuple(timing for _, timing in results),
+        num_workers=num_workers,
+        duration=timer.duration
+    )
+
+    if verbose:
+        print('--- creation report ---')
+        pprint.pprint(report.describe())
 
     if verbose:
         print('--- ds_dict ---')
@@ -385,12 +1444,39 @@ def dataset_creator(
 
     datasets_train, datasets_val, datasets_test = map(tuple, mit.unzip(ds_dict.values()))
 
-    ds_train = tf_concatenate(datasets_train)
+    if interleave is None:
+        combine = tf_concatenate
+    else:
+        if interleave_category is None:
+            categories = None
+        else:
+            categories = []
+            for name, ev in image_dataset.items():
+                if ev.data is None:
+                    raise ValueError(
+                        f'cannot interleave by category "{interleave_category}":'
+                        f' experiment video {name} has no data.'
+                    )
+                if interleave_category not in (ev.data.categories or {}):
+                    raise ValueError(
+                        f'cannot interleave by category "{interleave_category}":'
+                        f' experiment video {name} has no such category.'
+                    )
+                categories.append(ev.data.categories[interleave_category])
+
+        def combine(datasets: Sequence[tf.data.Dataset]) -> tf.data.Dataset:
+            return tf_interleave(
+                datasets,
+                weights=interleave_weights(datasets, interleave, categories=categories),
+                seed=interleave_seed
+            )
+
+    ds_train = combine(datasets_train)
     if None in datasets_val:
         ds_val = None
     else:
-        ds_val = tf_concatenate(datasets_val)
-    ds_test = tf_concatenate(datasets_test)
+        ds_val = combine(datasets_val)
+    ds_test = combine(datasets_test)
 
     if dataset_size is not None:
         ds_train = ds_train.take(dataset_size)
@@ -398,7 +1484,131 @@ def dataset_creator(
             ds_val = ds_val.take(dataset_size)
         ds_test = ds_test.take(dataset_size)
 
-    return (ds_train, ds_val, ds_test)
+    if return_report:
+        return (ds_train, ds_val, ds_test), report
+    else:
+        return (ds_train, ds_val, ds_test)
+
+
+def element_spec_bytes(
+        element_spec,
+        dtype: Optional[tf.DType] = None
+) -> int:
+    """Number of bytes of a single element described by *element_spec*.
+
+    If *dtype* is given, it overrides the dtype of the first component, which holds the
+    images in datasets of (image, data) pairs.
+    """
+    specs = tf.nest.flatten(element_spec)
+    if dtype is not None:
+        specs[0] = tf.TensorSpec(specs[0].shape, dtype)
+
+    n_bytes = 0
+    for spec in specs:
+        if not spec.shape.is_fully_defined():
+            raise ValueError(f'cannot compute the size of elements with unknown shape {spec}.')
+        n_bytes += spec.shape.num_elements() * spec.dtype.size
+    return n_bytes
+
+
+@dataclass(frozen=True)
+class BufferPlan:
+    element_bytes: int
+    batch_bytes: int
+    ram_budget: int
+    count: Optional[int]
+    shuffle_size: Optional[int]
+    cache: Union[bool, str]
+    prefetch: int
+
+    @property
+    def estimated_bytes(self) -> int:
+        cache_bytes = self.element_bytes * self.count if self.cache is True else 0
+        return (
+            (self.shuffle_size or 0) * self.element_bytes
+            + self.prefetch * self.batch_bytes
+            + cache_bytes
+        )
+
+    def describe(self) -> Dict[str, Any]:
+        return dataclasses.asdict(self)
+
+
+def plan_buffers(
+        element_spec,
+        ram_budget: int,
+        batch_size: Optional[int] = None,
+        count: Optional[int] = None,
+        dtype_policy: Optional[DTypePolicy] = None,
+        cache_path: Optional[PathType] = None,
+        max_shuffle_size: Optional[int] = None,
+        min_shuffle_size: int = 1,
+        max_prefetch: int = 4,
+        cache_fraction: float = 0.5
+) -> BufferPlan:
+    """Choose shuffle, cache and prefetch buffers that fit in *ram_budget* bytes.
+
+    Elements are counted in the storage dtype of *dtype_policy*, if given, and prefetched
+    batches in its compute dtype. The dataset is cached in memory if its *count* elements
+    take at most *cache_fraction* of the budget, on disk under *cache_path* otherwise, and
+    not at all if no *cache_path* is given. The rest of the budget goes to at most
+    *max_prefetch* batches and then to the shuffle buffer. A ValueError with a report is
+    raised if even *min_shuffle_size* elements and a single prefetched batch do not fit.
+
+    The budget is for the training split: *dataset_post_processor* does not cache the other
+    splits in memory nor shuffle them when given a plan, so *count* is that of the training split.
+    """
+    if dtype_policy is None:
+        element_bytes = element_spec_bytes(element_spec)
+        compute_element_bytes = element_bytes
+    else:
+        element_bytes = element_spec_bytes(element_spec, dtype_policy.storage_dtype)
+        compute_element_bytes = element_spec_bytes(element_spec, dtype_policy.compute_dtype)
+
+    batch_bytes = compute_element_bytes * (batch_size or 1)
+    available = ram_budget
+
+    if count is not None and count * element_bytes <= cache_fraction * available:
+        cache = True
+        available -= count * element_bytes
+    elif cache_path is not None:
+        cache = str(bl_utils.ensure_resolved(cache_path))
+    else:
+        cache = False
+
+    prefetch = min(max_prefetch, max(available - min_shuffle_size * element_bytes, 0) // batch_bytes)
+    available -= prefetch * batch_bytes
+
+    shuffle_size = available // element_bytes
+    if max_shuffle_size is not None:
+        shuffle_size = min(shuffle_size, max_shuffle_size)
+    if count is not None:
+        shuffle_size = min(shuffle_size, count)
+
+    if prefetch < 1 or shuffle_size < min_shuffle_size:
+        report = {
+            'ram_budget': ram_budget,
+            'element_bytes': element_bytes,
+            'batch_bytes': batch_bytes,
+            'count': count,
+            'cache': cache,
+            'required_bytes': (
+                (count * element_bytes if cache is True else 0)
+                + batch_bytes
+                + min_shuffle_size * element_bytes
+            )
+        }
+        raise ValueError(f'the buffers do not fit in the RAM budget: {report}')
+
+    return BufferPlan(
+        element_bytes=element_bytes,
+        batch_bytes=batch_bytes,
+        ram_budget=ram_budget,
+        count=count,
+        shuffle_size=shuffle_size,
+        cache=cache,
+        prefetch=prefetch
+    )
 
 
 @Transformer.make('dataset_post_processor')
@@ -407,16 +1617,60 @@ def dataset_post_processor(
         data_augmentors: Sequence[Transformer],
         cache: Union[bool, PathType] = False,
         batch_size: Optional[int] = None,
-        prefetch: bool = True,
+        prefetch: Union[bool, int] = True,
         shuffle_size: Optional[int] = None,
+        index_shuffle: bool = False,
         augment_test: bool = False,
         force_test_augmentors: Container[str] = frozenset(),
         take: Optional[int] = None,
+        dtype_policy: Optional[DTypePolicy] = None,
+        buffer_plan: Optional[BufferPlan] = None,
+        num_augmented_variants: Optional[int] = None,
+        augmentation_seed: int = 0,
+        augmentation_source_description: Any = None,
+        echo: int = 1,
+        echo_before_augmentation: bool = False,
         verbose: bool = False
 ):
+    """Cache, augment, shuffle and batch a dataset triplet.
+
+    If *dtype_policy* is given, images are kept in its storage dtype through caching and
+    shuffling, and are only converted to its compute dtype right before augmentation and
+    batching. If *buffer_plan* is given (see *plan_buffers*), it overrides *cache*,
+    *shuffle_size* and *prefetch*, and since it only budgets the training split, the
+    validation and test splits are neither shuffled nor cached in memory. If
+    *num_augmented_variants* is given, the training set is augmented offline (see
+    *materialize_augmentations*) and stored under the *cache* path, keyed by
+    *augmentation_source_description*, which must then identify the training set, e.g. by the id
+    of its *Manager* entry, so that its contents need not be fingerprinted on every call.
+    Training elements are repeated *echo* times before shuffling (see *echo_dataset*). If
+    *echo_before_augmentation* is True, each repetition is augmented separately; when
+    augmentation runs after shuffling, this is always the case.
+
+    If *index_shuffle* is True, the datasets are expected to be shuffled before decoding (see
+    *experiment_video_dataset_creator* and *loader_dataset*). The training set is then not cached,
+    since that would freeze its order, and decoded elements are only mixed in a buffer of
+    *shuffle_size*, if given, in the training set alone.
+    """
+    if buffer_plan is not None:
+        cache = buffer_plan.cache
+        shuffle_size = buffer_plan.shuffle_size
+        prefetch = buffer_plan.prefetch
+
+    materialized = num_augmented_variants is not None
+    if materialized and isinstance(cache, bool):
+        raise ValueError('materialized augmentations require *cache* to be a path.')
+    if materialized and index_shuffle:
+        raise ValueError('materialized augmentations would freeze the order of index-shuffled datasets.')
+    if materialized and augmentation_source_description is None:
+        raise ValueError('materialized augmentations require an *augmentation_source_description*.')
+
     if verbose:
         print('>>>> Datasets:', ds)
         print('>>>> Data augmentors:', data_augmentors)
+        print('>>>> Execution report:', execution_report(data_augmentors))
+        if buffer_plan is not None:
+            print('>>>> Buffer plan:', buffer_plan.describe(), 'estimated bytes:', buffer_plan.estimated_bytes)
 
     ds_train, ds_val, ds_test = ds
     if take is not None:
@@ -425,41 +1679,96 @@ def dataset_post_processor(
             ds_val = ds_val.take(take)
         ds_test = ds_test.take(take)
 
+    if dtype_policy is not None:
+        ds_train = map_images(ds_train, dtype_policy.to_storage)
+        if ds_val is not None:
+            ds_val = map_images(ds_val, dtype_policy.to_storage)
+        ds_test = map_images(ds_test, dtype_policy.to_storage)
+
+        if verbose:
+            image_shape = ds_train.element_spec[0].shape
+            count = int(tf.data.experimental.cardinality(ds_train))
+            if image_shape.is_fully_defined() and count >= 0:
+                print(
+                    '>>>> Memory report:',
+                    dtype_policy.memory_report(image_shape, count=count)
+                )
+
+    # buffer plans only budget the training split
+    buffer_eval_splits = buffer_plan is None
+
     if isinstance(cache, bool):
         if cache:
-            ds_train = ds_train.cache()
-            if ds_val is not None:
-                ds_val = ds_val.cache()
-            ds_test = ds_test.cache()
+            if not index_shuffle:
+                ds_train = ds_train.cache()
+            if buffer_eval_splits:
+                if ds_val is not None:
+                    ds_val = ds_val.cache()
+                ds_test = ds_test.cache()
     else:
         cache = bl_utils.ensure_dir(cache)
-        ds_train = ds_train.cache(str(cache / 'train'))
+        if materialized:
+            ds_train = materialize_augmentations(
+                ds_train,
+                data_augmentors,
+                num_augmented_variants,
+                cache / 'augmented',
+                source_description=augmentation_source_description,
+                seed=augmentation_seed,
+                dtype_policy=dtype_policy
+            )
+        elif not index_shuffle:
+            ds_train = ds_train.cache(str(cache / 'train'))
         if ds_val is not None:
             ds_val = ds_val.cache(str(cache / 'val'))
         ds_test = ds_test.cache(str(cache / 'test'))
 
-    for data_augmentor in data_augmentors:
-        ds_train = ds_train.map(
-            data_augmentor.as_tf_py_function(pack_tuple=True),
-            num_parallel_calls=AUTOTUNE
-        )
+    train_augmentors = [] if materialized else data_augmentors
+    test_augmentors = [
+        data_augmentor
+        for data_augmentor in data_augmentors
+        if augment_test or data_augmentor.name in force_test_augmentors
+    ]
+    # batchable augmentors run on whole batches after shuffling, which is equivalent in distribution
+    batched_augmentation = batch_size is not None and all(
+        data_augmentor.batchable
+        for data_augmentor in data_augmentors
+    )
 
-        if augment_test or data_augmentor.name in force_test_augmentors:
-            if ds_val is not None:
-                ds_val = ds_val.map(
-                    data_augmentor.as_tf_py_function(pack_tuple=True),
-                    num_parallel_calls=AUTOTUNE
-                )
-            ds_test = ds_train.map(
-                data_augmentor.as_tf_py_function(pack_tuple=True),
-                num_parallel_calls=AUTOTUNE
-            )
+    # augmentors expect compute dtypes, so they must wait for the conversion
+    early_augmentation = not batched_augmentation and dtype_policy is None
+    late_augmentation = not batched_augmentation and dtype_policy is not None
+
+    if echo_before_augmentation or not early_augmentation:
+        ds_train = echo_dataset(ds_train, echo)
+
+    if early_augmentation:
+        ds_train = apply_transformers(ds_train, train_augmentors)
+        if ds_val is not None:
+            ds_val = apply_transformers(ds_val, test_augmentors)
+        ds_test = apply_transformers(ds_test, test_augmentors)
+
+        if not echo_before_augmentation:
+            ds_train = echo_dataset(ds_train, echo)
 
     if shuffle_size is not None:
         ds_train = ds_train.shuffle(shuffle_size)
+        if buffer_eval_splits and not index_shuffle:
+            if ds_val is not None:
+                ds_val = ds_val.shuffle(shuffle_size)
+            ds_test = ds_test.shuffle(shuffle_size)
+
+    if dtype_policy is not None:
+        ds_train = map_images(ds_train, dtype_policy.to_compute)
+        if ds_val is not None:
+            ds_val = map_images(ds_val, dtype_policy.to_compute)
+        ds_test = map_images(ds_test, dtype_policy.to_compute)
+
+    if late_augmentation:
+        ds_train = apply_transformers(ds_train, train_augmentors)
         if ds_val is not None:
-            ds_val = ds_val.shuffle(shuffle_size)
-        ds_test = ds_test.shuffle(shuffle_size)
+            ds_val = apply_transformers(ds_val, test_augmentors)
+        ds_test = apply_transformers(ds_test, test_augmentors)
 
     if batch_size is not None:
         ds_train = ds_train.batch(batch_size)
@@ -467,11 +1776,18 @@ def dataset_post_processor(
             ds_val = ds_val.batch(batch_size)
         ds_test = ds_test.batch(batch_size)
 
+    if batched_augmentation:
+        ds_train = apply_transformers(ds_train, train_augmentors, batched=True)
+        if ds_val is not None:
+            ds_val = apply_transformers(ds_val, test_augmentors, batched=True)
+        ds_test = apply_transformers(ds_test, test_augmentors, batched=True)
+
     if prefetch:
-        ds_train = ds_train.prefetch(AUTOTUNE)
+        buffer_size = AUTOTUNE if prefetch is True else prefetch
+        ds_train = ds_train.prefetch(buffer_size)
         if ds_val is not None:
-            ds_val = ds_val.prefetch(AUTOTUNE)
-        ds_test = ds_test.prefetch(AUTOTUNE)
+            ds_val = ds_val.prefetch(buffer_size)
+        ds_test = ds_test.prefetch(buffer_size)
 
     return (ds_train, ds_val, ds_test)
 
@@ -491,6 +1807,15 @@ def calculate_batch_size(
         dim: int = 0,
         key: Optional[int] = None
 ) -> int:
+    element_spec = dataset.element_spec
+    if key is not None:
+        element_spec = element_spec[key]
+
+    # the static shape is known, e.g., for batches with dropped remainder
+    static_batch_size = element_spec.shape[dim]
+    if static_batch_size is not None:
+        return static_batch_size
+
     elem = mit.first(dataset)
     if key is not None:
         elem = elem[key]
@@ -500,9 +1825,26 @@ def calculate_batch_size(
 def calculate_dataset_size(
         dataset: tf.data.Dataset,
         dim: int = 0,
-        is_batched: bool = False
+        is_batched: bool = False,
+        path: Optional[PathType] = None
 ) -> int:
+    """Number of elements in *dataset* or, if *is_batched*, in all of its batches.
+
+    If *path* is given, *dataset* is taken to be the one saved there and its size is read from the
+    metadata recorded by *save_dataset* (see *save_dataset_metadata*), without iterating over it.
+    """
+    if path is not None:
+        metadata = bl_io.load_dataset_metadata(path) or {}
+        size = metadata.get('n_elements' if is_batched else 'count')
+        if size is not None:
+            return size
+
     if is_batched:
+        n_batches = int(tf.data.experimental.cardinality(dataset))
+        static_batch_size = dataset.element_spec.shape[dim]
+        if n_batches >= 0 and static_batch_size is not None:
+            return n_batches * static_batch_size
+
         batch_size_calculator = functools.partial(calculate_batch_size, dim=dim)
         return sum(
             map(
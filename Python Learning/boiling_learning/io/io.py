@@ -1,4 +1,5 @@
 import collections
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 from itertools import accumulate
 import io as _io
@@ -7,6 +8,7 @@ import operator
 import os
 from pathlib import Path
 import pickle
+import queue
 import string
 from typing import (
     Any,
@@ -30,6 +32,7 @@ import json_tricks
 import numpy as np
 import modin.pandas as pd
 import tensorflow as tf
+from tensorflow.data.experimental import AUTOTUNE
 from tensorflow.keras.models import load_model
 try:
     # yogadl is an optional dependency
@@ -281,16 +284,153 @@ def load_element_spec(path: PathType) -> tf.TensorSpec:
     return bl_utils.dtypes.decode_element_spec(encoded_element_spec)
 
 
-def save_dataset(dataset: tf.data.Dataset, path: PathType) -> None:
+_DATASET_METADATA = 'metadata.json'
+
+
+def save_dataset_metadata(
+        path: PathType,
+        count: int,
+        n_bytes: int,
+        batch_size: Optional[int] = None,
+        n_elements: Optional[int] = None,
+        **extra
+) -> None:
+    '''Record how many elements a saved dataset has and roughly how large it is.
+
+    This allows loaders to attach a known cardinality to the datasets they return,
+    so that their sizes can be queried without iterating over them. For batched datasets,
+    *count* is the number of batches, *batch_size* the size of each full batch and
+    *n_elements* the number of unbatched elements. If *n_elements* is not given, all
+    batches are assumed full.
+    '''
+    if n_elements is None and batch_size is not None:
+        n_elements = count * batch_size
+
+    metadata = {
+        'count': count,
+        'bytes': n_bytes,
+        'batch_size': batch_size,
+        'n_elements': n_elements,
+        **extra
+    }
+    save_json(metadata, ensure_dir(path) / _DATASET_METADATA)
+
+
+def load_dataset_metadata(path: PathType) -> Optional[Dict[str, Any]]:
+    metadata_path = ensure_resolved(path) / _DATASET_METADATA
+    if metadata_path.is_file():
+        return load_json(metadata_path)
+    else:
+        return None
+
+
+_SHARD_SHUFFLE_SIZE = 1024
+
+
+def with_saved_cardinality(dataset: tf.data.Dataset, path: PathType) -> tf.data.Dataset:
+    metadata = load_dataset_metadata(path)
+    if metadata is None or metadata.get('count') is None:
+        return dataset
+    else:
+        return dataset.apply(tf.data.experimental.assert_cardinality(metadata['count']))
+
+
+_DATASET_COMPRESSIONS = frozenset({'GZIP', 'SNAPPY'})
+
+
+def save_dataset(
+        dataset: tf.data.Dataset,
+        path: PathType,
+        num_shards: Optional[int] = None,
+        compression: Optional[str] = None,
+        batch_size: Optional[int] = None
+) -> None:
+    '''Save *dataset* to the directory *path*.
+
+    If *num_shards* is given, elements are distributed among that many shards by a hash of
+    their indices. Shards are written concurrently and can be read back in parallel.
+    *compression* may be None, 'GZIP' or 'SNAPPY'. The element count and the shard layout
+    are recorded in the metadata sidecar. If *dataset* is batched, pass its *batch_size* so
+    that the number of unbatched elements is recorded too (see *save_dataset_metadata*).
+    '''
+    if compression is not None and compression not in _DATASET_COMPRESSIONS:
+        raise ValueError(
+            f'*compression* must be None or one of {sorted(_DATASET_COMPRESSIONS)}.'
+            f' Got {compression}')
+    if num_shards is not None and num_shards < 1:
+        raise ValueError(f'*num_shards* must be a positive integer. Got {num_shards}')
+
     path = ensure_dir(path)
     dataset_path = path / 'dataset.tensorflow'
     element_spec_path = path / 'element_spec.json'
 
     save_element_spec(dataset.element_spec, element_spec_path)
-    tf.data.experimental.save(dataset, str(dataset_path))
 
+    count = int(tf.data.experimental.cardinality(dataset))
+
+    if num_shards is None:
+        saved = dataset
+        shard_func = None
+    else:
+        saved = dataset.enumerate()
 
-def load_dataset(path: PathType) -> tf.data.Dataset:
+        def shard_func(index, element):
+            return tf.strings.to_hash_bucket_fast(tf.strings.as_string(index), num_shards)
+
+    tf.data.experimental.save(
+        saved,
+        str(dataset_path),
+        compression=compression,
+        shard_func=shard_func
+    )
+
+    if count < 0:
+        # counting from disk is much cheaper than replaying the pipeline that produced the dataset
+        saved = tf.data.experimental.load(str(dataset_path), saved.element_spec, compression=compression)
+        count = int(saved.reduce(np.int64(0), lambda count, _: count + 1))
+
+    n_elements = None
+    if batch_size is not None:
+        static_batch_size = tf.nest.flatten(dataset.element_spec)[0].shape[0]
+        if static_batch_size != batch_size:
+            # the last batch may be partial, so the elements of every batch are counted from disk
+            batches = tf.data.experimental.load(str(dataset_path), saved.element_spec, compression=compression)
+            if num_shards is not None:
+                batches = batches.map(lambda index, batch: batch)
+
+            def add_batch_size(n_elements, batch):
+                return n_elements + tf.cast(tf.shape(tf.nest.flatten(batch)[0])[0], tf.int64)
+
+            n_elements = int(batches.reduce(np.int64(0), add_batch_size))
+
+    save_dataset_metadata(
+        path,
+        count=count,
+        n_bytes=bl_utils.disk_usage(dataset_path),
+        batch_size=batch_size,
+        n_elements=n_elements,
+        num_shards=num_shards,
+        compression=compression,
+        shards={
+            str(shard_path.relative_to(dataset_path)): shard_path.stat().st_size
+            for shard_path in sorted(dataset_path.rglob('*.shard'))
+        }
+    )
+
+
+def load_dataset(
+        path: PathType,
+        shuffle: bool = False,
+        seed: Optional[int] = None,
+        num_parallel_reads: int = AUTOTUNE
+) -> tf.data.Dataset:
+    '''Load a dataset saved with *save_dataset*.
+
+    If *shuffle* is True, the order in which the saved shards are read is shuffled in
+    every iteration. This is cheap, but elements inside each shard keep their order.
+    Datasets saved with *num_shards* are read with *num_parallel_reads* shards at a time,
+    so their elements do not come back in the order in which they were saved.
+    '''
     path = ensure_resolved(path)
     dataset_path = path / 'dataset.tensorflow'
     element_spec_path = path / 'element_spec.json'
@@ -307,7 +447,58 @@ def load_dataset(path: PathType) -> tf.data.Dataset:
 
     element_spec = recurse_fix(element_spec)
 
-    return tf.data.experimental.load(str(dataset_path), element_spec)
+    metadata = load_dataset_metadata(path) or {}
+    compression = metadata.get('compression')
+    sharded = metadata.get('num_shards') is not None
+    if sharded:
+        element_spec = (tf.TensorSpec(shape=(), dtype=tf.int64), element_spec)
+
+    if shuffle or sharded:
+        def reader_func(datasets: tf.data.Dataset) -> tf.data.Dataset:
+            if shuffle:
+                datasets = datasets.shuffle(_SHARD_SHUFFLE_SIZE, seed=seed, reshuffle_each_iteration=True)
+            return datasets.interleave(
+                lambda x: x,
+                num_parallel_calls=num_parallel_reads if sharded else AUTOTUNE
+            )
+    else:
+        reader_func = None
+
+    dataset = tf.data.experimental.load(
+        str(dataset_path),
+        element_spec,
+        compression=compression,
+        reader_func=reader_func
+    )
+    if sharded:
+        dataset = dataset.map(lambda index, element: element, num_parallel_calls=AUTOTUNE)
+    return with_saved_cardinality(dataset, path)
+
+
+def saver_dataset(
+        num_shards: Optional[int] = None,
+        compression: Optional[str] = None,
+        batch_size: Optional[int] = None
+) -> SaverFunction[tf.data.Dataset]:
+    '''Saver of datasets with the layout given by *num_shards* and *compression* (see *save_dataset*).'''
+    return partial(save_dataset, num_shards=num_shards, compression=compression, batch_size=batch_size)
+
+
+def loader_dataset(
+        shuffle: bool = False,
+        seed: Optional[int] = None,
+        num_parallel_reads: int = AUTOTUNE
+) -> BoolFlaggedLoaderFunction[tf.data.Dataset]:
+    '''Loader of datasets saved with *save_dataset*, for *Manager*s and *loader_dataset_triplet*.
+
+    If *shuffle*, the saved shards are read in a new order in every iteration (see *load_dataset*).
+    '''
+    return add_bool_flag(partial(
+        load_dataset,
+        shuffle=shuffle,
+        seed=seed,
+        num_parallel_reads=num_parallel_reads
+    ))
 
 
 def _default_filename_pattern(name: str, index: int) -> Path:
@@ -331,17 +522,22 @@ def save_frames_dataset(
 
         return imgs_path / filename_pattern(name, index)
 
-    def _make_series(path, data):
-        return pd.Series(data, name=path)
-
-    df = pd.DataFrame()
+    # rows are collected first: growing a DataFrame one row at a time takes quadratic time
+    rows = {}
     for img, data in dataset.as_numpy_iterator():
         img_path = _get_path(data)
-        df = df.append(_make_series(img_path, data))
+        rows[img_path] = data
         save_image(img, img_path)
 
+    df = pd.DataFrame.from_dict(rows, orient='index')
     df.to_csv(df_path, header=True, index=True)
 
+    save_dataset_metadata(
+        path,
+        count=len(rows),
+        n_bytes=bl_utils.disk_usage(imgs_path)
+    )
+
 
 def saver_frames_dataset(
         filename_pattern: Callable[[str, int], Path] = _default_filename_pattern,
@@ -374,11 +570,12 @@ def saver_frames_dataset(
     return _saver
 
 
-def decode_img(img, channels: int = 1):
+def decode_img(img, channels: int = 1, dtype: tf.DType = tf.float32):
     # convert the compressed string to a 3D uint8 tensor
     img = tf.image.decode_png(img, channels=channels)
     # Use `convert_image_dtype` to convert to floats in the [0,1] range
-    img = tf.image.convert_image_dtype(img, tf.float32)
+    # uint8 images are kept as they are, which saves memory until conversion is actually needed
+    img = tf.image.convert_image_dtype(img, dtype)
     # resize the image to the desired size
     # img = tf.image.resize(img, IMG_SHAPE[:2])
     # img = tf.reshape(img, IMG_SHAPE)
@@ -387,7 +584,8 @@ def decode_img(img, channels: int = 1):
 
 def process_path(
         file_path,
-        in_dir: Optional[PathType] = None
+        in_dir: Optional[PathType] = None,
+        dtype: tf.DType = tf.float32
 ):
     # from relative to absolute path
     if in_dir is not None:
@@ -396,33 +594,43 @@ def process_path(
     # load the raw data from the file as a string
     img = tf.io.read_file(file_path)
     # decode data
-    img = decode_img(img)
+    img = decode_img(img, dtype=dtype)
     return img
 
 
 def load_frames_dataset(
         path: PathType,
-        shuffle: bool = True
+        shuffle: bool = True,
+        seed: Optional[int] = None,
+        dtype: tf.DType = tf.float32
 ) -> tf.data.Dataset:
+    '''Load a dataset saved with *save_frames_dataset*, decoding images as *dtype*.
+
+    If *shuffle* is True, file paths and data rows are reshuffled in every iteration
+    before the images are decoded, so no large buffer of decoded images is needed.
+    '''
     path = bl_utils.ensure_resolved(path)
     df_path = path / 'dataframe.csv'
     # element_spec_path = path / 'elem_spec.json'
 
     df = pd.read_csv(df_path, index_col=0)
-    if shuffle:
-        df = df.sample(frac=1)
     files = [
         str(bl_utils.ensure_resolved(path))
         for path in df.index
     ]
     df = df.reset_index(drop=True)
 
-    ds_img = tf.data.Dataset.from_tensor_slices(files)
-    ds_img = ds_img.map(process_path)
+    ds_files = tf.data.Dataset.from_tensor_slices(files)
     ds_data = tf.data.Dataset.from_tensor_slices(df.to_dict('list'))
-    ds = tf.data.Dataset.zip((ds_img, ds_data))
+    ds = tf.data.Dataset.zip((ds_files, ds_data))
+    if shuffle:
+        ds = ds.shuffle(len(files), seed=seed, reshuffle_each_iteration=True)
+    ds = ds.map(
+        lambda file, data: (process_path(file, dtype=dtype), data),
+        num_parallel_calls=AUTOTUNE
+    )
 
-    return ds
+    return with_saved_cardinality(ds, path)
 
 
 def loader_frames_dataset(
@@ -436,6 +644,218 @@ def loader_frames_dataset(
         return False, None
 
 
+_SHARDED_FRAMES_MANIFEST = 'manifest.json'
+_SHARDED_FRAMES_IMAGE_KEY = '__image__'
+_SHARDED_FRAMES_END = object()
+
+
+def _bytes_feature(value: bytes) -> tf.train.Feature:
+    return tf.train.Feature(bytes_list=tf.train.BytesList(value=[value]))
+
+
+def _encode_frame(img: np.ndarray, encoding: str) -> bytes:
+    if encoding == 'raw':
+        return tf.io.serialize_tensor(img).numpy()
+    elif encoding == 'png':
+        if img.dtype not in (np.uint8, np.uint16):
+            raise ValueError(f'PNG encoding requires uint8 or uint16 frames. Got {img.dtype}.')
+        return tf.io.encode_png(img).numpy()
+    else:
+        raise ValueError(f'unknown frame encoding "{encoding}". Expected "raw" or "png".')
+
+
+def _serialize_frame_example(img: np.ndarray, data: Mapping[str, Any], encoding: str) -> bytes:
+    features = {
+        _SHARDED_FRAMES_IMAGE_KEY: _bytes_feature(_encode_frame(img, encoding)),
+        **{
+            key: _bytes_feature(tf.io.serialize_tensor(value).numpy())
+            for key, value in data.items()
+        }
+    }
+    example = tf.train.Example(features=tf.train.Features(feature=features))
+    return example.SerializeToString()
+
+
+def _tensor_description(value) -> Dict[str, Any]:
+    value = np.asarray(value)
+    dtype = tf.string if value.dtype.kind in 'SUO' else tf.as_dtype(value.dtype)
+    return {
+        'dtype': dtype.name,
+        'shape': list(value.shape)
+    }
+
+
+def _spec_description(spec: tf.TensorSpec) -> Dict[str, Any]:
+    return {
+        'dtype': spec.dtype.name,
+        'shape': spec.shape.as_list() if spec.shape.rank is not None else None
+    }
+
+
+def save_sharded_frames_dataset(
+        dataset: tf.data.Dataset,
+        path: PathType,
+        num_shards: int = 8,
+        encoding: str = 'raw',
+        max_queue_size: int = 64
+) -> None:
+    '''Save a dataset of (frame, data) pairs as *num_shards* TFRecord files written in parallel.
+
+    Frames are stored either serialized (*encoding='raw'*) or as PNG (*encoding='png'*, for uint8 and
+    uint16 frames only), together with their data dictionary. The shards are described in a JSON manifest.
+    Use with *saver_dataset_triplet* to save a *DatasetTriplet*.
+    '''
+    path = ensure_dir(path)
+    shard_names = [
+        f'shard-{shard_index:05d}-of-{num_shards:05d}.tfrecord'
+        for shard_index in range(num_shards)
+    ]
+    queues = [queue.Queue(maxsize=max_queue_size) for _ in range(num_shards)]
+    counts = [0] * num_shards
+
+    def _write_shard(shard_index: int) -> None:
+        with tf.io.TFRecordWriter(str(path / shard_names[shard_index])) as writer:
+            while True:
+                item = queues[shard_index].get()
+                if item is _SHARDED_FRAMES_END:
+                    return
+                writer.write(_serialize_frame_example(*item, encoding=encoding))
+                counts[shard_index] += 1
+
+    image_description = None
+    data_description = {}
+    with ThreadPoolExecutor(max_workers=num_shards) as executor:
+        writers = [executor.submit(_write_shard, shard_index) for shard_index in range(num_shards)]
+
+        def _put(shard_index: int, item) -> None:
+            while True:
+                try:
+                    queues[shard_index].put(item, timeout=1)
+                    return
+                except queue.Full:
+                    if writers[shard_index].done():
+                        # re-raise the exception that stopped the writer
+                        writers[shard_index].result()
+
+        try:
+            for index, (img, data) in enumerate(dataset.as_numpy_iterator()):
+                if image_description is None:
+                    image_description = _tensor_description(img)
+                    data_description = funcy.walk_values(_tensor_description, data)
+                _put(index % num_shards, (img, data))
+        finally:
+            for shard_index in range(num_shards):
+                if not writers[shard_index].done():
+                    _put(shard_index, _SHARDED_FRAMES_END)
+
+        for writer in writers:
+            writer.result()
+
+    if image_description is None:
+        # the dataset is empty: describe its elements from its spec so that it can still be parsed
+        image_spec, data_spec = dataset.element_spec
+        image_description = _spec_description(image_spec)
+        data_description = funcy.walk_values(_spec_description, data_spec)
+
+    manifest = {
+        'encoding': encoding,
+        'count': sum(counts),
+        'image': image_description,
+        'data': data_description,
+        'shards': [
+            {'path': shard_name, 'count': count}
+            for shard_name, count in zip(shard_names, counts)
+        ]
+    }
+    save_json(manifest, path / _SHARDED_FRAMES_MANIFEST)
+    save_dataset_metadata(
+        path,
+        count=manifest['count'],
+        n_bytes=sum(
+            (path / shard_name).stat().st_size
+            for shard_name in shard_names
+        )
+    )
+
+
+def load_sharded_frames_dataset(
+        path: PathType,
+        shuffle: bool = False,
+        seed: Optional[int] = None,
+        num_parallel_reads: Optional[int] = AUTOTUNE
+) -> tf.data.Dataset:
+    '''Load a dataset saved by *save_sharded_frames_dataset*, reading its shards in parallel.
+
+    If *shuffle*, the shard order is reshuffled on each iteration, deterministically when *seed* is given.
+    '''
+    path = ensure_resolved(path)
+    manifest = load_json(path / _SHARDED_FRAMES_MANIFEST)
+
+    shard_paths = [str(path / shard['path']) for shard in manifest['shards']]
+    # empty datasets used to be saved without any description
+    image_description = manifest['image'] or {'dtype': tf.float32.name, 'shape': None}
+    data_description = manifest['data']
+    encoding = manifest['encoding']
+    image_shape = image_description['shape']
+    image_channels = image_shape[-1] if image_shape and image_shape[-1] is not None else 0
+
+    features = {
+        key: tf.io.FixedLenFeature([], tf.string)
+        for key in (_SHARDED_FRAMES_IMAGE_KEY, *data_description)
+    }
+
+    def _parse_tensor(serialized: tf.Tensor, description: Mapping[str, Any]) -> tf.Tensor:
+        tensor = tf.io.parse_tensor(serialized, out_type=tf.as_dtype(description['dtype']))
+        tensor.set_shape(description['shape'])
+        return tensor
+
+    def _parse_example(record: tf.Tensor):
+        example = tf.io.parse_single_example(record, features)
+
+        if encoding == 'png':
+            img = tf.io.decode_png(
+                example[_SHARDED_FRAMES_IMAGE_KEY],
+                channels=image_channels,
+                dtype=tf.as_dtype(image_description['dtype'])
+            )
+            img.set_shape(image_description['shape'])
+        else:
+            img = _parse_tensor(example[_SHARDED_FRAMES_IMAGE_KEY], image_description)
+
+        data = {
+            key: _parse_tensor(example[key], description)
+            for key, description in data_description.items()
+        }
+        return img, data
+
+    ds = tf.data.Dataset.from_tensor_slices(shard_paths)
+    if shuffle:
+        ds = ds.shuffle(len(shard_paths), seed=seed, reshuffle_each_iteration=True)
+    ds = ds.interleave(
+        tf.data.TFRecordDataset,
+        cycle_length=len(shard_paths),
+        num_parallel_calls=num_parallel_reads
+    )
+    ds = ds.map(_parse_example, num_parallel_calls=AUTOTUNE)
+    return ds.apply(tf.data.experimental.assert_cardinality(manifest['count']))
+
+
+def loader_sharded_frames_dataset(
+        path: PathType,
+        shuffle: bool = False,
+        seed: Optional[int] = None
+) -> Tuple[bool, Optional[tf.data.Dataset]]:
+    '''Load a dataset saved by *save_sharded_frames_dataset*.
+
+    The shards are read in a fixed order unless *shuffle*. Use *functools.partial* to pass *shuffle*
+    and *seed* to a *Manager*.
+    '''
+    try:
+        return True, load_sharded_frames_dataset(path, shuffle=shuffle, seed=seed)
+    except FileNotFoundError:
+        return False, None
+
+
 def saver_dataset_triplet(
         saver: SaverFunction[tf.data.Dataset]
 ) -> SaverFunction[DatasetTriplet]:
@@ -451,6 +871,24 @@ def saver_dataset_triplet(
             saver(ds_val, path / 'val')
         saver(ds_test, path / 'test')
 
+        splits_metadata = {
+            split: load_dataset_metadata(path / split)
+            for split in ('train', 'val', 'test')
+        }
+        splits_metadata = funcy.compact(splits_metadata)
+        if splits_metadata:
+            n_elements = [metadata.get('n_elements') for metadata in splits_metadata.values()]
+            save_dataset_metadata(
+                path,
+                count=sum(metadata['count'] for metadata in splits_metadata.values()),
+                n_bytes=sum(metadata['bytes'] for metadata in splits_metadata.values()),
+                n_elements=None if None in n_elements else sum(n_elements),
+                splits={
+                    split: metadata['count']
+                    for split, metadata in splits_metadata.items()
+                }
+            )
+
     return _saver
 
 
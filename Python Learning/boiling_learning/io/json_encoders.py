@@ -31,11 +31,29 @@ class GenericJSONEncoder(json.JSONEncoder):
                 '__custom__': True,
                 '__module__': cls.__module__,
                 '__name__': cls.__name__,
-                'data': obj.__dict__ if not hasattr(cls, '__json_encode__') else obj.__json_encode__
+                'data': obj.__dict__ if not hasattr(cls, '__json_encode__') else obj.__json_encode__()
             }
             return result
 
 
+class LegacyGenericJSONEncoder(GenericJSONEncoder):
+    """*GenericJSONEncoder* as it was before objects defining *__json_encode__* were encoded with it.
+
+    The bound method itself used to be encoded instead of its result, so all objects of the same
+    class (e.g. every *Pack*) had the same encoding. Only use it to find entries stored back then.
+    """
+    def default(self, obj):
+        cls = type(obj)
+        if hasattr(cls, '__json_encode__'):
+            return {
+                '__custom__': True,
+                '__module__': cls.__module__,
+                '__name__': cls.__name__,
+                'data': obj.__json_encode__
+            }
+        return super().default(obj)
+
+
 class GenericJSONDecoder(json.JSONDecoder):
     """Custom JSON encoder and Decoder classes to work with general Python classes
     Pass these as the `cls` argument to json.dump and json.load to enable
@@ -0,0 +1,215 @@
+from dataclasses import dataclass, field
+import hashlib
+import os
+from pathlib import Path
+import shutil
+from typing import (
+    Iterable,
+    List,
+    Optional
+)
+
+from boiling_learning.utils.utils import (
+    PathType,
+    ensure_dir,
+    ensure_resolved
+)
+
+
+def file_digest(path: PathType, chunk_size: int = 2**20) -> str:
+    '''SHA-256 hex digest of the contents of the file at *path*.'''
+    digest = hashlib.sha256()
+    with ensure_resolved(path).open('rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _replace_with_link(source: Path, target: Path) -> None:
+    # the link is created aside and renamed, so that *target* always exists
+    temp_path = target.with_name(f'.{target.name}.{os.getpid()}.link')
+    try:
+        os.link(source, temp_path)
+        os.replace(temp_path, target)
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+
+
+@dataclass
+class DedupReport:
+    n_files: int = 0
+    n_linked: int = 0
+    n_new_blobs: int = 0
+    n_failed: int = 0
+    n_bytes: int = 0
+    n_bytes_reclaimed: int = 0
+    dry_run: bool = False
+    failed: List[Path] = field(default_factory=list)
+
+    def __iadd__(self, other: 'DedupReport') -> 'DedupReport':
+        self.n_files += other.n_files
+        self.n_linked += other.n_linked
+        self.n_new_blobs += other.n_new_blobs
+        self.n_failed += other.n_failed
+        self.n_bytes += other.n_bytes
+        self.n_bytes_reclaimed += other.n_bytes_reclaimed
+        self.failed.extend(other.failed)
+        return self
+
+    def describe(self) -> str:
+        action = 'would reclaim' if self.dry_run else 'reclaimed'
+        return (
+            f'{self.n_files} files ({self.n_bytes} bytes) scanned, {self.n_linked} linked to'
+            f' existing blobs, {self.n_new_blobs} new blobs, {self.n_failed} failed:'
+            f' {action} {self.n_bytes_reclaimed} bytes.'
+        )
+
+
+class ArtifactStore:
+    '''Content-addressed storage of files, shared through hardlinks.
+
+    Files are stored once under *root*, named after the hash of their contents, and the stored
+    copies are hardlinked into the directories that use them. Since hardlinked files share their
+    contents, files must not be modified in place once stored: call *detach* before overwriting.
+    '''
+
+    def __init__(self, root: PathType, min_size: int = 4096):
+        self.root: Path = ensure_dir(root)
+        self.min_size: int = min_size
+
+    def blob_path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest
+
+    def __contains__(self, digest: object) -> bool:
+        return isinstance(digest, str) and self.blob_path(digest).is_file()
+
+    def blobs(self) -> Iterable[Path]:
+        return (path for path in self.root.glob('*/*') if path.is_file())
+
+    def store(self, path: PathType, dry_run: bool = False) -> DedupReport:
+        '''Move the contents of the file at *path* to the store, leaving a hardlink in its place.
+
+        If an identical blob already exists, *path* becomes a link to it and its own copy is
+        freed. Files on another device than the store, where hardlinks fail, are left untouched.
+        '''
+        path = ensure_resolved(path)
+        n_bytes = path.stat().st_size
+        report = DedupReport(n_files=1, n_bytes=n_bytes, dry_run=dry_run)
+
+        blob = self.blob_path(file_digest(path))
+        if blob.is_file():
+            if blob.samefile(path):
+                return report
+
+            report.n_linked = 1
+            if path.stat().st_nlink == 1:
+                # the last link to this copy is replaced, so its space is freed
+                report.n_bytes_reclaimed = n_bytes
+            if not dry_run:
+                try:
+                    _replace_with_link(blob, path)
+                except OSError:
+                    report.n_linked = 0
+                    report.n_bytes_reclaimed = 0
+                    report.n_failed = 1
+                    report.failed.append(path)
+        else:
+            report.n_new_blobs = 1
+            if not dry_run:
+                try:
+                    ensure_dir(blob.parent)
+                    os.link(path, blob)
+                except OSError:
+                    report.n_new_blobs = 0
+                    report.n_failed = 1
+                    report.failed.append(path)
+
+        return report
+
+    def put(self, path: PathType) -> str:
+        '''Store the file at *path* and return its digest, with which it can be *link*ed elsewhere.'''
+        report = self.store(path)
+        if report.n_failed:
+            raise OSError(f'could not hardlink {path} into the artifact store at {self.root}.')
+        return file_digest(path)
+
+    def link(self, digest: str, target: PathType) -> Path:
+        '''Hardlink the blob with *digest* to *target*, replacing the file that may be there.'''
+        blob = self.blob_path(digest)
+        if not blob.is_file():
+            raise KeyError(digest)
+
+        target = ensure_resolved(target)
+        ensure_dir(target.parent)
+        _replace_with_link(blob, target)
+        return target
+
+    def dedup(self, paths: Iterable[PathType], dry_run: bool = False) -> DedupReport:
+        '''Store every file of at least *min_size* bytes under *paths*, linking identical files to a single blob.'''
+        report = DedupReport(dry_run=dry_run)
+
+        # a dry run creates no blobs, so files identical to earlier ones are accounted for here
+        planned = set()
+        for root in paths:
+            root = ensure_resolved(root)
+            files = [root] if root.is_file() else sorted(root.rglob('*'))
+            for path in files:
+                if path.is_symlink() or not path.is_file() or path.stat().st_size < self.min_size:
+                    continue
+
+                file_report = self.store(path, dry_run=dry_run)
+                if dry_run and file_report.n_new_blobs:
+                    digest = file_digest(path)
+                    if digest in planned:
+                        file_report.n_new_blobs = 0
+                        file_report.n_linked = 1
+                        if path.stat().st_nlink == 1:
+                            file_report.n_bytes_reclaimed = file_report.n_bytes
+                    planned.add(digest)
+                report += file_report
+
+        return report
+
+    def detach(self, path: PathType) -> int:
+        '''Give every hardlinked file under *path* its own copy, so that it can be modified in place.
+
+        Return the number of detached files.
+        '''
+        path = ensure_resolved(path)
+        if not path.exists():
+            return 0
+
+        files = [path] if path.is_file() else sorted(path.rglob('*'))
+        count = 0
+        for file in files:
+            if file.is_symlink() or not file.is_file() or file.stat().st_nlink == 1:
+                continue
+
+            temp_path = file.with_name(f'.{file.name}.{os.getpid()}.copy')
+            shutil.copy2(file, temp_path)
+            os.replace(temp_path, file)
+            count += 1
+        return count
+
+    def collect_garbage(self, dry_run: bool = False) -> int:
+        '''Remove the blobs that are no longer linked from anywhere. Return the number of freed bytes.'''
+        freed = 0
+        for blob in list(self.blobs()):
+            stat = blob.stat()
+            if stat.st_nlink == 1:
+                freed += stat.st_size
+                if not dry_run:
+                    blob.unlink()
+        return freed
+
+    def usage(self) -> int:
+        '''Total size of the stored blobs, in bytes.'''
+        return sum(blob.stat().st_size for blob in self.blobs())
+
+    def digest(self, path: PathType) -> Optional[str]:
+        '''Digest of the file at *path*, if it is stored, or *None* otherwise.'''
+        path = ensure_resolved(path)
+        digest = file_digest(path)
+        blob = self.blob_path(digest)
+        return digest if blob.is_file() and blob.samefile(path) else None
@@ -0,0 +1,243 @@
+from collections import OrderedDict
+from collections.abc import Mapping
+from dataclasses import dataclass
+import sys
+import threading
+from typing import (
+    Any,
+    Callable,
+    Generic,
+    Hashable,
+    Optional,
+    Tuple,
+    TypeVar
+)
+
+import tensorflow as tf
+
+from boiling_learning.utils.utils import (
+    PathType,
+    ensure_resolved
+)
+
+
+_T = TypeVar('_T')
+
+
+def path_mtime(path: PathType) -> Optional[int]:
+    '''Latest modification time, in nanoseconds, of *path* and everything under it.
+
+    Return *None* if *path* does not exist. Directories are traversed because elements such as
+    SavedModels are stored as directories whose own mtime does not change when files inside do.
+    '''
+    path = ensure_resolved(path)
+    if not path.exists():
+        return None
+
+    mtime = path.stat().st_mtime_ns
+    if path.is_dir():
+        mtime = max(
+            (child.stat().st_mtime_ns for child in path.rglob('*')),
+            default=mtime
+        )
+    return mtime
+
+
+def _tensor_size(shape: tf.TensorShape, dtype: tf.DType) -> Optional[int]:
+    n_elements = tf.TensorShape(shape).num_elements()
+    if n_elements is None:
+        return None
+    return n_elements * tf.as_dtype(dtype).size
+
+
+def _dataset_size(ds: tf.data.Dataset) -> Optional[int]:
+    count = int(tf.data.experimental.cardinality(ds))
+    if count < 0:
+        return None
+
+    element_size = 0
+    for spec in tf.nest.flatten(ds.element_spec):
+        if not isinstance(spec, tf.TensorSpec):
+            return None
+        size = _tensor_size(spec.shape, spec.dtype)
+        if size is None:
+            return None
+        element_size += size
+    return count * element_size
+
+
+def estimate_size(obj: Any) -> Optional[int]:
+    '''Size of the data held by *obj* in bytes, or *None* if it cannot be told.
+
+    Arrays are measured by their *nbytes*, tensors and model weights by their shapes and dtypes,
+    and finite datasets by their cardinality and *element_spec*. Sequences and mappings are the
+    sum of their items, and strings, bytes and numbers are measured with *sys.getsizeof*.
+    '''
+    if obj is None or isinstance(obj, (str, bytes, int, float, bool)):
+        return sys.getsizeof(obj)
+
+    nbytes = getattr(obj, 'nbytes', None)
+    if isinstance(nbytes, int):
+        return nbytes
+
+    if isinstance(obj, (tf.Tensor, tf.Variable)):
+        return _tensor_size(obj.shape, obj.dtype)
+
+    if isinstance(obj, tf.data.Dataset):
+        return _dataset_size(obj)
+
+    if isinstance(obj, tf.keras.Model):
+        return sum(_tensor_size(weight.shape, weight.dtype) or 0 for weight in obj.weights)
+
+    if isinstance(obj, Mapping):
+        obj = list(obj.values())
+    if isinstance(obj, (list, tuple)):
+        sizes = [estimate_size(item) for item in obj]
+        return None if None in sizes else sum(sizes)
+
+    return None
+
+
+@dataclass
+class ElementCacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+    entries: int = 0
+    n_bytes: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class ElementCache(Generic[_T]):
+    '''In-memory LRU cache of loaded elements, keyed by an id and the mtime of the element file.
+
+    An element is only returned if its file was not modified since it was cached. The least
+    recently used elements are evicted when there are more than *max_entries* elements or they
+    add up to more than *max_bytes*, as measured by *sizer*. Either budget may be *None*. If
+    *sizer* returns *None*, the element cannot be budgeted: it is not cached if *max_bytes* is
+    set, and counts as zero bytes otherwise.
+
+    Cached elements are not copied: every hit returns the same object, so changes made to it by
+    one caller are seen by all others. Treat returned elements as read-only, or copy them first.
+    '''
+
+    def __init__(
+            self,
+            max_entries: Optional[int] = 16,
+            max_bytes: Optional[int] = None,
+            sizer: Callable[[Any], Optional[int]] = estimate_size
+    ):
+        if max_entries is not None and max_entries < 0:
+            raise ValueError(f'*max_entries* must be non-negative. Got {max_entries}.')
+        if max_bytes is not None and max_bytes < 0:
+            raise ValueError(f'*max_bytes* must be non-negative. Got {max_bytes}.')
+
+        self.max_entries: Optional[int] = max_entries
+        self.max_bytes: Optional[int] = max_bytes
+        self._sizer = sizer
+        self._elems: 'OrderedDict[Hashable, Tuple[Optional[int], _T, int]]' = OrderedDict()
+        self._lock = threading.RLock()
+        self._stats = ElementCacheStats()
+
+    def __getstate__(self) -> dict:
+        # cached elements are not sent to other processes
+        state = self.__dict__.copy()
+        del state['_lock']
+        state['_elems'] = OrderedDict()
+        state['_stats'] = ElementCacheStats()
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._elems)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._elems
+
+    @property
+    def n_bytes(self) -> int:
+        return self._stats.n_bytes
+
+    def stats(self) -> ElementCacheStats:
+        with self._lock:
+            return ElementCacheStats(**vars(self._stats))
+
+    def get(self, key: Hashable, path: PathType) -> Tuple[bool, Optional[_T]]:
+        '''Return *(True, elem)* if *key* is cached and *path* was not modified since, else *(False, None)*.'''
+        mtime = path_mtime(path)
+        with self._lock:
+            cached = self._elems.get(key)
+            if cached is None or mtime is None or cached[0] != mtime:
+                if cached is not None:
+                    self._remove(key)
+                    self._stats.invalidations += 1
+                self._stats.misses += 1
+                return False, None
+
+            self._elems.move_to_end(key)
+            self._stats.hits += 1
+            return True, cached[1]
+
+    def put(self, key: Hashable, path: PathType, elem: _T) -> None:
+        '''Cache *elem*, loaded from *path*, and evict the least recently used elements if needed.'''
+        mtime = path_mtime(path)
+        if mtime is None:
+            return
+
+        size = self._sizer(elem)
+        if size is None:
+            if self.max_bytes is not None:
+                # an element of unknown size could exceed the budget by any amount
+                return
+            size = 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            # caching it would evict everything else and it would still not fit
+            return
+
+        with self._lock:
+            if key in self._elems:
+                self._remove(key)
+            self._elems[key] = (mtime, elem, size)
+            self._stats.n_bytes += size
+            self._stats.entries = len(self._elems)
+            self._evict()
+
+    def invalidate(self, key: Hashable) -> bool:
+        '''Drop *key* from the cache. Return whether it was cached.'''
+        with self._lock:
+            if key not in self._elems:
+                return False
+            self._remove(key)
+            self._stats.invalidations += 1
+            return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._elems.clear()
+            self._stats.n_bytes = 0
+            self._stats.entries = 0
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, size = self._elems.pop(key)
+        self._stats.n_bytes -= size
+        self._stats.entries = len(self._elems)
+
+    def _over_budget(self) -> bool:
+        return (
+            (self.max_entries is not None and len(self._elems) > self.max_entries)
+            or (self.max_bytes is not None and self._stats.n_bytes > self.max_bytes)
+        )
+
+    def _evict(self) -> None:
+        while self._elems and self._over_budget():
+            key = next(iter(self._elems))
+            self._remove(key)
+            self._stats.evictions += 1
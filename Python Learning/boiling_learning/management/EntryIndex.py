@@ -0,0 +1,138 @@
+import json
+from numbers import Real
+import operator
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Mapping,
+    Sequence,
+    Set
+)
+
+from sortedcontainers import SortedKeyList
+
+from boiling_learning.io.json_encoders import GenericJSONEncoder
+from boiling_learning.utils.utils import Interval
+
+
+_missing = object()
+# passed as the default of resolvers, which raise when given *_missing*
+_absent = object()
+
+
+def resolve_dotted(obj: Any, path: str, default: Any = _missing) -> Any:
+    '''Follow a dotted *path* such as *'creator_params.kwargs.dataset_size'* into *obj*.
+
+    Each part is a mapping key, a sequence index or an attribute name, in this order of preference.
+    Return *default* if the path does not exist in *obj*, or raise a *KeyError* if not given.
+    '''
+    for part in path.split('.'):
+        if isinstance(obj, Mapping) and part in obj:
+            obj = obj[part]
+        elif (
+                isinstance(obj, Sequence)
+                and not isinstance(obj, str)
+                and part.lstrip('-').isdigit()
+                and -len(obj) <= int(part) < len(obj)
+        ):
+            obj = obj[int(part)]
+        elif not isinstance(obj, Mapping) and hasattr(obj, part):
+            obj = getattr(obj, part)
+        elif default is _missing:
+            raise KeyError(path)
+        else:
+            return default
+    return obj
+
+
+def equality_key(value: Any) -> str:
+    '''Canonical representation of *value*: values with the same JSON encoding are equal.'''
+    if isinstance(value, Real) and not isinstance(value, bool) and float(value).is_integer():
+        # so that 1 and 1.0 are the same key
+        value = int(value)
+    return json.dumps(value, cls=GenericJSONEncoder, sort_keys=True)
+
+
+class EntryIndex:
+    '''Secondary index of entries by the value at a dotted path.
+
+    Supports equality lookups on any JSON-encodable value and range lookups on numbers and strings.
+    Entries where the path does not exist are not indexed.
+    '''
+
+    def __init__(
+            self,
+            path: str,
+            entries: Mapping[str, Mapping],
+            resolver: Callable[[Mapping, str, Any], Any] = resolve_dotted
+    ):
+        self.path: str = path
+        self._equal: Dict[str, Set[str]] = {}
+        self._numbers = SortedKeyList(key=operator.itemgetter(0))
+        self._strings = SortedKeyList(key=operator.itemgetter(0))
+
+        for elem_id, entry in entries.items():
+            value = resolver(entry, path, _absent)
+            if value is _absent:
+                continue
+
+            self._equal.setdefault(equality_key(value), set()).add(elem_id)
+            if isinstance(value, Real) and not isinstance(value, bool):
+                self._numbers.add((value, elem_id))
+            elif isinstance(value, str):
+                self._strings.add((value, elem_id))
+
+    def __len__(self) -> int:
+        return sum(map(len, self._equal.values()))
+
+    def equal(self, value: Any) -> Set[str]:
+        return set(self._equal.get(equality_key(value), ()))
+
+    def within(self, interval: Interval) -> Set[str]:
+        bounds = [bound for bound in (interval.lower, interval.upper) if bound is not None]
+        if not bounds:
+            return set().union(*self._equal.values())
+        elif all(isinstance(bound, str) for bound in bounds):
+            ordered = self._strings
+        elif all(isinstance(bound, Real) and not isinstance(bound, bool) for bound in bounds):
+            ordered = self._numbers
+        else:
+            raise ValueError(f'interval bounds must be either numbers or strings. Got {interval}.')
+
+        return {
+            elem_id
+            for _, elem_id in ordered.irange_key(
+                interval.lower,
+                interval.upper,
+                inclusive=(interval.lower_closed, interval.upper_closed)
+            )
+        }
+
+    def select(self, condition: Any) -> Set[str]:
+        '''Ids of entries whose value is in *condition*, if an *Interval*, or equals it otherwise.'''
+        if isinstance(condition, Interval):
+            return self.within(condition)
+        else:
+            return self.equal(condition)
+
+
+def select_entries(
+        indexes: Callable[[str], EntryIndex],
+        conditions: Mapping[str, Any]
+) -> Set[str]:
+    '''Ids of the entries that satisfy every one of the non-empty *conditions*.
+
+    The index of each dotted path is the one returned by *indexes*.
+    '''
+    if not conditions:
+        raise ValueError('at least one condition is required.')
+
+    selected = None
+    for path, condition in conditions.items():
+        ids = indexes(path).select(condition)
+        selected = ids if selected is None else selected & ids
+        if not selected:
+            # no need to look the remaining conditions up
+            break
+    return selected
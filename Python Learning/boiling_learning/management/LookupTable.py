@@ -0,0 +1,558 @@
+import abc
+from contextlib import contextmanager
+from functools import partial
+import json
+import os
+import sqlite3
+import threading
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterator,
+    List,
+    Mapping,
+    MutableMapping,
+    Optional,
+    Tuple
+)
+
+try:
+    # fcntl is only available on POSIX systems
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from boiling_learning.io.io import (
+    load_json,
+    save_json
+)
+from boiling_learning.io.json_encoders import (
+    GenericJSONDecoder,
+    GenericJSONEncoder
+)
+from boiling_learning.utils.utils import (
+    PathType,
+    ensure_parent,
+    ensure_resolved
+)
+
+
+_default_json_saver = partial(save_json, cls=GenericJSONEncoder)
+_default_json_loader = partial(load_json, cls=GenericJSONDecoder)
+
+
+class LookupTableConflictError(RuntimeError):
+    '''Raised when a lookup table was modified by someone else after it was read.'''
+
+
+@contextmanager
+def file_lock(path: PathType) -> Iterator[None]:
+    '''Hold an exclusive advisory lock on *path* while in context.
+
+    Locks are taken with *fcntl.flock*, so they are only respected by other processes that lock
+    the same file. Where *fcntl* is not available, no lock is taken.
+    '''
+    path = ensure_parent(path)
+    with path.open('a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+class LookupTable(MutableMapping[str, dict], abc.ABC):
+    '''Storage for the entries of a *Manager*, indexed by id, fingerprint and creator.
+
+    Subclasses implement the mapping interface, *ids_with_fingerprint*, *ids_with_creator*
+    and *update_entries*.
+    '''
+
+    def __init__(
+            self,
+            entries_key: str = 'entries',
+            elements_key: str = 'element',
+            creator_key: str = 'creator',
+            fingerprint_key: str = 'fingerprint'
+    ):
+        self.entries_key: str = entries_key
+        self.elements_key: str = elements_key
+        self.creator_key: str = creator_key
+        self.fingerprint_key: str = fingerprint_key
+
+    def entry_fingerprint(self, entry: Mapping) -> Optional[str]:
+        return entry.get(self.fingerprint_key)
+
+    def entry_creator(self, entry: Mapping) -> Optional[str]:
+        return entry.get(self.elements_key, {}).get(self.creator_key)
+
+    @abc.abstractmethod
+    def ids_with_fingerprint(self, fingerprint: str) -> List[str]:
+        pass
+
+    @abc.abstractmethod
+    def ids_with_creator(self, creator: str) -> List[str]:
+        pass
+
+    @abc.abstractmethod
+    def update_entries(self, entries: Mapping[str, Mapping]) -> None:
+        '''Insert or replace many entries at once.'''
+
+    def entries(self) -> Dict[str, dict]:
+        return dict(self.items())
+
+    def reload(self, raise_if_fails: bool = False) -> None:
+        '''Synchronize with the storage, if it may have been modified by others.'''
+
+    def flush(self) -> None:
+        '''Make sure that every modification is persisted.'''
+
+    def revision(self) -> Optional[Hashable]:
+        '''Token that changes whenever the table is modified, or *None* if modifications cannot be tracked.'''
+        return None
+
+    @contextmanager
+    def transaction(self) -> Iterator['LookupTable']:
+        '''Group reads and modifications so that no other process modifies the table in between.
+
+        Transactions may be nested: only the outermost one synchronizes with the storage.
+        '''
+        yield self
+
+    def export_json(
+            self,
+            path: PathType,
+            saver: Callable[[dict, PathType], Any] = _default_json_saver
+    ) -> None:
+        '''Write every entry to a human-readable JSON file, in the format of *JSONLookupTable*.'''
+        saver({self.entries_key: self.entries()}, path)
+
+    def import_json(
+            self,
+            path: PathType,
+            loader: Callable[[PathType], dict] = _default_json_loader,
+            fingerprinter: Optional[Callable[[Mapping], str]] = None
+    ) -> int:
+        '''Insert the entries of a JSON lookup table. Return the number of imported entries.
+
+        If *fingerprinter* is given, it computes the fingerprints that imported entries lack.
+        '''
+        entries = loader(path).get(self.entries_key, {})
+        if fingerprinter is not None:
+            entries = {
+                elem_id: (
+                    entry
+                    if self.fingerprint_key in entry
+                    else {**entry, self.fingerprint_key: fingerprinter(entry.get(self.elements_key, {}))}
+                )
+                for elem_id, entry in entries.items()
+            }
+        self.update_entries(entries)
+        return len(entries)
+
+
+class JSONLookupTable(LookupTable):
+    '''Lookup table stored as a single JSON file, kept in memory and rewritten on every modification.
+
+    The file is only read again when it was modified since it was last read, which is told by its
+    modification time, size and inode: every write replaces the file with a new one, so writes
+    within the resolution of modification times are still noticed.
+    Entries without a stored fingerprint are indexed by *fingerprinter*, if given.
+    '''
+
+    def __init__(
+            self,
+            path: PathType,
+            saver: Callable[[dict, PathType], Any] = _default_json_saver,
+            loader: Callable[[PathType], dict] = _default_json_loader,
+            fingerprinter: Optional[Callable[[Mapping], str]] = None,
+            **keys
+    ):
+        super().__init__(**keys)
+        self.path = ensure_resolved(path)
+        self._saver = saver
+        self._loader = loader
+        self._fingerprinter = fingerprinter
+        self.lock_path = self.path.with_name(self.path.name + '.lock')
+        self._table: Dict[str, Any] = {self.entries_key: {}, self.version_key: 0}
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._fingerprint_index: Dict[str, List[str]] = {}
+        self._transaction_depth: int = 0
+        self._transaction_dirty: bool = False
+        self._thread_lock = threading.RLock()
+
+    version_key: str = 'version'
+
+    @property
+    def version(self) -> int:
+        return self._table.get(self.version_key, 0)
+
+    def __getstate__(self) -> dict:
+        # the table is read again by the unpickled copy
+        state = self.__dict__.copy()
+        del state['_thread_lock']
+        state['_table'] = {self.entries_key: {}, self.version_key: 0}
+        state['_fingerprint_index'] = {}
+        state['_signature'] = None
+        state['_transaction_depth'] = 0
+        state['_transaction_dirty'] = False
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._thread_lock = threading.RLock()
+
+    def revision(self) -> Optional[Hashable]:
+        self.reload()
+        return (self._signature, self.version)
+
+    @property
+    def _entries(self) -> Dict[str, dict]:
+        return self._table.setdefault(self.entries_key, {})
+
+    def entry_fingerprint(self, entry: Mapping) -> Optional[str]:
+        fingerprint = super().entry_fingerprint(entry)
+        if fingerprint is None and self._fingerprinter is not None:
+            fingerprint = self._fingerprinter(entry.get(self.elements_key, {}))
+        return fingerprint
+
+    def _index(self, elem_id: str, entry: Mapping) -> None:
+        self._fingerprint_index.setdefault(self.entry_fingerprint(entry), []).append(elem_id)
+
+    def _unindex(self, elem_id: str, entry: Mapping) -> None:
+        fingerprint = self.entry_fingerprint(entry)
+        elem_ids = self._fingerprint_index.get(fingerprint, [])
+        if elem_id in elem_ids:
+            elem_ids.remove(elem_id)
+        if not elem_ids:
+            self._fingerprint_index.pop(fingerprint, None)
+
+    def _rebuild_index(self) -> None:
+        self._fingerprint_index = {}
+        for elem_id, entry in self._entries.items():
+            self._index(elem_id, entry)
+
+    def _initialize(self) -> None:
+        with self.transaction():
+            if not self.path.is_file():
+                self._transaction_dirty = True
+
+    def reload(self, raise_if_fails: bool = False) -> None:
+        '''Read the table again if the file was modified since it was last read.
+
+        A table that cannot be decoded is never replaced by an empty one: either the error is
+        raised or, if not *raise_if_fails*, the entries read last are kept.
+        '''
+        # threads share the in-memory table, so it is not read while another thread modifies it
+        with self._thread_lock:
+            if not self.path.is_file() and self._transaction_depth == 0:
+                self._initialize()
+            else:
+                self._read(raise_if_fails=raise_if_fails)
+
+    def _file_signature(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def _read(self, raise_if_fails: bool) -> None:
+        signature = self._file_signature()
+        if signature is None:
+            self._table = {self.entries_key: {}, self.version_key: 0}
+            self._fingerprint_index = {}
+            self._signature = None
+            return
+
+        if signature == self._signature:
+            return
+
+        try:
+            table = self._loader(self.path)
+        except (json.JSONDecodeError, OSError):
+            if raise_if_fails:
+                raise
+        else:
+            self._table = table
+            self._signature = signature
+            self._rebuild_index()
+
+    def _write(self) -> None:
+        # the lock is held, so the file only changes if someone wrote it without taking the lock
+        signature = self._file_signature()
+        if self._signature is not None and signature is not None and signature != self._signature:
+            raise LookupTableConflictError(
+                f'{self.path} was modified by someone else since version {self.version} was read.')
+
+        self._table[self.version_key] = self.version + 1
+
+        # readers never see a partially written table: the new one is written aside and renamed
+        temp_path = self.path.with_name(f'{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        try:
+            self._saver(self._table, temp_path)
+            os.replace(temp_path, self.path)
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+        self._signature = self._file_signature()
+
+    def flush(self) -> None:
+        with self.transaction():
+            self._transaction_dirty = True
+
+    @contextmanager
+    def transaction(self) -> Iterator['JSONLookupTable']:
+        with self._thread_lock:
+            if self._transaction_depth > 0:
+                self._transaction_depth += 1
+                try:
+                    yield self
+                finally:
+                    self._transaction_depth -= 1
+                return
+
+            with file_lock(self.lock_path):
+                self._read(raise_if_fails=True)
+                self._transaction_depth = 1
+                self._transaction_dirty = False
+                try:
+                    yield self
+                    if self._transaction_dirty:
+                        self._write()
+                except BaseException:
+                    # modifications are discarded: the next read restores the persisted table
+                    self._signature = None
+                    raise
+                finally:
+                    self._transaction_depth = 0
+                    self._transaction_dirty = False
+
+    def __getitem__(self, elem_id: str) -> dict:
+        self.reload()
+        return self._entries[elem_id]
+
+    def __setitem__(self, elem_id: str, entry: Mapping[str, Any]) -> None:
+        with self.transaction():
+            self._set(elem_id, entry)
+            self._transaction_dirty = True
+
+    def _set(self, elem_id: str, entry: Mapping[str, Any]) -> None:
+        if elem_id in self._entries:
+            self._unindex(elem_id, self._entries[elem_id])
+        self._entries[elem_id] = dict(entry)
+        self._index(elem_id, entry)
+
+    def __delitem__(self, elem_id: str) -> None:
+        with self.transaction():
+            self._unindex(elem_id, self._entries[elem_id])
+            del self._entries[elem_id]
+            self._transaction_dirty = True
+
+    def __iter__(self) -> Iterator[str]:
+        self.reload()
+        return iter(list(self._entries))
+
+    def __len__(self) -> int:
+        self.reload()
+        return len(self._entries)
+
+    def entries(self) -> Dict[str, dict]:
+        self.reload()
+        return dict(self._entries)
+
+    def ids_with_fingerprint(self, fingerprint: str) -> List[str]:
+        self.reload()
+        return list(self._fingerprint_index.get(fingerprint, ()))
+
+    def ids_with_creator(self, creator: str) -> List[str]:
+        self.reload()
+        return [
+            elem_id
+            for elem_id, entry in self._entries.items()
+            if self.entry_creator(entry) == creator
+        ]
+
+    def update_entries(self, entries: Mapping[str, Mapping]) -> None:
+        with self.transaction():
+            for elem_id, entry in entries.items():
+                self._set(elem_id, entry)
+            self._transaction_dirty = True
+
+
+class SQLiteLookupTable(LookupTable):
+    '''Lookup table stored in an SQLite database, with one row per entry.
+
+    Fingerprints and creator names are stored in indexed columns, so that lookups do not decode
+    every entry, and modifications are row-level upserts instead of rewrites of the whole table.
+    The database uses write-ahead logging, so readers do not block the writer.
+    '''
+
+    _schema = (
+        '''
+        CREATE TABLE IF NOT EXISTS entries (
+            id TEXT PRIMARY KEY,
+            fingerprint TEXT,
+            creator TEXT,
+            entry TEXT NOT NULL
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS entries_fingerprint ON entries (fingerprint)',
+        'CREATE INDEX IF NOT EXISTS entries_creator ON entries (creator)',
+    )
+    _upsert = '''
+        INSERT INTO entries (id, fingerprint, creator, entry) VALUES (?, ?, ?, ?)
+        ON CONFLICT (id) DO UPDATE SET
+            fingerprint = excluded.fingerprint,
+            creator = excluded.creator,
+            entry = excluded.entry
+    '''
+
+    def __init__(
+            self,
+            path: PathType,
+            encoder: Optional[type] = GenericJSONEncoder,
+            decoder: Optional[type] = GenericJSONDecoder,
+            timeout: float = 30.0,
+            **keys
+    ):
+        super().__init__(**keys)
+        self.path = ensure_parent(path)
+        self._dumps = partial(json.dumps, cls=encoder)
+        self._loads = partial(json.loads, cls=decoder)
+        self._timeout: float = timeout
+        self._connect()
+        self._transaction_depth: int = 0
+        self._n_writes: int = 0
+        self._thread_lock = threading.RLock()
+        with self.transaction():
+            for statement in self._schema:
+                self._connection.execute(statement)
+
+    def _connect(self) -> None:
+        # transactions are managed explicitly, see *transaction*
+        self._connection = sqlite3.connect(
+            str(self.path),
+            timeout=self._timeout,
+            check_same_thread=False,
+            isolation_level=None
+        )
+        self._connection.execute('PRAGMA journal_mode=WAL')
+
+    def __getstate__(self) -> dict:
+        # connections cannot be shared between processes, so the unpickled copy opens its own
+        state = self.__dict__.copy()
+        del state['_connection']
+        del state['_thread_lock']
+        state['_transaction_depth'] = 0
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._thread_lock = threading.RLock()
+        self._connect()
+
+    def close(self) -> None:
+        with self._thread_lock:
+            self._connection.close()
+
+    @contextmanager
+    def transaction(self) -> Iterator['SQLiteLookupTable']:
+        with self._thread_lock:
+            if self._transaction_depth > 0:
+                self._transaction_depth += 1
+                try:
+                    yield self
+                finally:
+                    self._transaction_depth -= 1
+                return
+
+            # an immediate transaction takes the write lock right away, so that reads inside it are not stale
+            self._connection.execute('BEGIN IMMEDIATE')
+            self._transaction_depth = 1
+            try:
+                yield self
+            except BaseException:
+                self._connection.execute('ROLLBACK')
+                raise
+            else:
+                self._connection.execute('COMMIT')
+                self._n_writes += 1
+            finally:
+                self._transaction_depth = 0
+
+    def revision(self) -> Optional[Hashable]:
+        # *data_version* only changes with commits from other connections
+        with self._thread_lock:
+            data_version = self._connection.execute('PRAGMA data_version').fetchone()[0]
+            return (data_version, self._n_writes)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self.transaction():
+            yield self._connection
+
+    def _fetch(self, query: str, parameters: tuple = ()) -> List[tuple]:
+        # the connection is shared by all threads, so that statements and their results may not interleave
+        with self._thread_lock:
+            return self._connection.execute(query, parameters).fetchall()
+
+    def _row(self, elem_id: str, entry: Mapping) -> tuple:
+        return (
+            elem_id,
+            self.entry_fingerprint(entry),
+            self.entry_creator(entry),
+            self._dumps(entry)
+        )
+
+    def __getitem__(self, elem_id: str) -> dict:
+        rows = self._fetch('SELECT entry FROM entries WHERE id = ?', (elem_id,))
+        if not rows:
+            raise KeyError(elem_id)
+        return self._loads(rows[0][0])
+
+    def __setitem__(self, elem_id: str, entry: Mapping[str, Any]) -> None:
+        with self._transaction() as connection:
+            connection.execute(self._upsert, self._row(elem_id, entry))
+
+    def __delitem__(self, elem_id: str) -> None:
+        with self._transaction() as connection:
+            cursor = connection.execute('DELETE FROM entries WHERE id = ?', (elem_id,))
+        if cursor.rowcount == 0:
+            raise KeyError(elem_id)
+
+    def __contains__(self, elem_id: object) -> bool:
+        return bool(self._fetch('SELECT 1 FROM entries WHERE id = ?', (elem_id,)))
+
+    def __iter__(self) -> Iterator[str]:
+        rows = self._fetch('SELECT id FROM entries ORDER BY rowid')
+        return (elem_id for elem_id, in rows)
+
+    def __len__(self) -> int:
+        return self._fetch('SELECT COUNT(*) FROM entries')[0][0]
+
+    def entries(self) -> Dict[str, dict]:
+        rows = self._fetch('SELECT id, entry FROM entries ORDER BY rowid')
+        return {
+            elem_id: self._loads(entry)
+            for elem_id, entry in rows
+        }
+
+    def ids_with_fingerprint(self, fingerprint: str) -> List[str]:
+        rows = self._fetch('SELECT id FROM entries WHERE fingerprint = ? ORDER BY rowid', (fingerprint,))
+        return [elem_id for elem_id, in rows]
+
+    def ids_with_creator(self, creator: str) -> List[str]:
+        rows = self._fetch('SELECT id FROM entries WHERE creator = ? ORDER BY rowid', (creator,))
+        return [elem_id for elem_id, in rows]
+
+    def update_entries(self, entries: Mapping[str, Mapping]) -> None:
+        with self._transaction() as connection:
+            connection.executemany(
+                self._upsert,
+                [self._row(elem_id, entry) for elem_id, entry in entries.items()]
+            )
@@ -1,16 +1,26 @@
+from collections import deque
+from concurrent.futures import (
+    Executor,
+    Future,
+    ThreadPoolExecutor
+)
 import copy
 from dataclasses import dataclass
 import enum
-from functools import partial
 import json
-import operator
+from functools import partial
+import os
 import pprint
 from pathlib import Path
+import threading
+import time
 from typing import (
     Any,
     Callable,
+    ContextManager,
     Dict,
     Generic,
+    Hashable,
     Iterable,
     Iterator,
     List,
@@ -20,8 +30,8 @@ from typing import (
     TypeVar,
     Union
 )
+import warnings
 
-import funcy
 import more_itertools as mit
 import parse
 from typing_extensions import (
@@ -41,6 +51,21 @@ from boiling_learning.io.io import (
     BoolFlaggedLoaderFunction,
     SaverFunction
 )
+from boiling_learning.management.ArtifactStore import (
+    ArtifactStore,
+    DedupReport
+)
+from boiling_learning.management.ElementCache import ElementCache
+from boiling_learning.management.EntryIndex import (
+    EntryIndex,
+    resolve_dotted,
+    select_entries
+)
+from boiling_learning.management.LookupTable import (
+    JSONLookupTable,
+    LookupTable,
+    file_lock
+)
 from boiling_learning.preprocessing.transformers import (
     Creator,
     Transformer
@@ -76,6 +101,7 @@ class Manager(
         post_processor_params: str = 'post_processor_params'
         workspace: str = 'workspace'
         path: str = 'path'
+        fingerprint: str = 'fingerprint'
 
     # @dataclass(frozen=True)
     # class Entry:
@@ -92,6 +118,16 @@ class Manager(
         encoder=bl.io.json_encoders.GenericJSONEncoder,
         decoder=bl.io.json_encoders.GenericJSONDecoder
     )
+    _default_description_fingerprinter = partial(
+        bl.utils.json_fingerprint,
+        encoder=bl.io.json_encoders.GenericJSONEncoder
+    )
+    _legacy_description_fingerprinter = partial(
+        bl.utils.json_fingerprint,
+        encoder=bl.io.json_encoders.LegacyGenericJSONEncoder
+    )
+    # seconds between writes of the recorded accesses to the entry statistics
+    stats_flush_interval: float = 60.0
 
     class MultipleIdsHandler(enum.Enum):
         RAISE = enum.auto()
@@ -100,19 +136,77 @@ class Manager(
         KEEP_FIRST_LOADED = enum.auto()
         KEEP_LAST_LOADED = enum.auto()
 
+    class GCPolicy(enum.Enum):
+        LRU = enum.auto()
+        VALUE = enum.auto()
+
+    @dataclass(frozen=True)
+    class EntryUsage:
+        elem_id: str
+        n_bytes: int
+        created: Optional[float] = None
+        last_access: Optional[float] = None
+        n_accesses: int = 0
+        creation_time: float = 0.0
+        evicted: bool = False
+
+        @property
+        def value(self) -> float:
+            '''Seconds of creation saved per byte kept. Cheap, rarely used and large entries are worth the least.'''
+            return self.creation_time * (1 + self.n_accesses) / max(self.n_bytes, 1)
+
+    @dataclass
+    class GCReport:
+        usages: List['Manager.EntryUsage']
+        duplicates: List[List[str]]
+        evicted: List[str]
+        n_bytes_before: int
+        n_bytes_freed: int
+        dry_run: bool
+        n_blob_bytes_freed: int = 0
+
+        def describe(self) -> str:
+            action = 'would evict' if self.dry_run else 'evicted'
+            lines = [
+                f'{len(self.usages)} entries using {self.n_bytes_before} bytes,'
+                f' {action} {len(self.evicted)} freeing {self.n_bytes_freed} bytes'
+                f' and {self.n_blob_bytes_freed} bytes of unused artifacts.'
+            ]
+            lines.extend(
+                f'duplicates: {group[0]} kept, {", ".join(group[1:])} evictable'
+                for group in self.duplicates
+            )
+            lines.extend(
+                f'{usage.elem_id}: {usage.n_bytes} bytes,'
+                f' last access {time.ctime(usage.last_access) if usage.last_access is not None else "never"},'
+                f' {usage.n_accesses} accesses'
+                + (f', {action}' if usage.elem_id in self.evicted else '')
+                + (', evicted' if usage.evicted else '')
+                for usage in self.usages
+            )
+            return '\n'.join(lines)
+
     class Element:
-        # TODO: finish this and replace Manager interface
+        '''Handle to a stored element, loaded only when its *value* is first requested.'''
+
         def __init__(
                 self,
                 elem_id: str,
                 path: PathType,
                 load_method: BoolFlaggedLoaderFunction[_ElemType],
-                save_method: SaverFunction[_ElemType]
+                save_method: Optional[SaverFunction[_ElemType]] = None,
+                entry: Optional[Mapping] = None
         ):
             self._id: str = elem_id
             self._is_loaded: bool = False
             self._path: Path = bl.utils.ensure_resolved(path)
-            self._value: Union[_Sentinel, _ElemType, _PostProcessedElemType]
+            self._value: Union[_Sentinel, _ElemType, _PostProcessedElemType] = _sentinel
+            self.load_method: BoolFlaggedLoaderFunction[_ElemType] = load_method
+            self.save_method: Optional[SaverFunction[_ElemType]] = save_method
+            self.entry: Mapping = entry if entry is not None else {}
+
+        def __repr__(self) -> str:
+            return f'{self.__class__.__qualname__}({self.id!r}, loaded={self.is_loaded})'
 
         @property
         def id(self) -> str:
@@ -126,11 +220,34 @@ class Manager(
         def path(self) -> Path:
             return self._path
 
+        def get(self, path: str, default: Any = None) -> Any:
+            '''Value at a dotted *path* of the entry, without loading the element.'''
+            return resolve_dotted(self.entry, path, default)
+
         def load(self) -> bool:
-            success, self._value = self.load_method(self.path)
+            success, value = self.load_method(self.path)
+            if success:
+                self._value = value
             self._is_loaded = success
             return success
 
+        @property
+        def value(self) -> Union[_ElemType, _PostProcessedElemType]:
+            if not self.is_loaded and not self.load():
+                raise ValueError(f'could not load element {self.id} from {self.path}.')
+            return self._value
+
+        def save(self, value: Union[_ElemType, _PostProcessedElemType]) -> None:
+            if self.save_method is None:
+                raise ValueError(f'no *save_method* set for element {self.id}.')
+            self.save_method(value, self.path)
+            self._value = value
+            self._is_loaded = True
+
+        def unload(self) -> None:
+            self._value = _sentinel
+            self._is_loaded = False
+
     def __init__(
             self,
             path: PathType,
@@ -145,7 +262,11 @@ class Manager(
             key_names: Keys = Keys(),
             table_saver: Callable[[dict, Path], Any] = _default_table_saver,
             table_loader: Callable[[Path], dict] = _default_table_loader,
-            description_comparer: Callable[[Mapping, Mapping], bool] = _default_description_comparer
+            description_comparer: Callable[[Mapping, Mapping], bool] = _default_description_comparer,
+            description_fingerprinter: Callable[[Mapping], str] = _default_description_fingerprinter,
+            lookup_table: Optional[LookupTable] = None,
+            element_cache: Optional[ElementCache] = None,
+            executor: Optional[Executor] = None
     ):
         '''
         The Manager's directory is structure like this:
@@ -172,12 +293,34 @@ class Manager(
                        'creator_params': *creator_params* // key_names.creator_params
                    }
                    'metadata': *metadata_dict*  // key_names.metadata: metadata
+                   'fingerprint': *hex_digest* // key_names.fingerprint: fingerprint of the contents
                 }
                 ...
             }
         }
         ```
+
+        By default, the lookup table is stored in `lookup_table.json`. Pass a *lookup_table*, e.g.
+        a *SQLiteLookupTable*, to store it differently.
+
+        If an *element_cache* is given, elements loaded with the default loader are kept in memory
+        and reused while their files are not modified. Cached elements are shared by every caller
+        that loads them, so they must not be modified in place.
+
+        *executor* runs *provide_elem_async*. By default, a thread pool is created when first needed.
+
+        Entries are matched by the fingerprints of their contents, computed with
+        *description_fingerprinter*. *description_comparer* is no longer used and only accepted for
+        backwards compatibility: passing anything but the default raises a warning.
         '''
+        if description_comparer is not self._default_description_comparer:
+            warnings.warn(
+                '*description_comparer* is ignored: entries are matched by the fingerprints of their'
+                ' contents. Pass a *description_fingerprinter* instead.',
+                DeprecationWarning,
+                stacklevel=2
+            )
+
         self.key_names: self.Keys = key_names
         self._path: Path = bl.utils.ensure_dir(path)
         self._table_path: Path = self.path / 'lookup_table.json'
@@ -185,9 +328,30 @@ class Manager(
             self.path / self.key_names.entries
         )
         self._shared_dir_path: Path = bl.utils.ensure_dir(self.path / 'shared')
-        self._table_saver = table_saver
-        self._table_loader = table_loader
-        self._description_comparer = description_comparer
+        self._description_fingerprinter = description_fingerprinter
+        # legacy entries can only be recognized with the encoder they were stored with
+        self._legacy_fingerprinter: Optional[Callable[[Mapping], str]] = (
+            self._legacy_description_fingerprinter
+            if description_fingerprinter is self._default_description_fingerprinter
+            else None
+        )
+
+        if lookup_table is None:
+            lookup_table = JSONLookupTable(
+                self._table_path,
+                saver=table_saver,
+                loader=table_loader,
+                fingerprinter=self.fingerprint,
+                entries_key=self.key_names.entries,
+                elements_key=self.key_names.elements,
+                creator_key=self.key_names.creator,
+                fingerprint_key=self.key_names.fingerprint
+            )
+        self._table: LookupTable = lookup_table
+        self.element_cache: Optional[ElementCache] = element_cache
+        self._artifacts: Optional[ArtifactStore] = None
+        self._indexes: Dict[str, EntryIndex] = {}
+        self._indexes_revision: Optional[Hashable] = None
 
         if load_table:
             self.load_lookup_table()
@@ -195,17 +359,7 @@ class Manager(
         self.id_fmt: str = id_fmt
         self.index_key: str = index_key
 
-        self._parse_index: Callable[[str], int] = funcy.compose(
-            int,
-            operator.itemgetter(index_key),
-            parse.compile(id_fmt).parse
-        )
-        # def _parse_index(self, elem_id) -> int:
-        #     return int(parse.parse(self.id_fmt, elem_id)[self.index_key])
-
-        def _format_index(index: int) -> str:
-            return self.id_fmt.format(**{self.index_key: index})
-        self._format_index: Callable[[int], str] = _format_index
+        self._id_parser: Optional[parse.Parser] = None
 
         self.save_method: Optional[SaverFunction[_ElemType]] = save_method
         self.load_method: Optional[BoolFlaggedLoaderFunction[_ElemType]] = load_method
@@ -213,21 +367,64 @@ class Manager(
         self.post_processor: Optional[Transformer[_ElemType, _PostProcessedElemType]] = post_processor
         self.verbose: VerboseType = verbose
 
+        self._executor: Optional[Executor] = executor
+        self._pending: Dict[str, Future] = {}
+        self._pending_lock = threading.Lock()
+
+        # accesses are written to the entry statistics in batches, not on every load
+        self._pending_accesses: Dict[str, Tuple[float, int]] = {}
+        self._accesses_lock = threading.Lock()
+        self._accesses_flushed = time.monotonic()
+
+    def __getstate__(self) -> dict:
+        # executors, futures and locks belong to the process that created them
+        state = self.__dict__.copy()
+        state['_executor'] = None
+        state['_pending'] = {}
+        state['_id_parser'] = None
+        state['_pending_accesses'] = {}
+        del state['_pending_lock']
+        del state['_accesses_lock']
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._pending_lock = threading.Lock()
+        self._accesses_lock = threading.Lock()
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(thread_name_prefix='Manager')
+        return self._executor
+
+    def _parse_index(self, elem_id: str) -> int:
+        if self._id_parser is None:
+            self._id_parser = parse.compile(self.id_fmt)
+        return int(self._id_parser.parse(elem_id)[self.index_key])
+
+    def _format_index(self, index: int) -> str:
+        return self.id_fmt.format(**{self.index_key: index})
+
     def __getitem__(self, elem_id: str):
-        self.load_lookup_table()
-        return self._lookup_table.setdefault(self.key_names.entries, {})[elem_id]
+        return self._table[elem_id]
 
     def __setitem__(self, elem_id: str, entry: Mapping[str, Any]) -> None:
-        self._lookup_table.setdefault(self.key_names.entries, {})[elem_id] = entry
-        self.save_lookup_table()
+        self._table[elem_id] = self._fingerprinted(entry)
 
     def __delitem__(self, elem_id: str) -> None:
-        del self._lookup_table.setdefault(self.key_names.entries, {})[elem_id]
-        self.save_lookup_table()
+        del self._table[elem_id]
+
+    def __contains__(self, elem_id: object) -> bool:
+        return elem_id in self._table
 
     @property
     def entries(self) -> dict:
-        return dict(self._lookup_table[self.key_names.entries])
+        return self._table.entries()
+
+    @property
+    def table(self) -> LookupTable:
+        return self._table
 
     def __iter__(self) -> Iterator[str]:
         return iter(self.entries)
@@ -251,6 +448,13 @@ class Manager(
     def shared_dir(self) -> Path:
         return self._shared_dir_path
 
+    @property
+    def artifacts(self) -> ArtifactStore:
+        '''Content-addressed store, under the shared directory, of the files of every entry.'''
+        if self._artifacts is None:
+            self._artifacts = ArtifactStore(self.shared_dir / 'blobs')
+        return self._artifacts
+
     def entry_dir(self, elem_id: str) -> Path:
         return bl.utils.ensure_dir(self.entries_dir / elem_id)
 
@@ -262,29 +466,105 @@ class Manager(
             self.entry_dir(elem_id) / self.key_names.workspace
         )
 
-    def _initialize_lookup_table(self) -> None:
-        self._lookup_table = {
-            self.key_names.entries: {}
+    def fingerprint(self, contents: Mapping) -> str:
+        '''Canonical hash of an entry's contents. Equivalent contents have equal fingerprints.'''
+        return self._description_fingerprinter(contents)
+
+    def _entry_fingerprint(self, entry: Mapping) -> str:
+        fingerprint = entry.get(self.key_names.fingerprint)
+        if fingerprint is None:
+            fingerprint = self.fingerprint(entry.get(self.key_names.elements, {}))
+        return fingerprint
+
+    def _fingerprinted(self, entry: Mapping[str, Any]) -> dict:
+        return {
+            **entry,
+            self.key_names.fingerprint: self.fingerprint(entry.get(self.key_names.elements, {}))
         }
-        self.save_lookup_table()
+
+    def migrate_fingerprints(self, recompute: bool = False) -> int:
+        '''Store the fingerprint of every entry that lacks one.
+
+        If *recompute*, every fingerprint is recomputed, which is needed after changing how
+        descriptions are encoded. Return the number of updated entries.
+        '''
+        self.load_lookup_table()
+
+        updated = {}
+        for elem_id, entry in self.entries.items():
+            if not recompute and self.key_names.fingerprint in entry:
+                continue
+
+            fingerprinted = self._fingerprinted(entry)
+            if fingerprinted != entry:
+                updated[elem_id] = fingerprinted
+
+        if updated:
+            self._table.update_entries(updated)
+        return len(updated)
+
+    def migrate_legacy_entry(self, contents: Mapping) -> Optional[str]:
+        '''Find the entry stored for *contents* with the legacy encoding and store them in the current one.
+
+        Objects defining *__json_encode__*, such as *Pack*s, used to be encoded without their data
+        (see *LegacyGenericJSONEncoder*), so entries stored back then no longer match their contents.
+        Such an entry is only migrated if it is the only one with the legacy fingerprint of
+        *contents*: entries differing only in the data of those objects cannot be told apart.
+        Return the id of the migrated entry, if any. *elem_id* calls this before allocating a new id.
+        '''
+        if self._legacy_fingerprinter is None:
+            return None
+
+        legacy_fingerprint = self._legacy_fingerprinter(contents)
+        if legacy_fingerprint == self.fingerprint(contents):
+            # the contents do not depend on the encoding change
+            return None
+
+        with self.transaction():
+            elem_id_candidates = tuple(self._table.ids_with_fingerprint(legacy_fingerprint))
+            if len(elem_id_candidates) != 1:
+                if elem_id_candidates:
+                    warnings.warn(
+                        f'entries {elem_id_candidates} were stored with the legacy encoding and cannot be'
+                        ' told apart, so none of them is migrated.'
+                    )
+                return None
+
+            elem_id = elem_id_candidates[0]
+            self[elem_id] = {**self[elem_id], self.key_names.elements: contents}
+
+        if self.verbose:
+            print('Migrated legacy entry', elem_id)
+        return elem_id
+
+    def transaction(self) -> ContextManager[LookupTable]:
+        '''Hold the lookup table so that no other process modifies it while in context.
+
+        Entries read inside a transaction are up to date, and modifications are persisted together
+        when the outermost transaction exits. Transactions may be nested.
+        '''
+        return self._table.transaction()
 
     def save_lookup_table(self) -> None:
-        self._table_saver(self._lookup_table, self._table_path)
+        self._table.flush()
 
     def load_lookup_table(
         self,
         raise_if_fails: bool = False
     ) -> None:
-        if not self._table_path.is_file():
-            self._initialize_lookup_table()
-        try:
-            self._lookup_table = self._table_loader(self._table_path)
-        except (FileNotFoundError, json.JSONDecodeError, OSError):
-            if raise_if_fails:
-                raise
-            else:
-                self._initialize_lookup_table()
-                self.load_lookup_table()
+        self._table.reload(raise_if_fails=raise_if_fails)
+
+    def export_lookup_table(self, path: PathType) -> None:
+        '''Write the lookup table to a human-readable JSON file.'''
+        self._table.export_json(path, saver=self._default_table_saver)
+
+    def import_lookup_table(self, path: PathType) -> int:
+        '''Insert the entries of a JSON lookup table, e.g. to move to another table backend.'''
+        return self._table.import_json(
+            path,
+            loader=self._default_table_loader,
+            fingerprinter=self.fingerprint
+        )
 
     def save_elem(self, elem: _ElemType, path: PathType) -> None:
         if self.save_method is None:
@@ -295,6 +575,8 @@ class Manager(
 
 
         path = bl.utils.ensure_parent(path)
+        self.invalidate_cached_elem(path)
+        self._detach_artifacts(path)
         self.save_method(elem, path)
 
     def load_elem(self, path: PathType) -> Tuple[bool, _ElemType]:
@@ -314,7 +596,7 @@ class Manager(
                 for elem_id in self.entries
             }
         else:
-            return self.entries.get(elem_id, {}).get(self.key_names.elements, {})
+            return self._table.get(elem_id, {}).get(self.key_names.elements, {})
 
     def metadata(self, elem_id: Optional[str] = None):
         if elem_id is None:
@@ -323,7 +605,7 @@ class Manager(
                 for elem_id in self.entries
             }
         else:
-            return self.entries.get(elem_id, {}).get(self.key_names.metadata, {})
+            return self._table.get(elem_id, {}).get(self.key_names.metadata, {})
 
     @overload
     def elem_creator(self, elem_id: None) -> dict:
@@ -395,14 +677,17 @@ class Manager(
 
     def new_elem_id(self) -> str:
         '''Return a elem id that does not exist yet
+
+        The id is only guaranteed to remain free if it is included in the same *transaction*.
         '''
-        indices = sorted(
-            mit.map_except(
-                self._parse_index,
-                self.entries.keys(),
-                ValueError, TypeError, KeyError, AttributeError
+        with self.transaction():
+            indices = sorted(
+                mit.map_except(
+                    self._parse_index,
+                    self.entries.keys(),
+                    ValueError, TypeError, KeyError, AttributeError
+                )
             )
-        )
         if indices:
             missing_elems = bl.utils.missing_ints(indices)
             index = mit.first(
@@ -529,12 +814,12 @@ class Manager(
         )
 
         elem_id_candidates = tuple(
-            bl.utils.extract_keys(
-                self.contents(),
-                value=contents,
-                cmp=self._description_comparer
-            )
+            self._table.ids_with_fingerprint(self.fingerprint(contents))
         )
+        if not elem_id_candidates:
+            legacy_id = self.migrate_legacy_entry(contents)
+            if legacy_id is not None:
+                elem_id_candidates = (legacy_id,)
         n_candidates = len(elem_id_candidates)
 
         if n_candidates == 0:
@@ -620,37 +905,306 @@ class Manager(
         raise ValueError('invalid *multiple_ids_handler* passed.')
 
     def _repeated_elems(self) -> Tuple[Dict[str, List[str]], List[str]]:
-        all_contents = self.contents().items()
-
-        repetition_dict = {
-            elem_id: sorted(
-                {
-                    other_id
-                    for other_id, other_contents in all_contents
-                    if other_id != elem_id and self._description_comparer(contents, other_contents)
-                },
-                key=self._parse_index
-            )
-            for elem_id, contents in all_contents
-        }
+        groups = self.duplicate_groups()
+        repetition_dict = {elem_id: [] for elem_id in self.entries}
+        for group in groups:
+            for elem_id in group:
+                repetition_dict[elem_id] = [other_id for other_id in group if other_id != elem_id]
 
         repeated = sorted(
-            {
-                x
-                for lst in repetition_dict.values()
-                for x in lst[1:]
-            },
+            (
+                elem_id
+                for group in groups
+                for elem_id in group[1:]
+            ),
             key=self._parse_index
         )
 
         return repetition_dict, repeated
 
+    def duplicate_groups(self) -> List[List[str]]:
+        '''Groups of ids of entries with equal fingerprints, sorted by index.
+
+        Only groups with more than one entry are returned.
+        '''
+        groups: Dict[str, List[str]] = {}
+        for elem_id, entry in self.entries.items():
+            groups.setdefault(self._entry_fingerprint(entry), []).append(elem_id)
+
+        return [
+            sorted(group, key=self._parse_index)
+            for group in groups.values()
+            if len(group) > 1
+        ]
+
+    def _stats_path(self, elem_id: str) -> Path:
+        return self.entry_dir(elem_id) / 'stats.json'
+
+    def _read_entry_stats(self, elem_id: str) -> dict:
+        path = self._stats_path(elem_id)
+        if not path.is_file():
+            return {}
+        try:
+            return bl.io.load_json(path)
+        except (json.JSONDecodeError, OSError):
+            return {}
+
+    def entry_stats(self, elem_id: str) -> dict:
+        '''Creation and access statistics of an entry, stored next to its element.
+
+        Accesses not yet written by *flush_entry_stats* are included.
+        '''
+        stats = self._read_entry_stats(elem_id)
+        with self._accesses_lock:
+            pending = self._pending_accesses.get(elem_id)
+        if pending is not None:
+            last_access, n_accesses = pending
+            stats['last_access'] = max(stats.get('last_access') or 0.0, last_access)
+            stats['n_accesses'] = stats.get('n_accesses', 0) + n_accesses
+        return stats
+
+    def _update_entry_stats(self, elem_id: str, n_new_accesses: int = 0, **stats) -> None:
+        path = self._stats_path(elem_id)
+        # other threads and processes update the same file: it is locked while read and modified,
+        # and replaced at once so that readers never see it partially written
+        with file_lock(path.with_name('stats.lock')):
+            current = self._read_entry_stats(elem_id)
+            if n_new_accesses:
+                stats['n_accesses'] = current.get('n_accesses', 0) + n_new_accesses
+
+            temp_path = path.with_name(f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+            try:
+                bl.io.save_json({**current, **stats}, temp_path)
+                os.replace(temp_path, path)
+            finally:
+                if temp_path.exists():
+                    temp_path.unlink()
+
+    def _record_access(self, elem_id: str) -> None:
+        with self._accesses_lock:
+            _, n_accesses = self._pending_accesses.get(elem_id, (0.0, 0))
+            self._pending_accesses[elem_id] = (time.time(), n_accesses + 1)
+            must_flush = time.monotonic() - self._accesses_flushed >= self.stats_flush_interval
+
+        if must_flush:
+            self.flush_entry_stats()
+
+    def flush_entry_stats(self) -> None:
+        '''Write the accesses recorded since the last flush to the statistics of their entries.'''
+        with self._accesses_lock:
+            pending, self._pending_accesses = self._pending_accesses, {}
+            self._accesses_flushed = time.monotonic()
+
+        for elem_id, (last_access, n_accesses) in pending.items():
+            if (self.entries_dir / elem_id).is_dir():
+                self._update_entry_stats(elem_id, n_new_accesses=n_accesses, last_access=last_access)
+
+    def _record_creation(self, elem_id: str, creation_time: float) -> None:
+        now = time.time()
+        self._update_entry_stats(
+            elem_id,
+            created=now,
+            last_access=now,
+            creation_time=creation_time,
+            evicted=False
+        )
+
+    def is_evicted(self, elem_id: str) -> bool:
+        return self.entry_stats(elem_id).get('evicted', False)
+
+    def entry_usage(self, elem_id: str) -> EntryUsage:
+        '''Disk usage and access statistics of the payload (element and workspace) of an entry.
+
+        Files hardlinked to other entries or to *artifacts* only count for their share of the space.
+        '''
+        stats = self.entry_stats(elem_id)
+        return self.EntryUsage(
+            elem_id=elem_id,
+            n_bytes=sum(
+                bl.utils.disk_usage(path, split_links=True)
+                for path in self._payload_paths(elem_id)
+            ),
+            created=stats.get('created'),
+            last_access=stats.get('last_access'),
+            n_accesses=stats.get('n_accesses', 0),
+            creation_time=stats.get('creation_time', 0.0),
+            evicted=stats.get('evicted', False)
+        )
+
+    def _payload_paths(self, elem_id: str) -> Tuple[Path, Path]:
+        return (
+            self.entry_dir(elem_id) / self.key_names.elements,
+            self.entry_dir(elem_id) / self.key_names.workspace
+        )
+
+    def _payload_disk_usage(self) -> int:
+        # hardlinks share their contents, so each file is counted once however many links it has
+        inodes = {}
+        roots = [path for elem_id in self.entries for path in self._payload_paths(elem_id)]
+        roots.append(self.shared_dir / 'blobs')
+        for root in roots:
+            if not root.exists():
+                continue
+            for path in [root] if root.is_file() else root.rglob('*'):
+                if path.is_file() and not path.is_symlink():
+                    stat = path.stat()
+                    inodes[stat.st_dev, stat.st_ino] = stat.st_size
+        return sum(inodes.values())
+
+    def evict(self, elem_id: str) -> int:
+        '''Remove the payload of an entry, keeping its description. Return the number of freed bytes.
+
+        The element is created again by *provide_elem* when it is next requested.
+        '''
+        n_bytes = self.entry_usage(elem_id).n_bytes
+        for path in self._payload_paths(elem_id):
+            self.invalidate_cached_elem(path)
+            if path.is_dir():
+                bl.utils.rmdir(path, recursive=True, missing_ok=True)
+            elif path.exists():
+                path.unlink()
+        self._update_entry_stats(elem_id, evicted=True)
+        return n_bytes
+
+    def _detach_artifacts(self, path: PathType) -> None:
+        # savers may overwrite files in place, which would also modify every hardlinked copy
+        if (self.shared_dir / 'blobs').is_dir():
+            self.artifacts.detach(path)
+
+    def dedup_entries(
+            self,
+            elem_ids: Optional[Iterable[str]] = None,
+            dry_run: bool = False
+    ) -> DedupReport:
+        '''Replace byte-identical files in entry elements by hardlinks to a single copy in *artifacts*.
+
+        Only elements are deduplicated: they are detached before being saved again, whereas
+        workspaces and other entry files may be rewritten in place by anyone holding their paths.
+        '''
+        if elem_ids is None:
+            elem_ids = self.entries
+
+        paths = [
+            path
+            for path in (self.entry_dir(elem_id) / self.key_names.elements for elem_id in elem_ids)
+            if path.exists()
+        ]
+        report = self.artifacts.dedup(paths, dry_run=dry_run)
+        if self.verbose:
+            print(report.describe())
+        return report
+
+    def gc(
+            self,
+            budget: Optional[int] = None,
+            policy: GCPolicy = GCPolicy.LRU,
+            evict_duplicates: bool = True,
+            dry_run: bool = False
+    ) -> GCReport:
+        '''Evict element payloads until they use at most *budget* bytes of disk.
+
+        Payloads of duplicate entries (those whose fingerprint equals that of an entry with a
+        lower index) go first if *evict_duplicates*. Then entries are evicted least recently used
+        first or, with *GCPolicy.VALUE*, least valuable first (see *EntryUsage.value*).
+        Descriptions are always kept. With *dry_run*, nothing is removed.
+        '''
+        usages = [self.entry_usage(elem_id) for elem_id in self.entries]
+        usage_dict = {usage.elem_id: usage for usage in usages}
+        n_bytes_before = sum(usage.n_bytes for usage in usages)
+        disk_usage_before = None if dry_run else self._payload_disk_usage()
+
+        duplicates = self.duplicate_groups()
+        candidates: List[Manager.EntryUsage] = []
+        if evict_duplicates:
+            candidates.extend(
+                usage_dict[elem_id]
+                for group in duplicates
+                for elem_id in group[1:]
+            )
+
+        if policy is self.GCPolicy.LRU:
+            def sort_key(usage: Manager.EntryUsage) -> tuple:
+                return (usage.last_access or 0.0, self._parse_index(usage.elem_id))
+        elif policy is self.GCPolicy.VALUE:
+            def sort_key(usage: Manager.EntryUsage) -> tuple:
+                return (usage.value, self._parse_index(usage.elem_id))
+        else:
+            raise ValueError(f'invalid *policy* passed: {policy}')
+
+        duplicate_ids = {usage.elem_id for usage in candidates}
+        n_duplicates = len(candidates)
+        candidates.extend(sorted(
+            (usage for usage in usages if usage.elem_id not in duplicate_ids),
+            key=sort_key
+        ))
+
+        evicted = []
+        n_bytes = n_bytes_before
+        for index, usage in enumerate(candidates):
+            over_budget = budget is not None and n_bytes > budget
+            if index >= n_duplicates and not over_budget:
+                break
+            if usage.n_bytes == 0:
+                continue
+
+            evicted.append(usage.elem_id)
+            n_bytes -= usage.n_bytes
+            if not dry_run:
+                self.evict(usage.elem_id)
+
+        # evicted files that were hardlinked to artifacts are only freed with the artifact
+        n_blob_bytes_freed = 0
+        if not dry_run and (self.shared_dir / 'blobs').is_dir():
+            n_blob_bytes_freed = self.artifacts.collect_garbage()
+
+        # dry runs can only estimate; otherwise the freed space is measured, without the unused artifacts
+        n_bytes_freed = n_bytes_before - n_bytes
+        if disk_usage_before is not None:
+            n_bytes_freed = disk_usage_before - self._payload_disk_usage() - n_blob_bytes_freed
+
+        report = self.GCReport(
+            usages=usages,
+            duplicates=duplicates,
+            evicted=evicted,
+            n_bytes_before=n_bytes_before,
+            n_bytes_freed=n_bytes_freed,
+            dry_run=dry_run,
+            n_blob_bytes_freed=n_blob_bytes_freed
+        )
+        if self.verbose:
+            print(report.describe())
+        return report
+
+    def _elem_id_from_path(self, path: PathType) -> Optional[str]:
+        path = bl.utils.ensure_resolved(path)
+        if path.parent.parent == bl.utils.ensure_resolved(self.entries_dir):
+            return path.parent.name
+        else:
+            return None
+
+    def invalidate_cached_elem(self, path: PathType) -> None:
+        '''Drop the element stored in *path* from the *element_cache*, if any.'''
+        if self.element_cache is None:
+            return
+
+        elem_id = self._elem_id_from_path(path)
+        if elem_id is not None:
+            self.element_cache.invalidate(elem_id)
+
     def _load_elem(
             self,
             path: PathType,
             raise_if_load_fails: bool
     ) -> Tuple[bool, _ElemType]:
+        elem_id = self._elem_id_from_path(path) if self.element_cache is not None else None
+        if elem_id is not None:
+            success, elem = self.element_cache.get(elem_id, path)
+            if success:
+                return success, elem
+
         success, elem = self.load_elem(path)
+        if success and elem_id is not None:
+            self.element_cache.put(elem_id, path, elem)
 
         if raise_if_load_fails and not success:
             raise RuntimeError('loading failed with *raise_if_load_fails*.')
@@ -666,18 +1220,81 @@ class Manager(
         if elem_ids is None:
             elem_ids = self.entries
 
-        self.load_lookup_table()
-
-        entries = self.entries
-        for elem_id in elem_ids:
-            old_entry = copy.deepcopy(entries[elem_id])
-            new_entry = updater(elem_id, old_entry)
+        with self.transaction():
+            entries = self.entries
+            new_entries = {}
+            for elem_id in elem_ids:
+                old_entry = copy.deepcopy(entries[elem_id])
+                new_entries[elem_id] = self._fingerprinted(updater(elem_id, old_entry))
 
-            self[elem_id] = new_entry
+            # a single write for all entries
+            self._table.update_entries(new_entries)
 
         if save:
             self.save_lookup_table()
 
+    def element(self, elem_id: str) -> Element:
+        '''Lazy handle to the element with id *elem_id*.'''
+        return self.Element(
+            elem_id,
+            self.elem_path(elem_id),
+            load_method=partial(self._load_elem, raise_if_load_fails=False),
+            save_method=self.save_elem,
+            entry=self[elem_id]
+        )
+
+    def _resolve_entry_path(self, entry: Mapping, path: str, default: Any) -> Any:
+        # paths may be relative to the entry or, for short, to its contents
+        value = resolve_dotted(entry, path, default)
+        if value is default:
+            value = resolve_dotted(entry.get(self.key_names.elements, {}), path, default)
+        return value
+
+    def index(self, path: str) -> EntryIndex:
+        '''Secondary index of the entries by the value at the dotted *path*.
+
+        Indexes are built on first use and kept until the lookup table is modified.
+        '''
+        revision = self._table.revision()
+        if revision is None or revision != self._indexes_revision:
+            self._indexes = {}
+            self._indexes_revision = revision
+
+        if path not in self._indexes:
+            self._indexes[path] = EntryIndex(path, self.entries, resolver=self._resolve_entry_path)
+        return self._indexes[path]
+
+    def query(
+            self,
+            conditions: Optional[Mapping[str, Any]] = None,
+            **kwargs
+    ) -> List[Element]:
+        '''Lazy handles to the elements whose entries satisfy every condition, sorted by id.
+
+        Conditions map dotted paths, relative to the entry or to its contents, to either the
+        expected value or an *Interval* of accepted values. For instance,
+
+        >>> manager.query({
+        ...     'creator': 'LinearModel',
+        ...     'creator_params.kwargs.dataset_size': bl.utils.Interval(lower=1000),
+        ...     'metadata.path': 'entries/0.data/element'
+        ... })
+
+        Keyword arguments are conditions on paths without dots. Elements are not loaded until
+        their *value* is requested.
+        '''
+        conditions = {**(conditions or {}), **kwargs}
+
+        if conditions:
+            elem_ids = select_entries(self.index, conditions)
+        else:
+            elem_ids = self.entries.keys()
+
+        return [
+            self.element(elem_id)
+            for elem_id in sorted(elem_ids, key=self._parse_index)
+        ]
+
     def retrieve_elems(
             self,
             entry_pred: Optional[Callable[[Mapping], bool]] = None
@@ -729,23 +1346,116 @@ class Manager(
             print('Providing entry for contents:')
             pprint.pprint(contents)
 
-        elem_id = self.elem_id(
-            contents=contents,
-            missing_ok=missing_ok
-        )
-        path = self.elem_path(elem_id)
-        elem_rel_path = bl.utils.relative_path(self.entries_dir, path)
+        # looking the id up and including the entry must be atomic, or two processes providing the
+        # same contents could both miss it and include it twice
+        with self.transaction():
+            elem_id = self.elem_id(
+                contents=contents,
+                missing_ok=missing_ok
+            )
+            path = self.elem_path(elem_id)
+            elem_rel_path = bl.utils.relative_path(self.entries_dir, path)
 
-        entry = self._resolve_entry(
-            contents=contents,
-            path=elem_rel_path
-        )
+            entry = self._resolve_entry(
+                contents=contents,
+                path=elem_rel_path
+            )
 
-        if include:
-            self[elem_id] = entry
+            if include:
+                self[elem_id] = entry
 
         return elem_id
 
+    def provide_elem_async(
+            self,
+            elem_id: Optional[str] = None,
+            contents: Optional[Mapping] = None,
+            creator: Union[object, Creator[_ElemType]] = _sentinel,
+            creator_description: Pack = Pack(),
+            post_processor: Optional[Union[object, Transformer[_ElemType, _PostProcessedElemType]]] = _sentinel,
+            post_processor_description: Pack = Pack(),
+            **kwargs
+    ) -> Future:
+        '''Start providing an element in the *executor* and return a future of it.
+
+        The entry is allocated right away, so ids are the same as with *provide_elem*. Concurrent
+        requests for the same entry share the same future. Other keyword arguments are passed to
+        *provide_elem*. With a process pool, this *Manager*, the creator, the post-processor and
+        the element must be picklable.
+        '''
+        if creator is _sentinel:
+            creator = self.creator
+        if post_processor is _sentinel:
+            post_processor = self.post_processor
+
+        if elem_id is None:
+            elem_id = self.provide_entry(
+                contents=contents,
+                creator=creator,
+                creator_description=creator_description,
+                post_processor=post_processor,
+                post_processor_description=post_processor_description,
+                include=True,
+                missing_ok=True
+            )
+        elif elem_id not in self:
+            raise ValueError(f'passed a non-existing id explicitly: {elem_id}')
+
+        with self._pending_lock:
+            future = self._pending.get(elem_id)
+            if future is not None:
+                return future
+
+            future = self.executor.submit(
+                self.provide_elem,
+                elem_id=elem_id,
+                creator=creator,
+                post_processor=post_processor,
+                **kwargs
+            )
+            self._pending[elem_id] = future
+
+        def _forget(future: Future) -> None:
+            with self._pending_lock:
+                if self._pending.get(elem_id) is future:
+                    del self._pending[elem_id]
+        future.add_done_callback(_forget)
+
+        return future
+
+    def prefetch(
+            self,
+            descriptions: Iterable[Mapping[str, Any]],
+            depth: int = 1,
+            **kwargs
+    ) -> Iterator[Union[_ElemType, _PostProcessedElemType]]:
+        '''Provide the elements described by *descriptions*, in order, preparing the next ones in the background.
+
+        Each description is a mapping of keyword arguments to *provide_elem_async*, in addition to
+        the common *kwargs*. While an element is in use, up to *depth* upcoming ones are being provided.
+        '''
+        if depth < 0:
+            raise ValueError(f'*depth* must be non-negative. Got {depth}.')
+
+        descriptions = iter(descriptions)
+        futures = deque()
+
+        def _submit_next() -> bool:
+            description = next(descriptions, None)
+            if description is None:
+                return False
+            futures.append(self.provide_elem_async(**{**kwargs, **description}))
+            return True
+
+        for _ in range(depth + 1):
+            if not _submit_next():
+                break
+
+        while futures:
+            elem = futures.popleft().result()
+            _submit_next()
+            yield elem
+
     def provide_elem(
             self,
             elem_id: Optional[str] = None,
@@ -834,18 +1544,29 @@ class Manager(
 
             success = False
             if must_load:
-                success, elem = _load(elem_id, path, raise_if_load_fails=raise_if_load_fails)
+                # evicted elements are expected to be missing, so they are silently created again
+                success, elem = _load(
+                    elem_id,
+                    path,
+                    raise_if_load_fails=raise_if_load_fails and not self.is_evicted(elem_id)
+                )
+                if success:
+                    self._record_access(elem_id)
 
             if not success:
                 if self.verbose:
                     print('Couldn\'t load', elem_id)
                     print('Creating', elem_id)
-                elem = creator(creator_params)
+                with bl.utils.elapsed_timer() as timer:
+                    elem = creator(creator_params)
+                self._record_creation(elem_id, timer.duration)
 
                 if must_save:
                     if callable(save):
                         if self.verbose:
                             print('Saving', elem_id, 'using custom saver')
+                        self.invalidate_cached_elem(path)
+                        self._detach_artifacts(path)
                         save(elem, path)
                     else:
                         if self.verbose:
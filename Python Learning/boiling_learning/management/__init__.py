@@ -1,4 +1,8 @@
 # from boiling_learning.management.Mirror import *
+from boiling_learning.management.ArtifactStore import *
+from boiling_learning.management.ElementCache import *
+from boiling_learning.management.EntryIndex import *
+from boiling_learning.management.LookupTable import *
 from boiling_learning.management.Manager import *
 # from boiling_learning.management.Option import *
 from boiling_learning.management.Persistent import *
@@ -1,11 +1,53 @@
-from typing import Optional
+from pathlib import Path
+from typing import (
+    Callable,
+    Optional
+)
 
 import modin.pandas as pd
 
 from boiling_learning.utils import utils as bl_utils
+from boiling_learning.utils.functional import Pack
+from boiling_learning.utils.pipeline import (
+    Node,
+    Pipeline
+)
 from boiling_learning.utils.utils import (PathType, VerboseType)
 from boiling_learning.preprocessing.ExperimentVideo import ExperimentVideo
 from boiling_learning.preprocessing.ImageDataset import ImageDataset
+from boiling_learning.preprocessing.video import convert_video
+
+
+# pipeline steps are module-level functions so that they can run in other processes
+def _convert_video_step(source_path: PathType, dest_path: PathType, verbose: VerboseType) -> None:
+    convert_video(source_path, dest_path, overwrite=True, verbose=verbose)
+
+
+def _use_video_step(experiment_video: ExperimentVideo, video_path: Path) -> None:
+    experiment_video.video_path = video_path
+
+
+def _use_videos_dir_step(case: 'Case', videos_dir: Path) -> None:
+    case.videos_dir = videos_dir
+
+
+def _extract_audio_step(experiment_video: ExperimentVideo, verbose: VerboseType) -> None:
+    experiment_video.extract_audio(overwrite=True, verbose=verbose)
+
+
+def _extract_frames_step(experiment_video: ExperimentVideo, verbose: VerboseType) -> None:
+    experiment_video.extract_frames(overwrite=True, verbose=verbose)
+
+
+def _dataframe_step(
+        experiment_video: ExperimentVideo,
+        source_df_path: Optional[PathType],
+        source_df_loader: Callable[[PathType], pd.DataFrame]
+) -> None:
+    experiment_video.make_dataframe(recalculate=True)
+    if source_df_path is not None:
+        experiment_video.sync_time_series(source_df_loader(source_df_path), inplace=True)
+    experiment_video.save_df(overwrite=True)
 
 
 class Case(ImageDataset):
@@ -127,3 +169,128 @@ class Case(ImageDataset):
     ) -> None:
         for experiment_video in self.values():
             experiment_video.sync_time_series(source_df, inplace=True)
+
+    def pipeline(
+            self,
+            state_path: Optional[PathType] = None,
+            new_suffix: Optional[str] = None,
+            new_videos_dir: Optional[PathType] = None,
+            extract_audio: bool = True,
+            extract_frames: bool = True,
+            source_df_path: Optional[PathType] = None,
+            source_df_loader: Callable[[PathType], pd.DataFrame] = pd.read_csv,
+            verbose: VerboseType = False
+    ) -> Pipeline:
+        '''Incremental pipeline of the preprocessing steps of every video in this case.
+
+        For each video, the steps are: conversion to *new_suffix* in *new_videos_dir*, if given;
+        extraction of audio and frames; and creation of the dataframe, synchronized with the time
+        series in *source_df_path*, if given. Video data must be set beforehand. The state of the
+        pipeline is kept in *state_path*, by default `pipeline.json` in the case directory. Further
+        steps, such as creating datasets, can be added with *Pipeline.add*.
+
+        Videos, and the *videos_dir* of the case, are switched to the converted ones only when their
+        conversion succeeded, which is either already the case or happens when the pipeline runs.
+        '''
+        if state_path is None:
+            state_path = self.path / 'pipeline.json'
+        if (new_suffix is None) != (new_videos_dir is None):
+            raise ValueError('*new_suffix* and *new_videos_dir* must be given together.')
+        if new_suffix is not None and not new_suffix.startswith('.'):
+            raise ValueError('new_suffix is expected to start with a dot (\'.\')')
+
+        pipeline = Pipeline(state_path)
+        if new_videos_dir is not None:
+            new_videos_dir = bl_utils.ensure_dir(new_videos_dir, root=self.path)
+
+        state = pipeline.load_state()
+        use_nodes = []
+        for experiment_video in self.values():
+            name = experiment_video.name
+            video_path = experiment_video.video_path
+            # nodes reading the video run after it is switched to the converted one
+            after = ()
+
+            if new_suffix is not None:
+                tail = video_path.relative_to(self.videos_dir)
+                dest_path = bl_utils.ensure_resolved((new_videos_dir / tail).with_suffix(new_suffix))
+                if dest_path != video_path:
+                    convert_node = pipeline.add(Node(
+                        f'convert:{name}',
+                        _convert_video_step,
+                        Pack((video_path, dest_path, verbose)),
+                        inputs=(video_path,),
+                        outputs=(dest_path,),
+                        description={'suffix': new_suffix}
+                    ))
+                    video_path = dest_path
+
+                    # the video is switched only once converted, so that a failed conversion
+                    # leaves it untouched
+                    if pipeline.stale_reasons(convert_node.name, state):
+                        use_node = pipeline.add(Node(
+                            f'use_converted:{name}',
+                            _use_video_step,
+                            Pack((experiment_video, dest_path)),
+                            inputs=(dest_path,),
+                            local=True
+                        ))
+                        use_nodes.append(use_node.name)
+                        after = (use_node.name,)
+                    else:
+                        experiment_video.video_path = dest_path
+
+            if extract_audio:
+                pipeline.add(Node(
+                    f'audio:{name}',
+                    _extract_audio_step,
+                    Pack((experiment_video, verbose)),
+                    inputs=(video_path,),
+                    outputs=(experiment_video.audio_path,),
+                    after=after
+                ))
+
+            if extract_frames:
+                pipeline.add(Node(
+                    f'frames:{name}',
+                    _extract_frames_step,
+                    Pack((experiment_video, verbose)),
+                    inputs=(video_path,),
+                    outputs=(experiment_video.frames_path,),
+                    description={'suffix': experiment_video.frames_suffix},
+                    after=after
+                ))
+
+            dataframe_inputs = [video_path]
+            if extract_frames:
+                dataframe_inputs.append(experiment_video.frames_path)
+            if source_df_path is not None:
+                dataframe_inputs.append(bl_utils.ensure_resolved(source_df_path))
+            pipeline.add(Node(
+                f'dataframe:{name}',
+                _dataframe_step,
+                Pack((experiment_video, source_df_path, source_df_loader)),
+                inputs=tuple(dataframe_inputs),
+                outputs=(experiment_video.df_path,),
+                # data is set in memory, so it is part of the description instead of an input
+                description={
+                    'data': experiment_video.data,
+                    'column_names': experiment_video.column_names
+                },
+                after=after
+            ))
+
+        if new_videos_dir is not None:
+            if use_nodes:
+                pipeline.add(Node(
+                    'use_converted_videos_dir',
+                    _use_videos_dir_step,
+                    Pack((self, new_videos_dir)),
+                    description={'videos_dir': str(new_videos_dir)},
+                    after=tuple(use_nodes),
+                    local=True
+                ))
+            else:
+                self.videos_dir = new_videos_dir
+
+        return pipeline
@@ -44,6 +44,12 @@ from boiling_learning.preprocessing.video import (
 )
 
 
+def _read_frame_file(path: tf.Tensor, dtype: tf.DType) -> tf.Tensor:
+    # unlike *io.process_path*, frames keep the channels and the [0, 255] range of the video
+    frame = tf.io.decode_image(tf.io.read_file(path), expand_animations=False)
+    return tf.cast(frame, dtype)
+
+
 class ExperimentVideo:
     @dataclass
     class VideoData:
@@ -65,6 +71,71 @@ class ExperimentVideo:
         ref_index: Optional[str] = None
         ref_elapsed_time: Optional[str] = None
 
+    @dataclass(frozen=True)
+    class Query:
+        '''Selection of frames by video categories and dataframe columns.
+
+        Conditions map a category or column name to either a single value, a collection
+        of accepted values or a *bl_utils.Interval*. Category conditions are evaluated on
+        the video data only, so non-matching videos are skipped without building their
+        dataframes. Column conditions are evaluated on the dataframes, so only matching
+        frames are decoded.
+        '''
+        categories: Mapping[str, Any] = dataclasses.field(default_factory=dict)
+        columns: Mapping[str, Any] = dataclasses.field(default_factory=dict)
+
+        @staticmethod
+        def _matches(value, condition) -> bool:
+            if isinstance(condition, bl_utils.Interval):
+                return value in condition
+            elif isinstance(condition, (list, tuple, set, frozenset)):
+                return value in condition
+            else:
+                return value == condition
+
+        @staticmethod
+        def _mask(values: pd.Series, condition) -> pd.Series:
+            if isinstance(condition, bl_utils.Interval):
+                return condition.mask(values)
+            elif isinstance(condition, (list, tuple, set, frozenset)):
+                return values.isin(list(condition))
+            else:
+                return values == condition
+
+        @staticmethod
+        def _describe_condition(condition):
+            if isinstance(condition, bl_utils.Interval):
+                return {'interval': dataclasses.asdict(condition)}
+            elif isinstance(condition, (set, frozenset)):
+                return {'any_of': sorted(condition, key=repr)}
+            elif isinstance(condition, (list, tuple)):
+                return {'any_of': list(condition)}
+            else:
+                return condition
+
+        def matches_video(self, data: Optional['ExperimentVideo.VideoData']) -> bool:
+            if not self.categories:
+                return True
+            if data is None:
+                return False
+
+            return all(
+                key in data.categories and self._matches(data.categories[key], condition)
+                for key, condition in self.categories.items()
+            )
+
+        def frame_mask(self, df: pd.DataFrame) -> pd.Series:
+            mask = pd.Series(True, index=df.index)
+            for column, condition in self.columns.items():
+                mask &= self._mask(df[column], condition)
+            return mask
+
+        def describe(self) -> dict:
+            return {
+                'categories': funcy.walk_values(self._describe_condition, self.categories),
+                'columns': funcy.walk_values(self._describe_condition, self.columns)
+            }
+
     @dataclass(frozen=True)
     class VideoDataKeys:
         categories: str = 'categories'
@@ -221,10 +292,31 @@ class ExperimentVideo:
             ')'
         ))
 
+    def __getstate__(self) -> dict:
+        # open videos and datasets cannot be pickled, e.g. to run pipeline steps in other processes
+        state = self.__dict__.copy()
+        state['video'] = None
+        state['_is_open_video'] = False
+        state['ds'] = None
+        return state
+
     @property
     def name(self) -> str:
         return self._name
 
+    def describe(self) -> dict:
+        '''Identify this video by name and by the state of its video file.
+
+        The description changes whenever the video file is replaced or modified.
+        '''
+        stat = self.video_path.stat()
+        return {
+            'name': self.name,
+            'video_path': str(self.video_path),
+            'mtime': stat.st_mtime,
+            'size': stat.st_size
+        }
+
     def open_video(self) -> None:
         # decord.bridge.set_bridge('tensorflow')
         if not self._is_open_video:
@@ -351,6 +443,22 @@ class ExperimentVideo:
             raise ValueError('*frames_path* is not defined yet.')
         return self.frames_path.rglob('*' + self.frames_suffix)
 
+    def frame_paths(self, indices: Iterable[int]) -> Optional[List[Path]]:
+        '''Paths of the extracted frame files of *indices*, or *None* if any of them was not extracted.'''
+        if self.frames_path is None or not self.frames_path.is_dir():
+            return None
+
+        paths = {path.stem: path for path in self.glob_frames()}
+        try:
+            return [paths[self.frame_stem(index)] for index in indices]
+        except KeyError:
+            return None
+
+    def _read_frames(self) -> Iterator[np.ndarray]:
+        # each dataset reads through its own reader: a shared one would be seeked concurrently
+        with pims.Video(str(self.video_path)) as video:
+            yield from video
+
     def set_video_data(
             self,
             data: Union[Mapping[str, Any], VideoData],
@@ -614,15 +722,31 @@ class ExperimentVideo:
         # if erase: # Python 3.8 only
         #     old_path.unlink(missing_ok=True)
 
-    def frames_to_tensor(self, save: bool = False, overwrite: bool = False) -> tf.data.Dataset:
+    def frames_to_tensor(
+            self,
+            save: bool = False,
+            overwrite: bool = False,
+            indices: Optional[Iterable[int]] = None,
+            dtype: tf.DType = tf.float32
+    ) -> tf.data.Dataset:
+        '''Dataset of the frames in this video, with values in [0, 255] and dtype *dtype*.
+
+        Passing *dtype*=tf.uint8 keeps frames with the same number of bytes as the video.
+
+        If *indices* is given, only those frames are read, in the given order, from the extracted
+        frame files if they exist. Otherwise, *indices* must be increasing, and the frames are
+        selected while reading the saved frames tensor or, failing that, the video sequentially.
+        '''
+        if indices is not None:
+            return self._selected_frames(tuple(indices), dtype)
+
         if self.frames_tensor_path is None:
             raise ValueError('*frames_tensor_path* is not defined yet.')
 
-        if overwrite or not self.frames_tensor_path.is_file():
-            self.open_video()
+        if overwrite or not self.frames_tensor_path.is_dir():
             frames = tf.data.Dataset.from_generator(
-                lambda: self.video,
-                tf.float32
+                self._read_frames,
+                dtype
             )
 
             if save:
@@ -630,28 +754,128 @@ class ExperimentVideo:
 
             return frames
         else:
-            return load_dataset(self.frames_tensor_path)
+            frames = load_dataset(self.frames_tensor_path)
+            if frames.element_spec.dtype != dtype:
+                frames = frames.map(lambda frame: tf.cast(frame, dtype))
+            return frames
+
+    def _selected_frames(self, indices: Tuple[int, ...], dtype: tf.DType) -> tf.data.Dataset:
+        frame_paths = self.frame_paths(indices)
+        if frame_paths is not None:
+            return tf.data.Dataset.from_tensor_slices(
+                tf.constant(list(map(str, frame_paths)), dtype=tf.string)
+            ).map(
+                lambda path: _read_frame_file(path, dtype),
+                num_parallel_calls=tf.data.experimental.AUTOTUNE
+            )
+
+        if any(previous >= index for previous, index in zip(indices, indices[1:])):
+            raise ValueError(
+                f'frames of {self.name} must be extracted to {self.frames_path} to be read in any order.'
+            )
+
+        if indices and self.frames_tensor_path is not None and self.frames_tensor_path.is_dir():
+            last_index = indices[-1]
+            is_selected = np.zeros(last_index + 1, dtype=bool)
+            is_selected[list(indices)] = True
+            is_selected = tf.constant(is_selected)
+
+            frames = load_dataset(self.frames_tensor_path).take(last_index + 1).enumerate()
+            frames = frames.filter(lambda index, frame: is_selected[index])
+            return frames.map(lambda index, frame: tf.cast(frame, dtype))
+
+        def _read_selected() -> Iterator[np.ndarray]:
+            selected = iter(indices)
+            next_index = next(selected, None)
+            if next_index is None:
+                return
+
+            for index, frame in enumerate(self._read_frames()):
+                if index == next_index:
+                    yield frame
+                    next_index = next(selected, None)
+                    if next_index is None:
+                        break
+
+        return tf.data.Dataset.from_generator(_read_selected, dtype)
+
+    def query_indices(self, query: 'ExperimentVideo.Query') -> List[int]:
+        '''Sorted indices of the frames matching *query*, computed before decoding any frame.'''
+        if not query.matches_video(self.data):
+            return []
+
+        df = self.make_dataframe(recalculate=False)
+        if query.columns:
+            df = self.convert_dataframe_type(df)
+            df = df[query.frame_mask(df)]
+        return sorted(df[self.column_names.index].tolist())
 
     def as_tf_dataset(
             self,
             select_columns: Optional[Union[str, List[str]]] = None,
             save: bool = False,
-            inplace: bool = False
+            inplace: bool = False,
+            indices: Optional[Iterable[int]] = None,
+            shuffle: bool = False,
+            seed: Optional[int] = None,
+            dtype: tf.DType = tf.float32,
+            query: Optional['ExperimentVideo.Query'] = None
     ) -> tf.data.Dataset:
+        '''Build a dataset of (frame, data) pairs, with frames of dtype *dtype*.
+
+        If *indices* is given, only the corresponding frames are decoded, in the given order.
+        If *query* is given, only the frames matching it are decoded.
+        If *shuffle* is True, the paths of the extracted frame files and the data rows are shuffled
+        before decoding, with a new order in every iteration. A global shuffle then only costs memory
+        proportional to the number of frames, not to their size in pixels. Frames must have been
+        extracted (see *extract_frames*), since random access to the video itself is slow.
+        '''
         # See <https://www.tensorflow.org/tutorials/load_data/pandas_dataframe>
 
+        if query is not None:
+            matching = self.query_indices(query)
+            if indices is None:
+                indices = matching
+            else:
+                matching = frozenset(matching)
+                indices = [index for index in indices if index in matching]
+
         df = self.make_dataframe(recalculate=False)
         df = self.convert_dataframe_type(df)
         df = df.sort_values(by=self.column_names.index)
 
+        if indices is not None:
+            indices = tuple(indices)
+            df = df.set_index(self.column_names.index, drop=False).loc[list(indices)]
+            df = df.reset_index(drop=True)
+
+        frame_indices = tuple(df[self.column_names.index]) if indices is None else indices
+
         if select_columns is not None:
             df = df[select_columns]
 
-        ds_img = self.frames_to_tensor(overwrite=False, save=save)
         ds_data = tf.data.Dataset.from_tensor_slices(
             df.to_dict('list')
         )
-        ds = tf.data.Dataset.zip((ds_img, ds_data))
+
+        if shuffle:
+            frame_paths = self.frame_paths(frame_indices)
+            if frame_paths is None:
+                raise ValueError(
+                    f'frames of {self.name} must be extracted to {self.frames_path} before shuffling.'
+                )
+
+            ds_path = tf.data.Dataset.from_tensor_slices(list(map(str, frame_paths)))
+            ds = tf.data.Dataset.zip((ds_path, ds_data))
+            # shuffle buffers must not be empty, even for videos without frames
+            ds = ds.shuffle(max(len(frame_paths), 1), seed=seed, reshuffle_each_iteration=True)
+            ds = ds.map(
+                lambda path, data: (_read_frame_file(path, dtype), data),
+                num_parallel_calls=tf.data.experimental.AUTOTUNE
+            )
+        else:
+            ds_img = self.frames_to_tensor(overwrite=False, save=save, indices=indices, dtype=dtype)
+            ds = tf.data.Dataset.zip((ds_img, ds_data))
 
         if inplace:
             self.ds = ds
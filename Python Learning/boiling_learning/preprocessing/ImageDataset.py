@@ -14,6 +14,7 @@ from typing import (
     List,
     Mapping,
     Optional,
+    Sequence,
     Tuple,
     Type,
     Union,
@@ -41,6 +42,7 @@ class ImageDataset(typing.MutableMapping[str, ExperimentVideo]):
     VideoData: Type[ExperimentVideo.VideoData] = ExperimentVideo.VideoData
     DataFrameColumnNames: Type[ExperimentVideo.DataFrameColumnNames] = ExperimentVideo.DataFrameColumnNames
     DataFrameColumnTypes: Type[ExperimentVideo.DataFrameColumnTypes] = ExperimentVideo.DataFrameColumnTypes
+    Query: Type[ExperimentVideo.Query] = ExperimentVideo.Query
 
     @dataclass(frozen=True)
     class VideoDataKeys(ExperimentVideo.VideoDataKeys):
@@ -417,25 +419,83 @@ class ImageDataset(typing.MutableMapping[str, ExperimentVideo]):
     def as_tf_dataset(
             self,
             select_columns: Optional[Union[str, List[str]]] = None,
-            inplace: bool = False
+            inplace: bool = False,
+            weights: Optional[Sequence[float]] = None,
+            seed: Optional[int] = None,
+            shuffle: bool = False,
+            query: Optional[ExperimentVideo.Query] = None
     ) -> tf.data.Dataset:
-        datasets = collections.deque(map(
-            operator.methodcaller('as_tf_dataset', select_columns, inplace=inplace),
-            self.values()
-        ))
+        '''Join the datasets of all experiment videos.
+
+        If *weights* (one per experiment video) are given, the datasets are randomly
+        interleaved with those sampling weights instead of being concatenated. If *shuffle*
+        is True, each experiment video shuffles its frame indices before decoding. If *query*
+        is given, only the matching frames of the matching experiment videos are decoded.
+        '''
+        if weights is not None and len(weights) != len(self):
+            raise ValueError('there must be exactly one weight per experiment video.')
+
+        indices = None if query is None else self.query_indices(query)
+
+        datasets = collections.deque()
+        selected_weights = []
+        for position, (name, experiment_video) in enumerate(self.items()):
+            if indices is not None and name not in indices:
+                continue
+
+            datasets.append(experiment_video.as_tf_dataset(
+                select_columns,
+                inplace=inplace,
+                indices=None if indices is None else indices[name],
+                shuffle=shuffle,
+                seed=seed
+            ))
+            if weights is not None:
+                selected_weights.append(weights[position])
 
         if not datasets:
             raise ValueError('resulting tensorflow dataset is empty.')
 
-        ds = datasets.popleft()
-        for dataset in datasets:
-            ds = ds.concatenate(dataset)
+        if weights is not None:
+            # imported here because boiling_learning.datasets depends on this module
+            from boiling_learning.datasets.datasets import tf_interleave
+
+            ds = tf_interleave(datasets, weights=selected_weights, seed=seed)
+        else:
+            ds = datasets.popleft()
+            for dataset in datasets:
+                ds = ds.concatenate(dataset)
 
         if inplace:
             self.ds = ds
 
         return ds
 
+    def query_indices(self, query: ExperimentVideo.Query) -> Dict[str, List[int]]:
+        '''Indices of the frames matching *query*, for each experiment video with any match.'''
+        indices = {
+            name: experiment_video.query_indices(query)
+            for name, experiment_video in self.items()
+        }
+        return funcy.compact(indices)
+
+    def query(
+            self,
+            query: ExperimentVideo.Query,
+            name: Optional[str] = None
+    ) -> 'ImageDataset':
+        '''New ImageDataset with the experiment videos that have frames matching *query*.'''
+        img_ds = ImageDataset(
+            self.name if name is None else name,
+            self.column_names,
+            self.column_types
+        )
+        img_ds.add(*(
+            self[video_name]
+            for video_name in self.query_indices(query)
+        ))
+        return img_ds
+
     def as_tf_dataset_dict(
             self,
             select_columns: Optional[Union[str, List[str]]] = None
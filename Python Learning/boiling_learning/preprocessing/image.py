@@ -7,21 +7,45 @@ from typing import (
     Union
 )
 
-import numpy as np
-from skimage.transform import AffineTransform, warp
 import tensorflow as tf
 
+from boiling_learning.preprocessing.transformers import execution_mode
+
 T = TypeVar('T')
 ImageType = Any # something convertible to tf.Tensor
+SizeType = Union[int, tf.Tensor]
+
+# spatial axes are counted from the end so that the functions below accept both
+# single images (height, width, channels) and batches (batch, height, width, channels)
+_HEIGHT_AXIS = -3
+_WIDTH_AXIS = -2
+
+
+def _is_batch(image: ImageType) -> bool:
+    return len(image.shape) == 4
+
+
+def _image_dim(image: ImageType, axis: int) -> SizeType:
+    # fall back to the dynamic shape when the static one is unknown, e.g. inside a traced graph
+    dim = image.shape[axis]
+    if dim is None:
+        return tf.shape(image)[axis]
+    else:
+        return dim
 
 
-def _ratio_to_size(image: ImageType, x: Optional[Union[int, float]], axis: int) -> Optional[int]:
+def _ratio_to_size(image: ImageType, x: Optional[Union[int, float]], axis: int) -> Optional[SizeType]:
     if isinstance(x, float):
-        return int(x * image.shape[axis])
+        dim = _image_dim(image, axis)
+        if isinstance(dim, int):
+            return int(x * dim)
+        else:
+            return tf.cast(x * tf.cast(dim, tf.float32), tf.int32)
     else:
         return x
 
 
+@execution_mode(graph_safe=True, batchable=True)
 def crop(
         image: ImageType,
         left: Optional[Union[int, float]] = None,
@@ -36,12 +60,12 @@ def crop(
     if (top, bottom, height).count(None) != 1:
         raise ValueError('exactly one of *top*, *bottom* and *height* must be None')
 
-    left = _ratio_to_size(image, left, axis=1)
-    right = _ratio_to_size(image, right, axis=1)
-    width = _ratio_to_size(image, width, axis=1)
-    top = _ratio_to_size(image, top, axis=0)
-    bottom = _ratio_to_size(image, bottom, axis=0)
-    height = _ratio_to_size(image, height, axis=0)
+    left = _ratio_to_size(image, left, axis=_WIDTH_AXIS)
+    right = _ratio_to_size(image, right, axis=_WIDTH_AXIS)
+    width = _ratio_to_size(image, width, axis=_WIDTH_AXIS)
+    top = _ratio_to_size(image, top, axis=_HEIGHT_AXIS)
+    bottom = _ratio_to_size(image, bottom, axis=_HEIGHT_AXIS)
+    height = _ratio_to_size(image, height, axis=_HEIGHT_AXIS)
 
     if top is None:
         top = bottom - height
@@ -62,6 +86,7 @@ def crop(
     )
 
 
+@execution_mode(graph_safe=True, batchable=True)
 def shrink(
         image: ImageType,
         left: Optional[Union[int, float]] = None,
@@ -76,22 +101,22 @@ def shrink(
     if (top, bottom, height).count(None) != 1:
         raise ValueError('exactly one of *top*, *bottom* and *height* must be None')
 
-    left = _ratio_to_size(image, left, axis=1)
-    right = _ratio_to_size(image, right, axis=1)
-    width = _ratio_to_size(image, width, axis=1)
-    top = _ratio_to_size(image, top, axis=0)
-    bottom = _ratio_to_size(image, bottom, axis=0)
-    height = _ratio_to_size(image, height, axis=0)
+    left = _ratio_to_size(image, left, axis=_WIDTH_AXIS)
+    right = _ratio_to_size(image, right, axis=_WIDTH_AXIS)
+    width = _ratio_to_size(image, width, axis=_WIDTH_AXIS)
+    top = _ratio_to_size(image, top, axis=_HEIGHT_AXIS)
+    bottom = _ratio_to_size(image, bottom, axis=_HEIGHT_AXIS)
+    height = _ratio_to_size(image, height, axis=_HEIGHT_AXIS)
 
     if top is None:
-        top = image.shape[0] - (bottom + height)
+        top = _image_dim(image, _HEIGHT_AXIS) - (bottom + height)
     if height is None:
-        height = image.shape[0] - (bottom + top)
+        height = _image_dim(image, _HEIGHT_AXIS) - (bottom + top)
 
     if left is None:
-        left = image.shape[1] - (right + width)
+        left = _image_dim(image, _WIDTH_AXIS) - (right + width)
     if width is None:
-        width = image.shape[1] - (right + left)
+        width = _image_dim(image, _WIDTH_AXIS) - (right + left)
 
     return tf.image.crop_to_bounding_box(
         image,
@@ -102,38 +127,34 @@ def shrink(
     )
 
 
+@execution_mode(graph_safe=True, batchable=True)
 def shift(
-        image: np.ndarray,
+        image: ImageType,
         shift_left: Optional[Union[int, float]] = None,
         shift_right: Optional[Union[int, float]] = None,
         shift_up: Optional[Union[int, float]] = None,
         shift_down: Optional[Union[int, float]] = None
-) -> np.ndarray:
-    # source: <https://stackoverflow.com/questions/47961447/shift-image-in-scikit-image-python>
-
+) -> tf.Tensor:
     if (shift_left, shift_right).count(None) != 1:
         raise ValueError('exactly one of *shift_left* and *shift_right* must be None')
     if (shift_down, shift_up).count(None) != 1:
         raise ValueError('exactly one of *shift_down* and *shift_up* must be None')
 
-    shift_left = _ratio_to_size(image, shift_left, axis=1)
-    shift_right = _ratio_to_size(image, shift_right, axis=1)
-    shift_up = _ratio_to_size(image, shift_up, axis=0)
-    shift_down = _ratio_to_size(image, shift_down, axis=0)
+    shift_left = _ratio_to_size(image, shift_left, axis=_WIDTH_AXIS)
+    shift_right = _ratio_to_size(image, shift_right, axis=_WIDTH_AXIS)
+    shift_up = _ratio_to_size(image, shift_up, axis=_HEIGHT_AXIS)
+    shift_down = _ratio_to_size(image, shift_down, axis=_HEIGHT_AXIS)
 
     if shift_left is None:
         shift_left = -shift_right
     if shift_up is None:
         shift_up = -shift_down
-    shifts = (shift_left, shift_up)
-
-    transform = AffineTransform(translation=shifts)
-    shifted = warp(image, transform, mode='wrap', preserve_range=True)
-    shifted = shifted.astype(image.dtype)
 
-    return shifted
+    # a translation with wrapping borders is exactly a roll along the spatial axes
+    return tf.roll(image, shift=[-shift_up, -shift_left], axis=[_HEIGHT_AXIS, _WIDTH_AXIS])
 
 
+@execution_mode(graph_safe=True, batchable=True)
 def flip(
         image: T,
         horizontal: bool = False,
@@ -147,31 +168,114 @@ def flip(
     return image
 
 
+@execution_mode(graph_safe=True, batchable=True)
 def grayscale(image: ImageType) -> tf.Tensor:
     return tf.image.rgb_to_grayscale(image)
 
 
+@execution_mode(graph_safe=True, batchable=True)
 def downscale(
         image: ImageType,
         factors: Tuple[int, int],
         antialias: bool = False
 ) -> tf.Tensor:
-    sizes = (image.shape[0]//factors[0], image.shape[1]//factors[1])
+    sizes = (
+        _image_dim(image, _HEIGHT_AXIS)//factors[0],
+        _image_dim(image, _WIDTH_AXIS)//factors[1]
+    )
     return tf.image.resize(image, sizes, method='bilinear', antialias=antialias)
 
 
-def random_brightness(image: ImageType, min_delta: float, max_delta: float) -> tf.Tensor:
-    delta = tf.random.uniform([], minval=min_delta, maxval=max_delta)
+@execution_mode(graph_safe=True, batchable=True)
+def downscale_local_mean(
+        image: ImageType,
+        factors: Tuple[int, int]
+) -> tf.Tensor:
+    '''TensorFlow equivalent of *skimage.transform.downscale_local_mean* over the two spatial axes.
+
+    As in scikit-image, the image is zero-padded up to a multiple of *factors* before averaging.
+    '''
+    image = tf.convert_to_tensor(image)
+    if not image.dtype.is_floating:
+        image = tf.cast(image, tf.float32)
+
+    is_batch = _is_batch(image)
+    if not is_batch:
+        image = image[tf.newaxis, ...]
+
+    pad_height = -_image_dim(image, _HEIGHT_AXIS) % factors[0]
+    pad_width = -_image_dim(image, _WIDTH_AXIS) % factors[1]
+    image = tf.pad(image, [[0, 0], [0, pad_height], [0, pad_width], [0, 0]])
+
+    downscaled = tf.nn.avg_pool2d(
+        image,
+        ksize=factors,
+        strides=factors,
+        padding='VALID'
+    )
+
+    if is_batch:
+        return downscaled
+    else:
+        return downscaled[0]
+
+
+@execution_mode(graph_safe=True, batchable=True, seedable=True)
+def random_brightness(
+        image: ImageType,
+        min_delta: float,
+        max_delta: float,
+        stateless_seed: Optional[tf.Tensor] = None
+) -> tf.Tensor:
+    image = tf.convert_to_tensor(image)
+    # one delta per image, so that the images in a batch are adjusted independently
+    delta_shape = tf.concat([tf.shape(image)[:_HEIGHT_AXIS], [1, 1, 1]], axis=0)
+    if stateless_seed is None:
+        delta = tf.random.uniform(delta_shape, minval=min_delta, maxval=max_delta)
+    else:
+        delta = tf.random.stateless_uniform(delta_shape, stateless_seed, minval=min_delta, maxval=max_delta)
     return tf.image.adjust_brightness(image, delta)
 
 
+@execution_mode(graph_safe=True, batchable=True, seedable=True)
 def random_crop(
         image: ImageType,
         size: Iterable[Optional[int]],
-        seed=None
+        seed=None,
+        stateless_seed: Optional[tf.Tensor] = None
 ) -> tf.Tensor:
+    size = tuple(size)
+    offset = len(image.shape) - len(size)
     size = tuple(
-        dim if dim is not None else img_dim
-        for img_dim, dim in zip(image.shape, size)
+        dim if dim is not None else _image_dim(image, axis + offset)
+        for axis, dim in enumerate(size)
     )
-    return tf.image.random_crop(image, size, seed=seed)
+    batch_of_images = _is_batch(image) and len(size) == 3
+
+    if stateless_seed is None:
+        if batch_of_images:
+            # crop each image at its own random position
+            return tf.map_fn(
+                lambda img: tf.image.random_crop(img, size, seed=seed),
+                image
+            )
+        else:
+            return tf.image.random_crop(image, size, seed=seed)
+
+    if batch_of_images:
+        # one seed per image, so that each one is still cropped at its own position
+        image = tf.convert_to_tensor(image)
+        image_seeds = tf.random.stateless_uniform(
+            tf.stack([tf.shape(image)[0], 2]),
+            stateless_seed,
+            minval=None,
+            maxval=None,
+            dtype=tf.int64
+        )
+        return tf.map_fn(
+            lambda args: tf.image.stateless_random_crop(args[0], size, args[1]),
+            (image, image_seeds),
+            fn_output_signature=image.dtype
+        )
+    else:
+        return tf.image.stateless_random_crop(image, size, stateless_seed)
@@ -16,7 +16,6 @@ import funcy
 import modin.pandas as pd
 import more_itertools as mit
 import scipy
-import skimage
 from skimage import img_as_float, img_as_ubyte
 from skimage.io import imread, imsave
 import tensorflow as tf
@@ -27,6 +26,7 @@ from boiling_learning.utils.utils import (
     PathType
 )
 import boiling_learning.model as bl_model
+from boiling_learning.preprocessing.image import downscale_local_mean
 import boiling_learning as bl
 
 
@@ -86,10 +86,12 @@ def sync_dataframes(
     return concat
 
 
-def load_persistent(path, auto_purge: bool = False):
-    def imread_as_float(path):
+def load_persistent(path, auto_purge: bool = False, as_float: bool = True):
+    def read_image(path):
         try:
-            return img_as_float(imread(path))
+            img = imread(path)
+            # images are stored as bytes, and may be kept like that until they are needed as floats
+            return img_as_float(img) if as_float else img
         except (SyntaxError, IOError):
             if auto_purge:
                 path.unlink()
@@ -101,7 +103,7 @@ def load_persistent(path, auto_purge: bool = False):
     return bl.management.Persistent(
         path,
         checker=operator.methodcaller('is_file'),
-        reader=imread_as_float,
+        reader=read_image,
         writer=imsave_as_ubyte,
         record_paths=True
     )
@@ -599,8 +601,8 @@ def simple_image_preprocessor(
             target_width=interest_region.size.width)
         img = tf.image.random_crop(
             img, (final_size.height, final_size.width, 1))
-        img = skimage.transform.downscale_local_mean(
-            img, (downscale_factor, downscale_factor, 1))
+        img = downscale_local_mean(
+            img, (downscale_factor, downscale_factor))
 
         return img
 
@@ -1,15 +1,21 @@
+import itertools
 import operator
 from typing import (
     Callable,
+    Dict,
     Generic,
+    Iterable,
     Iterator,
+    List,
     Mapping,
+    Optional,
     Tuple,
     TypeVar,
     Union
 )
 
 import funcy
+import tensorflow as tf
 
 from boiling_learning.utils.dtypes import (
     auto_spec,
@@ -34,6 +40,38 @@ T = TypeVar('T')
 S = TypeVar('S')
 U = TypeVar('U')
 V = TypeVar('V')
+F = TypeVar('F', bound=Callable)
+
+
+def execution_mode(graph_safe: bool = False, batchable: bool = False, seedable: bool = False) -> Callable[[F], F]:
+    '''Declare a function as *graph_safe*, *batchable* and/or *seedable* (see *Transformer*).
+
+    Transformers built from the function inherit these declarations unless given explicitly.
+    '''
+    def _declare(f: F) -> F:
+        f.graph_safe = graph_safe
+        f.batchable = batchable
+        f.seedable = seedable
+        return f
+    return _declare
+
+
+def _resolve_mode(
+        f: Callable,
+        graph_safe: Optional[bool],
+        batchable: Optional[bool]
+) -> Tuple[bool, bool]:
+    if graph_safe is None:
+        graph_safe = getattr(f, 'graph_safe', False)
+    if batchable is None:
+        batchable = getattr(f, 'batchable', False)
+    return graph_safe, batchable
+
+
+def _resolve_seedable(f: Callable, seedable: Optional[bool]) -> bool:
+    if seedable is None:
+        return getattr(f, 'seedable', False)
+    return seedable
 
 
 class Transformer(
@@ -45,12 +83,29 @@ class Transformer(
             self,
             name: str,
             f: Callable[..., S],
-            pack: Pack = Pack()
+            pack: Pack = Pack(),
+            graph_safe: Optional[bool] = None,
+            batchable: Optional[bool] = None,
+            seedable: Optional[bool] = None
     ):
+        '''
+        A *graph_safe* transformer is built exclusively from TensorFlow operations and can be traced
+        into a graph. All other transformers run eagerly in Python through *tf.py_function*.
+
+        A *batchable* transformer gives the same results (in distribution, if random) when applied to a
+        batch as when applied to each of its elements, so it can be run after *tf.data.Dataset.batch*.
+
+        A *seedable* transformer accepts a *stateless_seed* keyword, a shape [2] integer tensor, and then
+        draws its random values from stateless ops, so that equal seeds give equal results.
+
+        If not given, these are taken from the declarations of *f* (see *execution_mode*).
+        '''
         super().__init__(name)
 
         self.pack = pack
         self.transformer = pack.rpartial(f)
+        self.graph_safe, self.batchable = _resolve_mode(f, graph_safe, batchable)
+        self.seedable = _resolve_seedable(f, seedable)
 
     def __call__(self, arg: T, *args, **kwargs) -> S:
         return self.transformer(arg, *args, **kwargs)
@@ -84,6 +139,18 @@ class Transformer(
 
         return _tf_py_function
 
+    def as_tf_function(self, pack_tuple: bool = False):
+        if not self.graph_safe:
+            return self.as_tf_py_function(pack_tuple=pack_tuple)
+
+        if pack_tuple:
+            def func(*a):
+                return self(a)
+        else:
+            func = self
+
+        return tf.function(func)
+
 
 class Creator(
         Transformer[Pack, S],
@@ -113,20 +180,32 @@ class ImageTransformer(
             self,
             name: str,
             f: Callable[..., S],
-            pack: Pack = Pack()
+            pack: Pack = Pack(),
+            graph_safe: Optional[bool] = None,
+            batchable: Optional[bool] = None,
+            seedable: Optional[bool] = None
     ):
+        graph_safe, batchable = _resolve_mode(f, graph_safe, batchable)
+        seedable = _resolve_seedable(f, seedable)
+
         def g(img_data_pair: Tuple[T, U], *args, **kwargs) -> Tuple[S, U]:
             def pair_transformer(img: T, data: U) -> Tuple[S, U]:
                 return f(img, *args, **kwargs), data
             return pair_transformer(*img_data_pair)
 
-        super().__init__(name, g, pack=pack)
+        super().__init__(name, g, pack=pack, graph_safe=graph_safe, batchable=batchable, seedable=seedable)
 
     def transform_image(self, img: T, *args, **kwargs) -> S:
         return self((img, None), *args, **kwargs)[0]
 
     def as_image_transformer(self) -> Transformer[T, S]:
-        return Transformer('_'.join((self.name, 'image_function')), self.transform_image)
+        return Transformer(
+            '_'.join((self.name, 'image_function')),
+            self.transform_image,
+            graph_safe=self.graph_safe,
+            batchable=self.batchable,
+            seedable=self.seedable
+        )
 
 
 class ImageDatasetTransformer(
@@ -142,7 +221,12 @@ class ImageDatasetTransformer(
         def f(img: T, data: U) -> Tuple[S, V]:
             return image_transformer(img), data_transformer(data)
 
-        super().__init__(name, f)
+        super().__init__(
+            name,
+            f,
+            graph_safe=image_transformer.graph_safe and data_transformer.graph_safe,
+            batchable=image_transformer.batchable and data_transformer.batchable
+        )
 
 
 class KeyedImageDatasetTransformer(
@@ -213,11 +297,16 @@ class DictImageTransformer(
             packer: Union[
                 Callable[[str], Pack],
                 Mapping[Union[None, str], Pack]
-            ]
+            ],
+            graph_safe: Optional[bool] = None,
+            batchable: Optional[bool] = None,
+            seedable: Optional[bool] = None
     ):
         self.packer = packer
         self._transformer_mapping = KeyedDefaultDict(self._transformer_factory)
         self.func = f
+        self.graph_safe, self.batchable = _resolve_mode(f, graph_safe, batchable)
+        self.seedable = _resolve_seedable(f, seedable)
         super().__init__(name)
 
     def _resolve_func_and_pack(self, key: str) -> Tuple[Callable[[T], S], Pack]:
@@ -247,7 +336,15 @@ class DictImageTransformer(
     def _transformer_factory(self, key: str) -> ImageTransformer[T, U, S]:
         name = '_'.join((self.name, key))
         func, pack = self._resolve_func_and_pack(key)
-        return ImageTransformer(name, func, pack)
+        return ImageTransformer(
+            name,
+            func,
+            pack,
+            graph_safe=self.graph_safe,
+            batchable=self.batchable,
+            # skipped keys are not transformed, so they take no seed
+            seedable=self.seedable and func is self.func
+        )
 
     def __iter__(self) -> Iterator[str]:
         return iter(self._transformer_mapping)
@@ -274,4 +371,39 @@ class DictImageTransformer(
 #         return PackEncoder.default(self, obj)
 
 
-first_argument_transformer = Transformer('first_argument', nth_arg(0))
+def execution_report(transformers: Iterable[Transformer]) -> Dict[str, str]:
+    '''Tell which transformers run as TensorFlow graphs and which ones still run in Python.
+    '''
+    return {
+        transformer.name: 'graph' if transformer.graph_safe else 'python'
+        for transformer in transformers
+    }
+
+
+def fuse_transformers(transformers: Iterable[Transformer]) -> List[Transformer]:
+    '''Compose each run of consecutive transformers sharing the same execution mode into a single transformer.
+
+    Mapping the fused transformers over a dataset gives the same results with fewer dispatches per element.
+    The fused transformers are execution artifacts: describe the original ones instead.
+    '''
+    def _mode(transformer: Transformer) -> Tuple[bool, bool]:
+        return transformer.graph_safe, transformer.batchable
+
+    fused = []
+    for (graph_safe, batchable), group in itertools.groupby(transformers, key=_mode):
+        group = tuple(group)
+        if len(group) == 1:
+            fused.append(group[0])
+        else:
+            fused.append(
+                Transformer(
+                    '+'.join(transformer.name for transformer in group),
+                    funcy.rcompose(*group),
+                    graph_safe=graph_safe,
+                    batchable=batchable
+                )
+            )
+    return fused
+
+
+first_argument_transformer = Transformer('first_argument', nth_arg(0), graph_safe=True, batchable=True)
@@ -98,7 +98,7 @@ DEFAULT_ANNOTATORS = frozendict({
     'random_quality': None
 })
 
-_first_arg_getter = Transformer('first_argument', nth_arg(0))
+_first_arg_getter = Transformer('first_argument', nth_arg(0), graph_safe=True, batchable=True)
 
 DEFAULT_VISUALIZERS = frozendict({
     'grayscaler': lambda transformer, image: ((transformer.transform_image, image, transformer.pack),),
@@ -110,17 +110,29 @@ DEFAULT_VISUALIZERS = frozendict({
     'random_cropper': lambda transformer, image: ((transformer.transform_image, image, transformer.pack),),
     'random_left_right_flipper': lambda transformer, image: (
         (_first_arg_getter, image, Pack()),
-        (Transformer('left_right_flipper', tf.image.flip_left_right), image, Pack())
+        (Transformer('left_right_flipper', tf.image.flip_left_right, graph_safe=True, batchable=True), image, Pack())
     ),
     'random_brightness': lambda transformer, image: (
         (_first_arg_getter, image, Pack()),
         (
-            Transformer('brightness_adjuster', tf.image.adjust_brightness, pack=pack(transformer.pack.args[0])),
+            Transformer(
+                'brightness_adjuster',
+                tf.image.adjust_brightness,
+                pack=pack(transformer.pack.args[0]),
+                graph_safe=True,
+                batchable=True
+            ),
             image,
             pack(transformer.pack.args[0])
         ),
         (
-            Transformer('brightness_adjuster', tf.image.adjust_brightness, pack=pack(transformer.pack.args[1])),
+            Transformer(
+                'brightness_adjuster',
+                tf.image.adjust_brightness,
+                pack=pack(transformer.pack.args[1]),
+                graph_safe=True,
+                batchable=True
+            ),
             image,
             pack(transformer.pack.args[1])
         )
@@ -128,12 +140,24 @@ DEFAULT_VISUALIZERS = frozendict({
     'random_contrast': lambda transformer, image: (
         (_first_arg_getter, image, Pack()),
         (
-            Transformer('contrast_adjuster', tf.image.adjust_contrast, pack=pack(transformer.pack.args[0])),
+            Transformer(
+                'contrast_adjuster',
+                tf.image.adjust_contrast,
+                pack=pack(transformer.pack.args[0]),
+                graph_safe=True,
+                batchable=True
+            ),
             image,
             pack(transformer.pack.args[0])
         ),
         (
-            Transformer('contrast_adjuster', tf.image.adjust_contrast, pack=pack(transformer.pack.args[1])),
+            Transformer(
+                'contrast_adjuster',
+                tf.image.adjust_contrast,
+                pack=pack(transformer.pack.args[1]),
+                graph_safe=True,
+                batchable=True
+            ),
             image,
             pack(transformer.pack.args[1])
         )
@@ -141,12 +165,22 @@ DEFAULT_VISUALIZERS = frozendict({
     'random_quality': lambda transformer, image: (
         (_first_arg_getter, image, Pack()),
         (
-            Transformer('jpeg_quality_adjuster', tf.image.adjust_jpeg_quality, pack=pack(transformer.pack.args[0])),
+            Transformer(
+                'jpeg_quality_adjuster',
+                tf.image.adjust_jpeg_quality,
+                pack=pack(transformer.pack.args[0]),
+                graph_safe=True
+            ),
             image,
             pack(transformer.pack.args[0])
         ),
         (
-            Transformer('jpeg_quality_adjuster', tf.image.adjust_jpeg_quality, pack=pack(transformer.pack.args[1])),
+            Transformer(
+                'jpeg_quality_adjuster',
+                tf.image.adjust_jpeg_quality,
+                pack=pack(transformer.pack.args[1]),
+                graph_safe=True
+            ),
             image,
             pack(transformer.pack.args[1])
         )
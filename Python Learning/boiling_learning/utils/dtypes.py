@@ -1,5 +1,10 @@
+from dataclasses import asdict, dataclass
 from typing import (
+    Any,
+    Dict,
+    Iterable,
     Mapping,
+    Optional,
     Sequence
 )
 
@@ -100,3 +105,83 @@ def new_py_function(func, inp, Tout, name=None):
     )
     out = tf.nest.pack_sequence_as(spec_out, flat_out, expand_composites=True)
     return out
+
+
+@dataclass(frozen=True)
+class DTypePolicy:
+    '''How images are stored in the input pipeline and how they are given to the model.
+
+    Images are kept as *storage* (e.g. uint8 or float16) through caches, snapshots and
+    shuffle buffers, and are converted to *compute* only right before batching.
+    *value_range* is the maximum value of the images in the compute representation, e.g.
+    255 for raw video frames or 1 for images decoded with *convert_image_dtype*. If
+    *normalize* is True, the converted images are scaled to [0, 1] instead.
+    '''
+    storage: str = 'uint8'
+    compute: str = 'float32'
+    value_range: float = 255.0
+    normalize: bool = False
+
+    def __post_init__(self):
+        if self.storage not in tf_str_dtype_bidict or self.compute not in tf_str_dtype_bidict:
+            raise ValueError(f'unknown dtypes in {self}.')
+        if self.value_range <= 0:
+            raise ValueError('*value_range* must be positive.')
+
+    @property
+    def storage_dtype(self) -> tf.DType:
+        return tf_str_dtype_bidict[self.storage]
+
+    @property
+    def compute_dtype(self) -> tf.DType:
+        return tf_str_dtype_bidict[self.compute]
+
+    def to_storage(self, image: tf.Tensor) -> tf.Tensor:
+        if image.dtype == self.storage_dtype:
+            return image
+
+        if self.storage_dtype.is_integer:
+            image = tf.cast(image, tf.float32) * (self.storage_dtype.max / self.value_range)
+            image = tf.clip_by_value(tf.round(image), self.storage_dtype.min, self.storage_dtype.max)
+
+        return tf.cast(image, self.storage_dtype)
+
+    def to_compute(self, image: tf.Tensor) -> tf.Tensor:
+        scale = 1.0
+        if image.dtype.is_integer:
+            scale = self.value_range / image.dtype.max
+        if self.normalize:
+            scale /= self.value_range
+
+        image = tf.cast(image, self.compute_dtype)
+        if scale != 1.0:
+            image = image * tf.cast(scale, self.compute_dtype)
+        return image
+
+    def describe(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    def memory_report(
+            self,
+            shape: Iterable[Optional[int]],
+            count: Optional[int] = None
+    ) -> Dict[str, Any]:
+        '''Bytes taken by *count* images of shape *shape* in storage and in compute dtype.'''
+        shape = tuple(shape)
+        if any(dim is None for dim in shape):
+            raise ValueError(f'a fully defined shape is required. Got {shape}.')
+
+        n_values = 1
+        for dim in shape:
+            n_values *= dim
+        if count is not None:
+            n_values *= count
+
+        storage_bytes = n_values * self.storage_dtype.size
+        compute_bytes = n_values * self.compute_dtype.size
+        return {
+            'storage_bytes': storage_bytes,
+            'compute_bytes': compute_bytes,
+            'saved_bytes': compute_bytes - storage_bytes,
+            'ratio': compute_bytes / storage_bytes
+        }
@@ -0,0 +1,319 @@
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    wait
+)
+from dataclasses import dataclass, field
+import json
+from pathlib import Path
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Tuple
+)
+
+from boiling_learning.io.json_encoders import GenericJSONEncoder
+from boiling_learning.utils.functional import Pack
+from boiling_learning.utils.utils import (
+    PathType,
+    ensure_parent,
+    ensure_resolved,
+    json_fingerprint
+)
+
+
+def path_signature(path: PathType) -> Optional[Tuple[int, int]]:
+    '''*(mtime, size)* of the file at *path*, or the latest mtime and total size of the tree under a directory.
+
+    Return *None* if *path* does not exist.
+    '''
+    path = ensure_resolved(path)
+    if path.is_file():
+        stat = path.stat()
+        return (stat.st_mtime_ns, stat.st_size)
+    elif path.is_dir():
+        stats = [child.stat() for child in path.rglob('*') if child.is_file()]
+        return (
+            max((stat.st_mtime_ns for stat in stats), default=path.stat().st_mtime_ns),
+            sum(stat.st_size for stat in stats)
+        )
+    else:
+        return None
+
+
+@dataclass
+class Node:
+    '''Step of a *Pipeline*: calls *run* with *params* to produce *outputs* from *inputs*.
+
+    A node must run again whenever its *description* or any of its inputs change. With a
+    process pool, *run* and *params* must be picklable. Nodes that must run in the calling
+    process, e.g. because they return or share in-memory state, are marked *local*.
+    '''
+    name: str
+    run: Callable[..., Any]
+    params: Pack = Pack()
+    inputs: Tuple[Path, ...] = ()
+    outputs: Tuple[Path, ...] = ()
+    description: Any = None
+    after: Tuple[str, ...] = ()
+    local: bool = False
+
+    def __post_init__(self) -> None:
+        self.inputs = tuple(map(ensure_resolved, self.inputs))
+        self.outputs = tuple(map(ensure_resolved, self.outputs))
+        self.after = tuple(self.after)
+
+    def fingerprint(self) -> str:
+        return json_fingerprint(self.description, encoder=GenericJSONEncoder)
+
+    def input_signatures(self) -> Dict[str, Optional[Tuple[int, int]]]:
+        return {str(path): path_signature(path) for path in self.inputs}
+
+
+def _run_node(run: Callable[..., Any], params: Pack) -> float:
+    start = time.perf_counter()
+    run(*params.args, **params.kwargs)
+    return time.perf_counter() - start
+
+
+@dataclass
+class NodeResult:
+    name: str
+    status: str
+    reasons: List[str] = field(default_factory=list)
+    duration: Optional[float] = None
+    error: Optional[str] = None
+
+
+class Pipeline:
+    '''Directed acyclic graph of *Node*s that only runs the nodes whose results are stale.
+
+    A node depends on the nodes producing any of its inputs (or a directory containing them)
+    and on the nodes listed in its *after*. The description fingerprint and input signatures
+    of every node that ran successfully are stored in the JSON file at *state_path*. A node
+    is stale if it never ran, its description or inputs changed, one of its outputs is missing
+    or a node it depends on runs.
+    '''
+
+    def __init__(self, state_path: PathType, nodes: Iterable[Node] = ()):
+        self.state_path: Path = ensure_resolved(state_path)
+        self.nodes: Dict[str, Node] = {}
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: Node) -> Node:
+        if node.name in self.nodes:
+            raise ValueError(f'a node named {node.name!r} already exists.')
+        self.nodes[node.name] = node
+        return node
+
+    def _producer(self, path: Path) -> Optional[str]:
+        for name, node in self.nodes.items():
+            for output in node.outputs:
+                if path == output or output in path.parents:
+                    return name
+        return None
+
+    def dependencies(self, name: str) -> List[str]:
+        node = self.nodes[name]
+        dependencies = list(node.after)
+        for path in node.inputs:
+            producer = self._producer(path)
+            if producer is not None and producer != name and producer not in dependencies:
+                dependencies.append(producer)
+
+        for dependency in dependencies:
+            if dependency not in self.nodes:
+                raise ValueError(f'node {name!r} depends on unknown node {dependency!r}.')
+        return dependencies
+
+    def order(self) -> List[str]:
+        '''Names of the nodes in an order where every node comes after its dependencies.'''
+        dependencies = {name: self.dependencies(name) for name in self.nodes}
+        ordered: List[str] = []
+        visiting = set()
+        done = set()
+
+        def _visit(name: str) -> None:
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f'the pipeline has a cycle through node {name!r}.')
+            visiting.add(name)
+            for dependency in dependencies[name]:
+                _visit(dependency)
+            visiting.remove(name)
+            done.add(name)
+            ordered.append(name)
+
+        for name in self.nodes:
+            _visit(name)
+        return ordered
+
+    def load_state(self) -> Dict[str, dict]:
+        if not self.state_path.is_file():
+            return {}
+        with self.state_path.open('r') as file:
+            return json.load(file)
+
+    def save_state(self, state: Mapping[str, dict]) -> None:
+        path = ensure_parent(self.state_path)
+        temp_path = path.with_name(path.name + '.tmp')
+        with temp_path.open('w') as file:
+            json.dump(state, file, indent=4)
+        temp_path.replace(path)
+
+    def stale_reasons(self, name: str, state: Mapping[str, dict]) -> List[str]:
+        '''Reasons for node *name* to run, not accounting for its dependencies.'''
+        node = self.nodes[name]
+        record = state.get(name)
+        if record is None:
+            return ['never ran']
+
+        reasons = []
+        if record.get('description') != node.fingerprint():
+            reasons.append('description changed')
+
+        recorded_inputs = record.get('inputs', {})
+        for path, signature in node.input_signatures().items():
+            if signature is None:
+                reasons.append(f'input missing: {path}')
+            elif path not in recorded_inputs:
+                reasons.append(f'new input: {path}')
+            elif tuple(recorded_inputs[path]) != signature:
+                reasons.append(f'input changed: {path}')
+
+        for path in node.outputs:
+            if not path.exists():
+                reasons.append(f'output missing: {path}')
+
+        return reasons
+
+    def plan(self) -> List[NodeResult]:
+        '''Every node, in execution order, with the reasons for it to run, if any.'''
+        state = self.load_state()
+        will_run = set()
+        results = []
+        for name in self.order():
+            reasons = self.stale_reasons(name, state)
+            reasons.extend(
+                f'dependency runs: {dependency}'
+                for dependency in self.dependencies(name)
+                if dependency in will_run
+            )
+            if reasons:
+                will_run.add(name)
+            results.append(NodeResult(name, 'stale' if reasons else 'up to date', reasons))
+        return results
+
+    def dry_run(self) -> List[NodeResult]:
+        '''Print and return what *run* would execute and why, without running anything.'''
+        results = self.plan()
+        for result in results:
+            if result.reasons:
+                print(f'{result.name}: would run ({"; ".join(result.reasons)})')
+            else:
+                print(f'{result.name}: up to date')
+        return results
+
+    def run(
+            self,
+            max_workers: Optional[int] = None,
+            executor: Optional[Executor] = None,
+            dry_run: bool = False,
+            verbose: bool = False
+    ) -> Dict[str, NodeResult]:
+        '''Run the stale nodes, each as soon as its dependencies finished.
+
+        Independent nodes run concurrently in *executor*, a process pool with *max_workers*
+        workers by default. Local nodes run in this process. Nodes depending on a failed node are
+        skipped. A *RuntimeError* listing the failed nodes is raised at the end, after the state of
+        the successful ones was saved.
+        '''
+        if dry_run:
+            return {result.name: result for result in self.dry_run()}
+
+        results = {result.name: result for result in self.plan()}
+        dependencies = {name: self.dependencies(name) for name in self.nodes}
+        stale = {name for name, result in results.items() if result.reasons}
+        state = self.load_state()
+
+        own_executor = executor is None and any(not self.nodes[name].local for name in stale)
+        if own_executor:
+            executor = ProcessPoolExecutor(max_workers=max_workers)
+
+        finished = {name for name in self.nodes if name not in stale}
+        failed = set()
+        running: Dict[Future, str] = {}
+
+        def _record(name: str, duration: float) -> None:
+            node = self.nodes[name]
+            state[name] = {
+                'description': node.fingerprint(),
+                # inputs are signed after running, since upstream nodes may have just written them
+                'inputs': node.input_signatures(),
+                'duration': duration
+            }
+            self.save_state(state)
+            results[name].status = 'ran'
+            results[name].duration = duration
+            finished.add(name)
+            if verbose:
+                print(f'{name}: ran in {duration:.3f}s')
+
+        def _fail(name: str, error: BaseException) -> None:
+            results[name].status = 'failed'
+            results[name].error = repr(error)
+            failed.add(name)
+            if verbose:
+                print(f'{name}: failed with {error!r}')
+
+        try:
+            pending = [name for name in self.order() if name in stale]
+            while pending or running:
+                for name in list(pending):
+                    if any(dependency in failed for dependency in dependencies[name]):
+                        results[name].status = 'skipped'
+                        failed.add(name)
+                        pending.remove(name)
+                    elif all(dependency in finished for dependency in dependencies[name]):
+                        pending.remove(name)
+                        node = self.nodes[name]
+                        if node.local:
+                            try:
+                                _record(name, _run_node(node.run, node.params))
+                            except Exception as error:
+                                _fail(name, error)
+                        else:
+                            running[executor.submit(_run_node, node.run, node.params)] = name
+
+                if not running:
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        _record(name, future.result())
+                    except Exception as error:
+                        _fail(name, error)
+        finally:
+            if own_executor:
+                executor.shutdown(wait=True)
+
+        errors = [results[name] for name in self.order() if results[name].status == 'failed']
+        if errors:
+            raise RuntimeError(
+                'pipeline nodes failed: '
+                + '; '.join(f'{result.name}: {result.error}' for result in errors)
+            )
+
+        return results
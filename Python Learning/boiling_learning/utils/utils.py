@@ -11,6 +11,7 @@ from functools import (
     wraps,
     partial
 )
+import hashlib
 import itertools
 from itertools import product
 import json
@@ -732,6 +733,26 @@ def json_equivalent(
     )
 
 
+def json_fingerprint(
+        obj,
+        encoder: Optional[Type] = None,
+        dumps: Callable[[_T], str] = json.dumps,
+        loads: Callable[[str], Any] = json.loads
+) -> str:
+    '''Return a SHA-256 hex digest identifying *obj* by its JSON representation.
+
+    Objects considered equivalent by *json_equivalent* have the same fingerprint.
+    '''
+    # ignore parameter *cls* when it is *None*
+    dumps = pack(cls=encoder).partial(dumps)
+
+    # a round-trip through JSON normalizes the representation, e.g. tuples become lists
+    normalized = loads(dumps(obj))
+    canonical = json.dumps(normalized, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
 # ---------------------------------- Iteration ----------------------------------
 def empty_gen() -> Iterator[None]:
     # Source: <https://stackoverflow.com/a/13243870/5811400>
@@ -858,6 +879,31 @@ def rmdir(
         ValueError('cannot keep dir when not in recursive mode.')
 
 
+def _file_usage(path: Path, split_links: bool) -> int:
+    stat = path.stat()
+    return stat.st_size // stat.st_nlink if split_links else stat.st_size
+
+
+def disk_usage(path: PathType, split_links: bool = False) -> int:
+    '''Return the total size in bytes of the file or directory tree at *path*.
+
+    With *split_links*, a file with several hardlinks only counts for its share of the space,
+    *st_size / st_nlink*, so that files shared between trees are not counted more than once.
+    '''
+    path = ensure_resolved(path)
+
+    if path.is_file():
+        return _file_usage(path, split_links)
+    elif path.is_dir():
+        return sum(
+            _file_usage(child, split_links)
+            for child in path.rglob('*')
+            if child.is_file()
+        )
+    else:
+        return 0
+
+
 def group_files(path, keyfunc=operator.attrgetter('suffix')):
     d = {}
     for p in filter(operator.methodcaller('is_file'), path.iterdir()):
@@ -1184,6 +1230,33 @@ class Ranges(MutableSet):
         return f'Ranges({as_str})'
 
 
+@dataclass(frozen=True)
+class Interval:
+    '''Interval of comparable values. A missing bound means the interval is unbounded on that side.'''
+    lower: Optional[Any] = None
+    upper: Optional[Any] = None
+    lower_closed: bool = True
+    upper_closed: bool = True
+
+    def __contains__(self, value) -> bool:
+        if self.lower is not None:
+            if value < self.lower or (not self.lower_closed and value == self.lower):
+                return False
+        if self.upper is not None:
+            if value > self.upper or (not self.upper_closed and value == self.upper):
+                return False
+        return True
+
+    def mask(self, values):
+        '''Elementwise membership for pandas or numpy containers.'''
+        result = values == values
+        if self.lower is not None:
+            result &= (values >= self.lower) if self.lower_closed else (values > self.lower)
+        if self.upper is not None:
+            result &= (values <= self.upper) if self.upper_closed else (values < self.upper)
+        return result
+
+
 # class DateTimeRange(collections.abc.Sequence):
 #     def __init__(
 #         self,
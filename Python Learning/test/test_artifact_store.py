@@ -0,0 +1,107 @@
+from pathlib import Path
+import tempfile
+import unittest
+
+from boiling_learning.management.ArtifactStore import (
+    ArtifactStore,
+    file_digest
+)
+from boiling_learning.utils.utils import disk_usage
+
+
+SIZE = 8192
+
+
+def _write(path: Path, contents: bytes) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(contents)
+    return path
+
+
+class ArtifactStore_test(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.path = Path(self._directory.name)
+        self.store = ArtifactStore(self.path / 'blobs')
+
+        self.first = _write(self.path / 'a' / 'data', b'x' * SIZE)
+        self.second = _write(self.path / 'b' / 'data', b'x' * SIZE)
+        self.other = _write(self.path / 'b' / 'other', b'y' * SIZE)
+        self.small = _write(self.path / 'b' / 'small', b'x')
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def test_dedup(self):
+        report = self.store.dedup([self.path / 'a', self.path / 'b'])
+
+        self.assertEqual(report.n_files, 3)
+        self.assertEqual(report.n_new_blobs, 2)
+        self.assertEqual(report.n_linked, 1)
+        self.assertEqual(report.n_bytes_reclaimed, SIZE)
+        self.assertTrue(self.first.samefile(self.second))
+        self.assertEqual(self.first.stat().st_nlink, 3)
+        self.assertEqual(self.small.stat().st_nlink, 1)
+        self.assertIn(file_digest(self.first), self.store)
+        self.assertEqual(self.store.digest(self.second), file_digest(self.first))
+        self.assertIsNone(self.store.digest(self.small))
+        self.assertEqual(self.store.usage(), 2 * SIZE)
+
+    def test_dry_run(self):
+        report = self.store.dedup([self.path / 'a', self.path / 'b'], dry_run=True)
+
+        self.assertEqual((report.n_new_blobs, report.n_linked), (2, 1))
+        self.assertEqual(report.n_bytes_reclaimed, SIZE)
+        self.assertFalse(self.first.samefile(self.second))
+        self.assertEqual(list(self.store.blobs()), [])
+
+    def test_detach(self):
+        self.store.dedup([self.path / 'a', self.path / 'b'])
+
+        self.assertEqual(self.store.detach(self.path / 'b'), 2)
+        self.assertEqual(self.store.detach(self.path / 'b'), 0)
+        self.assertEqual(self.store.detach(self.path / 'missing'), 0)
+
+        # detached files can be modified in place without affecting the others
+        with self.second.open('r+b') as file:
+            file.write(b'z')
+        self.assertEqual(self.first.read_bytes(), b'x' * SIZE)
+        self.assertEqual(self.second.stat().st_nlink, 1)
+        self.assertEqual(self.first.stat().st_nlink, 2)
+
+    def test_collect_garbage(self):
+        self.store.dedup([self.path / 'a', self.path / 'b'])
+        self.assertEqual(self.store.collect_garbage(), 0)
+
+        self.other.unlink()
+        self.assertEqual(self.store.collect_garbage(dry_run=True), SIZE)
+        self.assertEqual(len(list(self.store.blobs())), 2)
+        self.assertEqual(self.store.collect_garbage(), SIZE)
+        self.assertEqual(len(list(self.store.blobs())), 1)
+
+        self.first.unlink()
+        self.second.unlink()
+        self.assertEqual(self.store.collect_garbage(), SIZE)
+        self.assertEqual(list(self.store.blobs()), [])
+
+    def test_link(self):
+        digest = self.store.put(self.first)
+        target = self.store.link(digest, self.path / 'c' / 'data')
+        self.assertTrue(target.samefile(self.first))
+
+        with self.assertRaises(KeyError):
+            self.store.link('0' * 64, self.path / 'c' / 'missing')
+
+    def test_disk_usage_splits_links(self):
+        self.store.dedup([self.path / 'a', self.path / 'b'])
+
+        self.assertEqual(disk_usage(self.path / 'a'), SIZE)
+        self.assertEqual(disk_usage(self.path / 'a', split_links=True), SIZE // 3)
+        self.assertEqual(
+            disk_usage(self.path / 'b', split_links=True),
+            SIZE // 3 + SIZE // 2 + 1
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,312 @@
+from pathlib import Path
+import tempfile
+import time
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+import boiling_learning.io as bl_io
+from boiling_learning.datasets.datasets import (
+    DatasetCreationReport,
+    InterleaveWeights,
+    StratifiedSampler,
+    VideoDatasetTiming,
+    dataset_creator,
+    dataset_fingerprint,
+    dataset_post_processor,
+    echo_input_wait,
+    interleave_weights,
+    materialize_augmentations,
+    measure_input_wait,
+    plan_buffers,
+    tf_interleave
+)
+from boiling_learning.preprocessing.image import random_brightness
+from boiling_learning.preprocessing.transformers import (
+    Creator,
+    ImageTransformer
+)
+from boiling_learning.utils.dtypes import DTypePolicy
+from boiling_learning.utils.functional import Pack
+
+
+def _datasets(*lengths: int) -> list:
+    return [tf.data.Dataset.range(length) for length in lengths]
+
+
+class interleave_weights_test(unittest.TestCase):
+    def test_uniform(self):
+        self.assertEqual(
+            interleave_weights(_datasets(1, 2, 5), InterleaveWeights.UNIFORM),
+            [1/3, 1/3, 1/3]
+        )
+
+    def test_length(self):
+        self.assertEqual(
+            interleave_weights(_datasets(1, 3, 4), 'length'),
+            [0.125, 0.375, 0.5]
+        )
+
+    def test_categories_get_the_same_total_weight(self):
+        weights = interleave_weights(
+            _datasets(1, 3, 4),
+            InterleaveWeights.LENGTH,
+            categories=['low', 'low', 'high']
+        )
+        self.assertEqual(weights, [0.125, 0.375, 0.5])
+
+        weights = interleave_weights(
+            _datasets(2, 2, 2),
+            InterleaveWeights.UNIFORM,
+            categories=['low', 'low', 'high']
+        )
+        self.assertEqual(weights, [0.25, 0.25, 0.5])
+
+    def test_unknown_length(self):
+        with self.assertRaises(ValueError):
+            interleave_weights(_datasets(3) + [tf.data.Dataset.range(3).repeat()], 'length')
+
+    def test_bad_arguments(self):
+        with self.assertRaises(ValueError):
+            interleave_weights(_datasets(1, 2), 'length', categories=['a'])
+        with self.assertRaises(ValueError):
+            interleave_weights(_datasets(0, 0), 'length')
+
+
+class tf_interleave_test(unittest.TestCase):
+    def test_all_elements_and_cardinality(self):
+        datasets = [
+            tf.data.Dataset.range(0, 3),
+            tf.data.Dataset.range(10, 15),
+            tf.data.Dataset.range(20, 22)
+        ]
+        ds = tf_interleave(datasets, seed=0)
+
+        self.assertEqual(int(tf.data.experimental.cardinality(ds)), 10)
+        self.assertCountEqual(
+            list(ds.as_numpy_iterator()),
+            [0, 1, 2, 10, 11, 12, 13, 14, 20, 21]
+        )
+
+    def test_deterministic_with_seed(self):
+        first = list(tf_interleave(_datasets(5, 5), seed=42).as_numpy_iterator())
+        second = list(tf_interleave(_datasets(5, 5), seed=42).as_numpy_iterator())
+        self.assertEqual(first, second)
+
+    def test_bad_arguments(self):
+        with self.assertRaises(ValueError):
+            tf_interleave([])
+        with self.assertRaises(ValueError):
+            tf_interleave(_datasets(1, 2), weights=[1.0])
+
+
+class plan_buffers_test(unittest.TestCase):
+    element_spec = tf.TensorSpec((100,), tf.uint8)
+
+    def test_cache_in_memory(self):
+        plan = plan_buffers(self.element_spec, ram_budget=10_000, batch_size=10, count=20)
+        self.assertIs(plan.cache, True)
+        self.assertEqual(plan.prefetch, 4)
+        self.assertEqual(plan.shuffle_size, 20)
+        self.assertEqual(plan.estimated_bytes, 8_000)
+        self.assertLessEqual(plan.estimated_bytes, plan.ram_budget)
+
+    def test_cache_on_disk(self):
+        with tempfile.TemporaryDirectory() as directory:
+            plan = plan_buffers(
+                self.element_spec,
+                ram_budget=10_000,
+                batch_size=10,
+                cache_path=directory,
+                max_shuffle_size=50
+            )
+        self.assertIsInstance(plan.cache, str)
+        self.assertEqual(plan.prefetch, 4)
+        self.assertEqual(plan.shuffle_size, 50)
+
+    def test_no_cache(self):
+        plan = plan_buffers(self.element_spec, ram_budget=10_000, batch_size=10, count=1_000)
+        self.assertIs(plan.cache, False)
+        self.assertEqual(plan.shuffle_size, 60)
+
+    def test_dtype_policy(self):
+        plan = plan_buffers(
+            tf.TensorSpec((100,), tf.float32),
+            ram_budget=10_000,
+            batch_size=10,
+            dtype_policy=DTypePolicy('uint8', 'float32')
+        )
+        self.assertEqual(plan.element_bytes, 100)
+        self.assertEqual(plan.batch_bytes, 4_000)
+
+    def test_does_not_fit(self):
+        with self.assertRaises(ValueError):
+            plan_buffers(self.element_spec, ram_budget=500, batch_size=10)
+        with self.assertRaises(ValueError):
+            plan_buffers(tf.TensorSpec((None,), tf.uint8), ram_budget=10_000)
+
+
+def _images(n: int = 4, offset: float = 0.0) -> tf.data.Dataset:
+    images = tf.reshape(tf.range(n * 4, dtype=tf.float32), (n, 2, 2, 1)) + offset
+    return tf.data.Dataset.from_tensor_slices((images, tf.range(n)))
+
+
+class materialize_augmentations_test(unittest.TestCase):
+    augmentors = (
+        ImageTransformer('random_brightness', random_brightness, Pack(kwargs=dict(min_delta=-1, max_delta=1))),
+    )
+
+    def _variants(self, path: Path, ds: tf.data.Dataset) -> list:
+        materialize_augmentations(ds, self.augmentors, 2, path, seed=3)
+        variant_paths = sorted(path.glob('*/variant_*'))
+        return [
+            [image for image, _ in bl_io.load_dataset(variant_path).as_numpy_iterator()]
+            for variant_path in variant_paths
+        ]
+
+    def test_deterministic_without_global_seed(self):
+        with tempfile.TemporaryDirectory() as first, tempfile.TemporaryDirectory() as second:
+            tf.random.set_seed(1)
+            first_variants = self._variants(Path(first), _images())
+            tf.random.set_seed(2)
+            second_variants = self._variants(Path(second), _images())
+
+        self.assertEqual(len(first_variants), 2)
+        np.testing.assert_array_equal(first_variants, second_variants)
+        self.assertFalse(np.array_equal(first_variants[0], first_variants[1]))
+
+    def test_keyed_by_contents(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory)
+            materialize_augmentations(_images(), self.augmentors, 1, path)
+            materialize_augmentations(_images(offset=1.0), self.augmentors, 1, path)
+            materialize_augmentations(_images(), self.augmentors, 1, path)
+            self.assertEqual(len(list(path.iterdir())), 2)
+
+    def test_python_augmentors_are_rejected(self):
+        augmentors = self.augmentors + (ImageTransformer('negate', lambda image: -image),)
+        with tempfile.TemporaryDirectory() as directory:
+            with self.assertRaises(ValueError):
+                materialize_augmentations(_images(), augmentors, 1, Path(directory))
+
+    def test_post_processor_requires_source_description(self):
+        ds = _images()
+        with tempfile.TemporaryDirectory() as directory:
+            with self.assertRaises(ValueError):
+                dataset_post_processor((ds, None, ds), self.augmentors, cache=directory, num_augmented_variants=1)
+
+
+class dataset_fingerprint_test(unittest.TestCase):
+    def test_order_independent(self):
+        self.assertEqual(
+            dataset_fingerprint(tf.data.Dataset.range(5)),
+            dataset_fingerprint(tf.data.Dataset.from_tensor_slices(tf.constant([4, 2, 0, 1, 3], tf.int64)))
+        )
+
+    def test_contents(self):
+        self.assertNotEqual(
+            dataset_fingerprint(tf.data.Dataset.range(5)),
+            dataset_fingerprint(tf.data.Dataset.range(1, 6))
+        )
+        self.assertNotEqual(
+            dataset_fingerprint(tf.data.Dataset.range(5)),
+            dataset_fingerprint(tf.data.Dataset.range(5).map(lambda x: tf.cast(x, tf.int32)))
+        )
+
+
+class StratifiedSampler_test(unittest.TestCase):
+    values = [0.0, 0.1, 0.2, 0.3, 5.0, 9.8, 9.9, 10.0]
+
+    def test_select_everything(self):
+        sampler = StratifiedSampler('target', bins=2)
+        np.testing.assert_array_equal(sampler.select(self.values), range(8))
+
+    def test_balanced(self):
+        sampler = StratifiedSampler('target', bins=2, balanced=True)
+        positions = sampler.select(self.values)
+        bins = sampler.assign_bins(np.asarray(self.values)[positions])
+        self.assertEqual(np.bincount(bins).tolist(), [4, 4])
+
+        sampler = StratifiedSampler('target', bins=(0.0, 1.0, 10.0), balanced=True)
+        positions = sampler.select(self.values)
+        self.assertEqual(len(positions), 8)
+
+        sampler = StratifiedSampler('target', bins=(0.0, 0.5, 10.0), size=4, balanced=True)
+        positions = sampler.select(self.values)
+        bins = sampler.assign_bins(np.asarray(self.values)[positions])
+        self.assertEqual(np.bincount(bins).tolist(), [2, 2])
+
+    def test_proportional(self):
+        sampler = StratifiedSampler('target', bins=(0.0, 0.5, 10.0), size=6)
+        positions = sampler.select(self.values)
+        self.assertEqual(len(positions), 6)
+        self.assertEqual(list(positions), sorted(positions))
+
+    def test_deterministic(self):
+        sampler = StratifiedSampler('target', bins=2, size=3, seed=7)
+        np.testing.assert_array_equal(sampler.select(self.values), sampler.select(self.values))
+
+    def test_nan_targets_are_dropped(self):
+        values = [np.nan, 0.0, 1.0, np.nan, 2.0, 3.0]
+        sampler = StratifiedSampler('target', bins=2)
+
+        positions = sampler.select(values)
+        np.testing.assert_array_equal(positions, [1, 2, 4, 5])
+
+        report = sampler.report(values, positions)
+        self.assertEqual(report['dropped (NaN)'], {'available': 2, 'selected': 0})
+        self.assertEqual(sum(counts['selected'] for counts in report.values()), 4)
+
+        self.assertEqual(len(sampler.select([np.nan, np.nan])), 0)
+
+
+def _slow_elements(n: int, delay: float) -> tf.data.Dataset:
+    def _decode(x):
+        time.sleep(delay)
+        return x
+
+    return tf.data.Dataset.range(n).map(lambda x: tf.numpy_function(_decode, [x], tf.int64))
+
+
+class input_wait_test(unittest.TestCase):
+    def test_measure(self):
+        report = measure_input_wait(_slow_elements(3, delay=0.05), num_batches=5, step_time=0.01)
+        self.assertEqual(report['batches'], 3)
+        self.assertGreaterEqual(report['input_wait'], 0.15)
+        self.assertGreaterEqual(report['seconds'], report['input_wait'] + 0.03)
+        self.assertLess(report['input_wait_fraction'], 1.0)
+
+        with self.assertRaises(ValueError):
+            measure_input_wait(tf.data.Dataset.range(3), num_batches=0)
+
+    def test_echo_saves_input_wait(self):
+        report = echo_input_wait(_slow_elements(40, delay=0.01), echo=4, batch_size=2, num_batches=5)
+        self.assertEqual(report['echo_off']['batches'], 5)
+        self.assertEqual(report['echo_on']['batches'], 5)
+        # echoing decodes a quarter of the elements for the same batches
+        self.assertGreater(report['input_wait_saved'], 0.0)
+        self.assertAlmostEqual(
+            report['input_wait_saved'],
+            report['echo_off']['input_wait'] - report['echo_on']['input_wait']
+        )
+
+
+class dataset_creator_test(unittest.TestCase):
+    def test_is_a_creator(self):
+        self.assertIsInstance(dataset_creator, Creator)
+        self.assertEqual(dataset_creator.name, 'dataset_creator')
+
+    def test_report(self):
+        timings = (
+            VideoDatasetTiming('a', '0.data', start=0.0, duration=2.0, thread='0'),
+            VideoDatasetTiming('b', '1.data', start=0.0, duration=1.0, thread='1'),
+        )
+        report = DatasetCreationReport(timings, num_workers=2, duration=2.0)
+        self.assertEqual(report.total_video_duration, 3.0)
+        self.assertEqual(report.speedup, 1.5)
+        self.assertEqual(report.describe()['videos'][1]['elem_id'], '1.data')
+
+
+if __name__ == '__main__':
+    unittest.main()
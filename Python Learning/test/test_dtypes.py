@@ -0,0 +1,66 @@
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from boiling_learning.utils.dtypes import DTypePolicy
+
+
+class DTypePolicy_test(unittest.TestCase):
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            DTypePolicy(storage='uint7')
+        with self.assertRaises(ValueError):
+            DTypePolicy(value_range=0)
+
+    def test_round_trip_raw_frames(self):
+        policy = DTypePolicy('uint8', 'float32', value_range=255.0)
+        image = tf.constant([[0.0, 1.0], [127.0, 255.0]])
+
+        stored = policy.to_storage(image)
+        self.assertEqual(stored.dtype, tf.uint8)
+        np.testing.assert_array_equal(stored.numpy(), [[0, 1], [127, 255]])
+
+        computed = policy.to_compute(stored)
+        self.assertEqual(computed.dtype, tf.float32)
+        np.testing.assert_allclose(computed.numpy(), image.numpy())
+
+    def test_round_trip_unit_range(self):
+        policy = DTypePolicy('uint8', 'float32', value_range=1.0)
+        image = tf.constant([0.0, 0.5, 1.0])
+
+        stored = policy.to_storage(image)
+        np.testing.assert_array_equal(stored.numpy(), [0, 128, 255])
+        np.testing.assert_allclose(policy.to_compute(stored).numpy(), image.numpy(), atol=1/255)
+
+    def test_storage_clips(self):
+        policy = DTypePolicy('uint8', 'float32', value_range=255.0)
+        stored = policy.to_storage(tf.constant([-10.0, 300.0]))
+        np.testing.assert_array_equal(stored.numpy(), [0, 255])
+
+    def test_normalize(self):
+        policy = DTypePolicy('uint8', 'float32', value_range=255.0, normalize=True)
+        computed = policy.to_compute(tf.constant([0, 51, 255], dtype=tf.uint8))
+        np.testing.assert_allclose(computed.numpy(), [0.0, 0.2, 1.0], rtol=1e-6)
+
+    def test_float_storage(self):
+        policy = DTypePolicy('float16', 'float32')
+        image = tf.constant([0.25, 128.0])
+
+        stored = policy.to_storage(image)
+        self.assertEqual(stored.dtype, tf.float16)
+        np.testing.assert_array_equal(policy.to_compute(stored).numpy(), image.numpy())
+
+    def test_memory_report(self):
+        report = DTypePolicy('uint8', 'float32').memory_report((4, 5, 1), count=10)
+        self.assertEqual(report['storage_bytes'], 200)
+        self.assertEqual(report['compute_bytes'], 800)
+        self.assertEqual(report['saved_bytes'], 600)
+        self.assertEqual(report['ratio'], 4)
+
+        with self.assertRaises(ValueError):
+            DTypePolicy().memory_report((None, 5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+import os
+from pathlib import Path
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from boiling_learning.management.ElementCache import (
+    ElementCache,
+    estimate_size,
+    path_mtime
+)
+
+
+# far in the future, so that no file is ever modified after these times
+MTIME = 4_000_000_000_000_000_000
+LATER_MTIME = MTIME + 1_000_000_000
+
+
+def _touch(path: Path, mtime_ns: int) -> None:
+    path.touch()
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+class ElementCache_test(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.path = Path(self._directory.name)
+        self.paths = [self.path / f'{index}.data' for index in range(4)]
+        for path in self.paths:
+            _touch(path, MTIME)
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def test_hit_and_miss(self):
+        cache = ElementCache()
+        self.assertEqual(cache.get('0', self.paths[0]), (False, None))
+
+        cache.put('0', self.paths[0], 'element')
+        self.assertEqual(cache.get('0', self.paths[0]), (True, 'element'))
+
+        stats = cache.stats()
+        self.assertEqual((stats.hits, stats.misses), (1, 1))
+        self.assertEqual(stats.hit_rate, 0.5)
+
+    def test_invalidated_when_modified(self):
+        cache = ElementCache()
+        cache.put('0', self.paths[0], 'element')
+
+        _touch(self.paths[0], LATER_MTIME)
+        self.assertEqual(cache.get('0', self.paths[0]), (False, None))
+        self.assertNotIn('0', cache)
+        self.assertEqual(cache.stats().invalidations, 1)
+
+    def test_invalidated_when_removed(self):
+        cache = ElementCache()
+        cache.put('0', self.paths[0], 'element')
+        self.paths[0].unlink()
+        self.assertEqual(cache.get('0', self.paths[0]), (False, None))
+
+        cache.put('1', self.path / 'missing', 'element')
+        self.assertNotIn('1', cache)
+
+    def test_directories(self):
+        directory = self.path / 'model'
+        directory.mkdir()
+        _touch(directory / 'weights', MTIME)
+        os.utime(directory, ns=(MTIME, MTIME))
+
+        cache = ElementCache()
+        cache.put('model', directory, 'model')
+        # the mtime of the directory itself does not change
+        _touch(directory / 'weights', LATER_MTIME)
+        self.assertEqual(directory.stat().st_mtime_ns, MTIME)
+        self.assertEqual(path_mtime(directory), LATER_MTIME)
+        self.assertEqual(cache.get('model', directory), (False, None))
+
+    def test_lru_by_entries(self):
+        cache = ElementCache(max_entries=2)
+        cache.put('0', self.paths[0], 0)
+        cache.put('1', self.paths[1], 1)
+        cache.get('0', self.paths[0])
+        cache.put('2', self.paths[2], 2)
+
+        self.assertIn('0', cache)
+        self.assertNotIn('1', cache)
+        self.assertIn('2', cache)
+        self.assertEqual(cache.stats().evictions, 1)
+
+    def test_lru_by_bytes(self):
+        cache = ElementCache(max_entries=None, max_bytes=10, sizer=len)
+        cache.put('0', self.paths[0], 'abcd')
+        cache.put('1', self.paths[1], 'abcd')
+        self.assertEqual(cache.n_bytes, 8)
+
+        cache.put('2', self.paths[2], 'abcd')
+        self.assertEqual(len(cache), 2)
+        self.assertNotIn('0', cache)
+        self.assertEqual(cache.n_bytes, 8)
+
+        # too large to ever fit
+        cache.put('3', self.paths[3], 'a' * 11)
+        self.assertNotIn('3', cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_invalidate_and_clear(self):
+        cache = ElementCache()
+        cache.put('0', self.paths[0], 0)
+        self.assertTrue(cache.invalidate('0'))
+        self.assertFalse(cache.invalidate('0'))
+
+        cache.put('1', self.paths[1], 1)
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.n_bytes, 0)
+
+    def test_pickled_empty(self):
+        cache = ElementCache()
+        cache.put('0', self.paths[0], 0)
+        unpickled = pickle.loads(pickle.dumps(cache))
+        self.assertEqual(len(unpickled), 0)
+        self.assertEqual(unpickled.max_entries, cache.max_entries)
+
+    def test_unknown_sizes(self):
+        cache = ElementCache(max_bytes=100, sizer=lambda elem: None)
+        cache.put('0', self.paths[0], object())
+        self.assertNotIn('0', cache)
+
+        cache = ElementCache(sizer=lambda elem: None)
+        cache.put('0', self.paths[0], object())
+        self.assertIn('0', cache)
+        self.assertEqual(cache.n_bytes, 0)
+
+    def test_shared_elements(self):
+        cache = ElementCache()
+        cache.put('0', self.paths[0], [])
+        _, elem = cache.get('0', self.paths[0])
+        elem.append(1)
+        self.assertEqual(cache.get('0', self.paths[0]), (True, [1]))
+
+    def test_invalid_budgets(self):
+        with self.assertRaises(ValueError):
+            ElementCache(max_entries=-1)
+        with self.assertRaises(ValueError):
+            ElementCache(max_bytes=-1)
+
+
+class estimate_size_test(unittest.TestCase):
+    def test_arrays_and_tensors(self):
+        self.assertEqual(estimate_size(np.zeros((4, 5), np.float64)), 160)
+        self.assertEqual(estimate_size(tf.zeros((4, 5), tf.float32)), 80)
+        self.assertEqual(estimate_size(tf.Variable(tf.zeros((3,), tf.int64))), 24)
+
+    def test_datasets(self):
+        ds = tf.data.Dataset.from_tensor_slices((tf.zeros((10, 2, 2), tf.uint8), tf.zeros((10,), tf.int32)))
+        self.assertEqual(estimate_size(ds), 10 * (4 + 4))
+        self.assertIsNone(estimate_size(ds.repeat()))
+        self.assertIsNone(estimate_size(ds.filter(lambda image, label: True)))
+        self.assertIsNone(estimate_size(tf.data.Dataset.from_tensor_slices(tf.ragged.constant([[1], [2, 3]]))))
+
+        # dataset triplets are measured split by split
+        self.assertEqual(estimate_size((ds, None, ds)), 2 * 80 + estimate_size(None))
+
+    def test_models(self):
+        model = tf.keras.Sequential([tf.keras.layers.Dense(3, input_shape=(2,))])
+        self.assertEqual(estimate_size(model), (2 * 3 + 3) * 4)
+
+    def test_unknown(self):
+        self.assertIsNone(estimate_size(object()))
+        self.assertIsNone(estimate_size({'a': object()}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+
+from boiling_learning.management.EntryIndex import (
+    EntryIndex,
+    equality_key,
+    resolve_dotted,
+    select_entries
+)
+from boiling_learning.utils.utils import Interval
+
+
+ENTRIES = {
+    '0.data': {'creator': 'a', 'creator_params': {'kwargs': {'size': 1, 'name': 'alpha'}}},
+    '1.data': {'creator': 'a', 'creator_params': {'kwargs': {'size': 2.0, 'name': 'beta'}}},
+    '2.data': {'creator': 'b', 'creator_params': {'kwargs': {'size': 3, 'name': 'gamma'}}},
+    '3.data': {'creator': 'b', 'creator_params': {'kwargs': {'size': True, 'shape': [4, 5]}}},
+    '4.data': {'creator': 'c', 'creator_params': {'args': [10]}},
+}
+
+
+class resolve_dotted_test(unittest.TestCase):
+    def test_mappings_and_sequences(self):
+        self.assertEqual(resolve_dotted(ENTRIES['0.data'], 'creator_params.kwargs.size'), 1)
+        self.assertEqual(resolve_dotted(ENTRIES['3.data'], 'creator_params.kwargs.shape.1'), 5)
+        self.assertEqual(resolve_dotted(ENTRIES['3.data'], 'creator_params.kwargs.shape.-2'), 4)
+        self.assertEqual(resolve_dotted(ENTRIES['4.data'], 'creator_params.args.0'), 10)
+
+    def test_attributes(self):
+        self.assertEqual(resolve_dotted({'interval': Interval(1, 2)}, 'interval.upper'), 2)
+
+    def test_missing(self):
+        with self.assertRaises(KeyError):
+            resolve_dotted(ENTRIES['0.data'], 'creator_params.kwargs.missing')
+        self.assertIsNone(resolve_dotted(ENTRIES['4.data'], 'creator_params.args.1', None))
+        self.assertIsNone(resolve_dotted(ENTRIES['0.data'], 'creator.missing', None))
+
+
+class equality_key_test(unittest.TestCase):
+    def test_integral_floats(self):
+        self.assertEqual(equality_key(1), equality_key(1.0))
+        self.assertNotEqual(equality_key(1), equality_key(1.5))
+        self.assertNotEqual(equality_key(1), equality_key(True))
+
+    def test_mappings(self):
+        self.assertEqual(equality_key({'a': 1, 'b': 2}), equality_key({'b': 2, 'a': 1}))
+
+
+class EntryIndex_test(unittest.TestCase):
+    def setUp(self):
+        self.sizes = EntryIndex('creator_params.kwargs.size', ENTRIES)
+        self.names = EntryIndex('creator_params.kwargs.name', ENTRIES)
+
+    def test_missing_paths_are_not_indexed(self):
+        self.assertEqual(len(self.sizes), 4)
+        self.assertEqual(len(self.names), 3)
+
+    def test_equal(self):
+        self.assertEqual(self.sizes.equal(2), {'1.data'})
+        self.assertEqual(self.sizes.equal(True), {'3.data'})
+        self.assertEqual(self.sizes.equal(4), set())
+        self.assertEqual(self.names.select('beta'), {'1.data'})
+
+    def test_numeric_ranges(self):
+        self.assertEqual(self.sizes.within(Interval(1, 2)), {'0.data', '1.data'})
+        self.assertEqual(self.sizes.within(Interval(1, 3, lower_closed=False)), {'1.data', '2.data'})
+        self.assertEqual(self.sizes.within(Interval(lower=2.5)), {'2.data'})
+        # booleans are not numbers here
+        self.assertEqual(self.sizes.select(Interval(0, 1)), {'0.data'})
+
+    def test_string_ranges(self):
+        self.assertEqual(self.names.within(Interval('b', 'z')), {'1.data', '2.data'})
+        self.assertEqual(self.names.within(Interval(upper='beta', upper_closed=False)), {'0.data'})
+
+    def test_unbounded(self):
+        self.assertEqual(self.sizes.within(Interval()), {'0.data', '1.data', '2.data', '3.data'})
+
+    def test_mixed_bounds(self):
+        with self.assertRaises(ValueError):
+            self.sizes.within(Interval(1, 'z'))
+
+
+class select_entries_test(unittest.TestCase):
+    def setUp(self):
+        self.indexes = {}
+
+    def index(self, path: str) -> EntryIndex:
+        if path not in self.indexes:
+            self.indexes[path] = EntryIndex(path, ENTRIES)
+        return self.indexes[path]
+
+    def test_intersection(self):
+        self.assertEqual(
+            select_entries(self.index, {'creator': 'a', 'creator_params.kwargs.size': Interval(lower=1.5)}),
+            {'1.data'}
+        )
+        self.assertEqual(
+            select_entries(self.index, {'creator': 'b', 'creator_params.kwargs.name': Interval('a', 'z')}),
+            {'2.data'}
+        )
+
+    def test_stops_when_empty(self):
+        selected = select_entries(self.index, {'creator': 'missing', 'creator_params.kwargs.size': 1})
+        self.assertEqual(selected, set())
+        self.assertNotIn('creator_params.kwargs.size', self.indexes)
+
+    def test_no_conditions(self):
+        with self.assertRaises(ValueError):
+            select_entries(self.index, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
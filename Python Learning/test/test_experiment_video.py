@@ -0,0 +1,126 @@
+from pathlib import Path
+import pickle
+import shutil
+import tempfile
+import threading
+import unittest
+
+import modin.pandas as pd
+import numpy as np
+import tensorflow as tf
+
+from boiling_learning.io.io import save_dataset
+from boiling_learning.preprocessing.ExperimentVideo import ExperimentVideo
+
+
+N_FRAMES = 10
+
+
+def _frame(index: int) -> np.ndarray:
+    return np.full((2, 2, 3), 10 * index, dtype=np.uint8)
+
+
+class ExperimentVideo_test(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.path = Path(self._directory.name)
+
+        # the video file does not exist: frames can only come from the extracted files
+        self.video = ExperimentVideo(
+            self.path / 'video.mp4',
+            name='video',
+            frames_dir=self.path / 'frames',
+            frames_tensor_dir=self.path / 'frame_tensors',
+            df_dir=self.path / 'dataframes'
+        )
+        self.video.set_video_data({'categories': {'wire': 'NI80'}})
+        self.video.df = pd.DataFrame({
+            'name': ['video'] * N_FRAMES,
+            'index': list(range(N_FRAMES)),
+            'elapsed_time': [index / 30 for index in range(N_FRAMES)],
+            'wire': ['NI80'] * N_FRAMES
+        })
+
+        self.video.frames_path.mkdir(parents=True)
+        for index in range(N_FRAMES):
+            tf.io.write_file(
+                str(self.video.frames_path / self.video.frame_name(index)),
+                tf.io.encode_png(_frame(index))
+            )
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def _pairs(self, ds: tf.data.Dataset) -> list:
+        return [(frame, int(data['index'])) for frame, data in ds.as_numpy_iterator()]
+
+    def test_pickled_without_video(self):
+        # stands in for an open video, which cannot be pickled
+        self.video.video = threading.Lock()
+        self.video._is_open_video = True
+
+        unpickled = pickle.loads(pickle.dumps(self.video))
+        self.assertIsNone(unpickled.video)
+        self.assertFalse(unpickled._is_open_video)
+        self.assertEqual(unpickled.frames_path, self.video.frames_path)
+        self.assertIsNotNone(self.video.video)
+
+    def test_frame_paths(self):
+        paths = self.video.frame_paths([3, 1])
+        self.assertEqual([path.name for path in paths], ['video_frame3.png', 'video_frame1.png'])
+        self.assertIsNone(self.video.frame_paths([N_FRAMES]))
+
+    def test_shuffle_reads_frame_files(self):
+        ds = self.video.as_tf_dataset(shuffle=True, seed=0)
+
+        epochs = [self._pairs(ds) for _ in range(3)]
+        for pairs in epochs:
+            self.assertCountEqual([index for _, index in pairs], range(N_FRAMES))
+            for frame, index in pairs:
+                self.assertEqual(frame.dtype, np.float32)
+                np.testing.assert_array_equal(frame, _frame(index))
+
+        orders = {tuple(index for _, index in pairs) for pairs in epochs}
+        self.assertGreater(len(orders), 1)
+        # the video container is never opened
+        self.assertIsNone(self.video.video)
+
+    def test_shuffle_indices(self):
+        ds = self.video.as_tf_dataset(indices=[2, 5, 7], shuffle=True, seed=0, dtype=tf.uint8)
+        pairs = self._pairs(ds)
+        self.assertCountEqual([index for _, index in pairs], [2, 5, 7])
+        for frame, index in pairs:
+            np.testing.assert_array_equal(frame, _frame(index))
+
+    def test_shuffle_requires_extracted_frames(self):
+        (self.video.frames_path / self.video.frame_name(4)).unlink()
+        with self.assertRaises(ValueError):
+            self.video.as_tf_dataset(shuffle=True)
+
+    def _frames(self, indices: list) -> list:
+        return list(self.video.frames_to_tensor(indices=indices, dtype=tf.uint8).as_numpy_iterator())
+
+    def test_selected_frames_from_files(self):
+        frames = self._frames([3, 1, 8])
+        np.testing.assert_array_equal(frames, [_frame(3), _frame(1), _frame(8)])
+        self.assertIsNone(self.video.video)
+
+    def test_selected_frames_from_tensor(self):
+        save_dataset(
+            tf.data.Dataset.from_tensor_slices(np.stack([_frame(index) for index in range(N_FRAMES)])),
+            self.video.frames_tensor_path
+        )
+        shutil.rmtree(self.video.frames_path)
+
+        frames = self._frames([1, 4, 9])
+        np.testing.assert_array_equal(frames, [_frame(1), _frame(4), _frame(9)])
+        self.assertEqual(self._frames([]), [])
+        self.assertIsNone(self.video.video)
+
+        # without frame files, frames are read sequentially
+        with self.assertRaises(ValueError):
+            self._frames([4, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
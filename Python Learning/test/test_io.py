@@ -0,0 +1,86 @@
+from pathlib import Path
+import tempfile
+import unittest
+
+import tensorflow as tf
+
+from boiling_learning.datasets.datasets import calculate_dataset_size
+from boiling_learning.io.io import (
+    load_dataset,
+    load_dataset_metadata,
+    save_dataset,
+    save_dataset_metadata,
+    with_saved_cardinality
+)
+
+
+class save_dataset_metadata_test(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.path = Path(self._directory.name)
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def test_round_trip(self):
+        save_dataset_metadata(self.path / 'ds', count=3, n_bytes=10, compression='GZIP')
+        self.assertEqual(
+            load_dataset_metadata(self.path / 'ds'),
+            {'count': 3, 'bytes': 10, 'batch_size': None, 'n_elements': None, 'compression': 'GZIP'}
+        )
+        self.assertIsNone(load_dataset_metadata(self.path / 'missing'))
+
+    def test_batches_are_assumed_full(self):
+        save_dataset_metadata(self.path, count=3, n_bytes=10, batch_size=4)
+        self.assertEqual(load_dataset_metadata(self.path)['n_elements'], 12)
+
+        save_dataset_metadata(self.path, count=3, n_bytes=10, batch_size=4, n_elements=10)
+        self.assertEqual(load_dataset_metadata(self.path)['n_elements'], 10)
+
+
+class with_saved_cardinality_test(unittest.TestCase):
+    def test_cardinality(self):
+        # filtering hides the cardinality, which the metadata restores
+        ds = tf.data.Dataset.range(5).filter(lambda x: True)
+        self.assertLess(int(tf.data.experimental.cardinality(ds)), 0)
+
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertIs(with_saved_cardinality(ds, directory), ds)
+
+            save_dataset_metadata(directory, count=5, n_bytes=0)
+            self.assertEqual(int(tf.data.experimental.cardinality(with_saved_cardinality(ds, directory))), 5)
+
+
+class save_dataset_test(unittest.TestCase):
+    def _check_batched(self, drop_remainder: bool, num_shards=None) -> None:
+        ds = tf.data.Dataset.range(10).filter(lambda x: True).batch(4, drop_remainder=drop_remainder)
+        n_elements = 8 if drop_remainder else 10
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory)
+            save_dataset(ds, path, num_shards=num_shards, batch_size=4)
+
+            metadata = load_dataset_metadata(path)
+            self.assertEqual(metadata['count'], n_elements // 4 + (n_elements % 4 > 0))
+            self.assertEqual(metadata['batch_size'], 4)
+            self.assertEqual(metadata['n_elements'], n_elements)
+
+            loaded = load_dataset(path)
+            self.assertEqual(calculate_dataset_size(loaded, is_batched=True, path=path), n_elements)
+            self.assertEqual(calculate_dataset_size(loaded, is_batched=True), n_elements)
+            self.assertEqual(calculate_dataset_size(loaded, path=path), metadata['count'])
+
+    def test_batched(self):
+        self._check_batched(drop_remainder=False)
+        self._check_batched(drop_remainder=False, num_shards=2)
+        self._check_batched(drop_remainder=True)
+
+    def test_unbatched(self):
+        with tempfile.TemporaryDirectory() as directory:
+            save_dataset(tf.data.Dataset.range(3), directory)
+            metadata = load_dataset_metadata(directory)
+            self.assertEqual((metadata['count'], metadata['n_elements']), (3, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import tempfile
+import threading
+import time
+import unittest
+
+from boiling_learning.management.LookupTable import (
+    JSONLookupTable,
+    LookupTable,
+    SQLiteLookupTable
+)
+
+
+def _entry(creator: str, fingerprint: str, index: int = 0) -> dict:
+    return {
+        'element': {'creator': creator, 'creator_params': [[], {'index': index}]},
+        'fingerprint': fingerprint
+    }
+
+
+class LookupTable_test(unittest.TestCase):
+    def test_abstract(self):
+        with self.assertRaises(TypeError):
+            LookupTable()
+
+
+class _LookupTableTests:
+    def make_table(self, path: Path) -> LookupTable:
+        raise NotImplementedError
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.path = Path(self._directory.name)
+        self.table = self.make_table(self.path)
+
+    def tearDown(self):
+        if isinstance(self.table, SQLiteLookupTable):
+            self.table.close()
+        self._directory.cleanup()
+
+    def test_mapping(self):
+        self.table['0.data'] = _entry('a', 'f0')
+        self.table['1.data'] = _entry('b', 'f1')
+
+        self.assertEqual(len(self.table), 2)
+        self.assertEqual(set(self.table), {'0.data', '1.data'})
+        self.assertEqual(self.table['0.data'], _entry('a', 'f0'))
+        self.assertIn('1.data', self.table)
+
+        del self.table['0.data']
+        self.assertNotIn('0.data', self.table)
+        with self.assertRaises(KeyError):
+            self.table['0.data']
+
+    def test_indices(self):
+        self.table.update_entries({
+            '0.data': _entry('a', 'f0'),
+            '1.data': _entry('a', 'f1'),
+            '2.data': _entry('b', 'f1', index=2),
+        })
+
+        self.assertEqual(self.table.ids_with_fingerprint('f0'), ['0.data'])
+        self.assertCountEqual(self.table.ids_with_fingerprint('f1'), ['1.data', '2.data'])
+        self.assertEqual(self.table.ids_with_fingerprint('missing'), [])
+        self.assertCountEqual(self.table.ids_with_creator('a'), ['0.data', '1.data'])
+
+        self.table['1.data'] = _entry('b', 'f2')
+        self.assertEqual(self.table.ids_with_fingerprint('f1'), ['2.data'])
+        self.assertEqual(self.table.ids_with_fingerprint('f2'), ['1.data'])
+        self.assertCountEqual(self.table.ids_with_creator('b'), ['1.data', '2.data'])
+
+    def test_persisted(self):
+        self.table['0.data'] = _entry('a', 'f0')
+        self.table.flush()
+
+        other = self.make_table(self.path)
+        self.assertEqual(other.entries(), {'0.data': _entry('a', 'f0')})
+        self.assertEqual(other.ids_with_fingerprint('f0'), ['0.data'])
+
+    def test_sees_modifications_of_others(self):
+        other = self.make_table(self.path)
+        for index in range(20):
+            # consecutive writes often share a modification time
+            self.table[f'{index}.data'] = _entry('a', f'f{index}')
+            self.assertEqual(other.ids_with_fingerprint(f'f{index}'), [f'{index}.data'])
+            other[f'{index}.data'] = _entry('b', f'f{index}')
+            self.assertCountEqual(self.table.ids_with_creator('b'), [f'{i}.data' for i in range(index + 1)])
+
+    def test_failed_transaction_is_discarded(self):
+        self.table['0.data'] = _entry('a', 'f0')
+        with self.assertRaises(RuntimeError):
+            with self.table.transaction():
+                self.table['1.data'] = _entry('b', 'f1')
+                raise RuntimeError
+
+        self.assertEqual(set(self.make_table(self.path)), {'0.data'})
+
+
+class JSONLookupTable_test(_LookupTableTests, unittest.TestCase):
+    def make_table(self, path: Path) -> LookupTable:
+        return JSONLookupTable(path / 'lookup_table.json')
+
+
+class SQLiteLookupTable_test(_LookupTableTests, unittest.TestCase):
+    def make_table(self, path: Path) -> LookupTable:
+        return SQLiteLookupTable(path / 'lookup_table.sqlite3')
+
+    def test_threads_share_the_connection(self):
+        n_entries = 200
+
+        def _write(index: int) -> None:
+            self.table[f'{index}.data'] = _entry('a', f'f{index}', index=index)
+
+        def _read(index: int) -> None:
+            elem_id = f'{index}.data'
+            if elem_id in self.table:
+                self.assertEqual(self.table[elem_id]['fingerprint'], f'f{index}')
+            for entry_id, entry in self.table.entries().items():
+                self.assertEqual(entry['fingerprint'], f'f{entry_id.split(".")[0]}')
+            self.assertLessEqual(len(list(self.table)), n_entries)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            futures = [
+                executor.submit(task, index)
+                for index in range(n_entries)
+                for task in (_write, _read)
+            ]
+            for future in futures:
+                future.result()
+
+        self.assertEqual(len(self.table), n_entries)
+        self.assertEqual(self.table.ids_with_fingerprint('f7'), ['7.data'])
+
+    def test_reads_wait_for_transactions_of_other_threads(self):
+        written = threading.Event()
+
+        def _failed_write() -> None:
+            try:
+                with self.table.transaction():
+                    self.table['0.data'] = _entry('a', 'f0')
+                    written.set()
+                    time.sleep(0.2)
+                    raise RuntimeError('discarded')
+            except RuntimeError:
+                pass
+
+        thread = threading.Thread(target=_failed_write)
+        thread.start()
+        written.wait()
+        # uncommitted rows of the shared connection must not be visible to other threads
+        self.assertNotIn('0.data', self.table)
+        self.assertEqual(self.table.entries(), {})
+        thread.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import multiprocessing
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from boiling_learning.management import (
+    Manager,
+    SQLiteLookupTable
+)
+
+
+N_PROCESSES = 8
+N_REPETITIONS = 20
+N_DESCRIPTIONS = 5
+
+
+def _contents(index: int) -> dict:
+    return {
+        'creator': 'creator',
+        'creator_params': [[], {'index': index}],
+        'post_processor': None,
+        'post_processor_params': [[], {}]
+    }
+
+
+def _make_manager(path: Path, backend: str) -> Manager:
+    if backend == 'sqlite':
+        return Manager(path, lookup_table=SQLiteLookupTable(path / 'lookup_table.sqlite3'))
+    else:
+        return Manager(path)
+
+
+def _provide_entries(path: Path, backend: str, worker: int) -> None:
+    manager = _make_manager(path, backend)
+    for repetition in range(N_REPETITIONS):
+        index = (worker + repetition) % N_DESCRIPTIONS
+        manager.provide_entry(contents=_contents(index), include=True, missing_ok=True)
+
+
+class Manager_concurrency_test(unittest.TestCase):
+    def _check_provide_entry(self, backend: str) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory)
+            _make_manager(path, backend)
+
+            processes = [
+                multiprocessing.Process(target=_provide_entries, args=(path, backend, worker))
+                for worker in range(N_PROCESSES)
+            ]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+                self.assertEqual(process.exitcode, 0)
+
+            manager = _make_manager(path, backend)
+            self.assertEqual(len(manager.entries), N_DESCRIPTIONS)
+
+            elem_ids = [
+                manager.elem_id(contents=_contents(index), missing_ok=False)
+                for index in range(N_DESCRIPTIONS)
+            ]
+            self.assertEqual(len(set(elem_ids)), N_DESCRIPTIONS)
+
+    def test_provide_entry_json(self):
+        self._check_provide_entry('json')
+
+    def test_provide_entry_sqlite(self):
+        self._check_provide_entry('sqlite')
+
+
+class Manager_entry_stats_test(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.manager = Manager(Path(self._directory.name))
+        self.elem_id = self.manager.provide_entry(contents=_contents(0), include=True, missing_ok=True)
+        self.manager._record_creation(self.elem_id, creation_time=2.0)
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def test_accesses_are_batched(self):
+        stats_path = self.manager._stats_path(self.elem_id)
+        before = stats_path.stat().st_mtime_ns
+
+        for _ in range(5):
+            self.manager._record_access(self.elem_id)
+        # hits are only kept in memory...
+        self.assertEqual(stats_path.stat().st_mtime_ns, before)
+        self.assertEqual(self.manager._read_entry_stats(self.elem_id).get('n_accesses', 0), 0)
+        self.assertEqual(self.manager.entry_stats(self.elem_id)['n_accesses'], 5)
+
+        # ...until they are flushed
+        self.manager.flush_entry_stats()
+        stats = self.manager._read_entry_stats(self.elem_id)
+        self.assertEqual(stats['n_accesses'], 5)
+        self.assertEqual(stats['creation_time'], 2.0)
+        self.assertEqual(self.manager.entry_stats(self.elem_id)['n_accesses'], 5)
+
+    def test_concurrent_updates(self):
+        managers = [Manager(self.manager.path) for _ in range(N_PROCESSES)]
+        for manager in managers:
+            manager.stats_flush_interval = 0.0
+
+        def _access(manager: Manager) -> None:
+            for _ in range(N_REPETITIONS):
+                manager._record_access(self.elem_id)
+            self.manager._update_entry_stats(self.elem_id, evicted=False)
+
+        threads = [threading.Thread(target=_access, args=(manager,)) for manager in managers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = self.manager._read_entry_stats(self.elem_id)
+        self.assertEqual(stats['n_accesses'], N_PROCESSES * N_REPETITIONS)
+        self.assertEqual(stats['creation_time'], 2.0)
+        self.assertFalse(stats['evicted'])
+        self.assertEqual(list(self.manager.entry_dir(self.elem_id).glob('*.tmp')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,203 @@
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import io
+from pathlib import Path
+import pickle
+import tempfile
+import threading
+import unittest
+
+from boiling_learning.preprocessing.Case import Case
+from boiling_learning.utils.functional import Pack
+from boiling_learning.utils.pipeline import (
+    Node,
+    Pipeline
+)
+
+
+def _copy(source: Path, dest: Path, log: list, name: str) -> None:
+    log.append(name)
+    dest.write_text(source.read_text() + name)
+
+
+def _fail(log: list, name: str) -> None:
+    log.append(name)
+    raise RuntimeError(name)
+
+
+class Pipeline_test(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.path = Path(self._directory.name)
+        self.source = self.path / 'source.txt'
+        self.source.write_text('source')
+        self.log = []
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def _copy_node(self, name: str, source: Path, dest: Path, **kwargs) -> Node:
+        return Node(
+            name,
+            _copy,
+            Pack((source, dest, self.log, name)),
+            inputs=(source,),
+            outputs=(dest,),
+            local=True,
+            **kwargs
+        )
+
+    def make_pipeline(self, description: str = 'v1') -> Pipeline:
+        first, second = self.path / 'first.txt', self.path / 'second.txt'
+        # added in reverse order, so that the order comes from the dependencies
+        return Pipeline(
+            self.path / 'pipeline.json',
+            [
+                self._copy_node('second', first, second),
+                self._copy_node('first', self.source, first, description=description),
+                self._copy_node('other', self.source, self.path / 'other.txt'),
+            ]
+        )
+
+    def test_order(self):
+        pipeline = self.make_pipeline()
+        self.assertEqual(pipeline.dependencies('second'), ['first'])
+        self.assertEqual(pipeline.order(), ['first', 'second', 'other'])
+
+        pipeline.add(Node('last', _copy, after=('second', 'other'), local=True))
+        self.assertEqual(pipeline.order()[-1], 'last')
+
+        with self.assertRaises(ValueError):
+            pipeline.add(Node('last', _copy))
+
+    def test_invalid_graphs(self):
+        pipeline = Pipeline(self.path / 'pipeline.json', [Node('node', _copy, after=('missing',))])
+        with self.assertRaises(ValueError):
+            pipeline.order()
+
+        pipeline = Pipeline(
+            self.path / 'pipeline.json',
+            [Node('a', _copy, after=('b',)), Node('b', _copy, after=('a',))]
+        )
+        with self.assertRaises(ValueError):
+            pipeline.order()
+
+    def test_only_stale_nodes_run(self):
+        results = self.make_pipeline().run()
+        self.assertEqual(self.log, ['first', 'second', 'other'])
+        self.assertEqual({result.status for result in results.values()}, {'ran'})
+        self.assertEqual((self.path / 'second.txt').read_text(), 'sourcefirstsecond')
+
+        self.log.clear()
+        results = self.make_pipeline().run()
+        self.assertEqual(self.log, [])
+        self.assertEqual({result.status for result in results.values()}, {'up to date'})
+
+    def test_changes_propagate(self):
+        self.make_pipeline().run()
+
+        self.log.clear()
+        self.make_pipeline(description='v2').run()
+        self.assertEqual(self.log, ['first', 'second'])
+
+        self.log.clear()
+        (self.path / 'second.txt').unlink()
+        self.make_pipeline(description='v2').run()
+        self.assertEqual(self.log, ['second'])
+
+        self.log.clear()
+        self.source.write_text('modified source')
+        plan = {result.name: result.reasons for result in self.make_pipeline(description='v2').plan()}
+        self.assertIn(f'input changed: {self.source.resolve()}', plan['first'])
+        self.assertEqual(plan['second'], ['dependency runs: first'])
+        self.make_pipeline(description='v2').run()
+        self.assertCountEqual(self.log, ['first', 'second', 'other'])
+
+    def test_dry_run(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            results = self.make_pipeline().run(dry_run=True)
+        self.assertIn('first: would run (never ran)', output.getvalue())
+        self.assertEqual(self.log, [])
+        self.assertEqual(results['first'].reasons, ['never ran'])
+        self.assertFalse((self.path / 'pipeline.json').exists())
+
+    def test_failures_skip_dependents(self):
+        pipeline = self.make_pipeline()
+        pipeline.nodes['first'].run = _fail
+        pipeline.nodes['first'].params = Pack((self.log, 'first'))
+
+        with self.assertRaises(RuntimeError):
+            pipeline.run()
+        self.assertCountEqual(self.log, ['first', 'other'])
+        self.assertFalse((self.path / 'second.txt').exists())
+
+        # successful nodes were recorded
+        self.log.clear()
+        self.make_pipeline().run()
+        self.assertEqual(self.log, ['first', 'second'])
+
+    def test_executor(self):
+        pipeline = self.make_pipeline()
+        for node in pipeline.nodes.values():
+            node.local = False
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            results = pipeline.run(executor=executor)
+        self.assertCountEqual(self.log, ['first', 'second', 'other'])
+        self.assertLess(self.log.index('first'), self.log.index('second'))
+        self.assertTrue(all(result.duration is not None for result in results.values()))
+
+
+class Case_pipeline_test(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.path = Path(self._directory.name) / 'case'
+        (self.path / 'videos').mkdir(parents=True)
+        for name in ('a', 'b'):
+            (self.path / 'videos' / f'{name}.mp4').write_bytes(name.encode())
+        self.case = Case(self.path)
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def test_dry_run(self):
+        videos_dir = self.case.videos_dir
+        video_paths = {name: video.video_path for name, video in self.case.items()}
+
+        pipeline = self.case.pipeline(new_suffix='.avi', new_videos_dir='converted')
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            results = pipeline.run(dry_run=True)
+
+        steps = ('convert', 'use_converted', 'audio', 'frames', 'dataframe')
+        self.assertCountEqual(
+            results,
+            [f'{step}:{name}' for step in steps for name in ('a', 'b')] + ['use_converted_videos_dir']
+        )
+        self.assertTrue(all(result.reasons for result in results.values()))
+        self.assertIn('convert:a: would run (never ran)', output.getvalue())
+
+        order = pipeline.order()
+        for name in ('a', 'b'):
+            self.assertLess(order.index(f'convert:{name}'), order.index(f'use_converted:{name}'))
+            self.assertLess(order.index(f'use_converted:{name}'), order.index(f'frames:{name}'))
+
+        # nothing ran: videos are only switched once converted
+        self.assertEqual(self.case.videos_dir, videos_dir)
+        self.assertEqual({name: video.video_path for name, video in self.case.items()}, video_paths)
+        self.assertEqual(list((self.path / 'converted').iterdir()), [])
+        self.assertFalse((self.path / 'pipeline.json').exists())
+
+    def test_steps_can_be_sent_to_other_processes(self):
+        pipeline = self.case.pipeline(extract_audio=False)
+        # stands in for an open video, which cannot be pickled
+        self.case['a'].video = threading.Lock()
+
+        params = pickle.loads(pickle.dumps(pipeline.nodes['frames:a'].params))
+        self.assertEqual(params.args[0].video_path, self.case['a'].video_path)
+        self.assertIsNone(params.args[0].video)
+
+
+if __name__ == '__main__':
+    unittest.main()
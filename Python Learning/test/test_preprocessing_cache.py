@@ -0,0 +1,110 @@
+import collections
+from pathlib import Path
+import tempfile
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+from boiling_learning.datasets.datasets import PreprocessingCache
+from boiling_learning.preprocessing.transformers import ImageTransformer
+from boiling_learning.utils.functional import Pack
+
+
+CALLS = collections.Counter()
+
+
+def _add(image, amount):
+    CALLS[amount] += 1
+    return image + amount
+
+
+def _adder(amount: float, graph_safe: bool = False) -> ImageTransformer:
+    return ImageTransformer(f'add_{amount}', _add, Pack(kwargs=dict(amount=amount)), graph_safe=graph_safe)
+
+
+def _source() -> tf.data.Dataset:
+    images = tf.reshape(tf.range(12, dtype=tf.float32), (3, 2, 2, 1))
+    return tf.data.Dataset.from_tensor_slices((images, tf.range(3)))
+
+
+def _images(ds: tf.data.Dataset) -> list:
+    return [image for image, _ in ds.as_numpy_iterator()]
+
+
+class PreprocessingCache_test(unittest.TestCase):
+    source_description = {'source': 'range'}
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.cache = PreprocessingCache(Path(self._directory.name))
+        CALLS.clear()
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def provide(self, transformers, **kwargs) -> list:
+        return _images(self.cache.provide(self.source_description, _source(), transformers, **kwargs))
+
+    def test_default_cut_points(self):
+        transformers = [_adder(1), _adder(2, graph_safe=True), _adder(3), _adder(4, graph_safe=True)]
+        self.assertEqual(PreprocessingCache.default_cut_points(transformers), [1, 3, 4])
+        self.assertEqual(PreprocessingCache.default_cut_points(transformers[:3]), [1, 3])
+        self.assertEqual(PreprocessingCache.default_cut_points([]), [])
+
+    def test_shared_prefixes_are_reused(self):
+        first = self.provide([_adder(1), _adder(2)])
+        self.assertEqual(CALLS, {1: 3, 2: 3})
+
+        second = self.provide([_adder(1), _adder(3)])
+        # only the transformer after the shared prefix runs
+        self.assertEqual(CALLS, {1: 3, 2: 3, 3: 3})
+        np.testing.assert_array_equal(np.asarray(second) - np.asarray(first), 1)
+
+        fingerprints = self.cache.fingerprints(self.source_description, [_adder(1), _adder(3)])
+        self.assertNotIn(fingerprints[0], self.cache)
+        self.assertIn(fingerprints[1], self.cache)
+        self.assertIn(fingerprints[2], self.cache)
+
+    def test_full_pipeline_is_reused(self):
+        first = self.provide([_adder(1), _adder(2)])
+        CALLS.clear()
+        np.testing.assert_array_equal(self.provide([_adder(1), _adder(2)]), first)
+        self.assertEqual(CALLS, {})
+
+    def test_explicit_cut_points(self):
+        transformers = [_adder(1), _adder(2), _adder(3)]
+        self.provide(transformers, cut_points=[2])
+        fingerprints = self.cache.fingerprints(self.source_description, transformers)
+        self.assertEqual(
+            [fingerprint in self.cache for fingerprint in fingerprints],
+            [False, False, True, True]
+        )
+
+        CALLS.clear()
+        self.provide([_adder(1), _adder(2), _adder(4)])
+        self.assertEqual(CALLS, {4: 3})
+
+        with self.assertRaises(ValueError):
+            self.provide(transformers, cut_points=[4])
+
+    def test_eviction_accounts_for_prefixes(self):
+        self.provide([_adder(1), _adder(2)])
+        size = self.cache.size()
+        self.assertEqual(len(self.cache._load_index()), 2)
+
+        self.cache.max_bytes = size
+        self.provide([_adder(5), _adder(6)])
+        self.assertLessEqual(self.cache.size(), size)
+        fingerprints = self.cache.fingerprints(self.source_description, [_adder(5), _adder(6)])
+        self.assertIn(fingerprints[-1], self.cache)
+
+    def test_clear(self):
+        self.provide([_adder(1)])
+        self.cache.clear()
+        self.assertEqual(self.cache.size(), 0)
+        self.assertEqual(list(self.cache._entries_path.iterdir()), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
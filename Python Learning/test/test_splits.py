@@ -0,0 +1,61 @@
+from fractions import Fraction
+import unittest
+
+import tensorflow as tf
+
+from boiling_learning.datasets.datasets import (
+    DatasetSplitter,
+    SplitMethod,
+    index_train_val_test_split,
+    tf_train_val_test_split
+)
+
+
+class index_train_val_test_split_test(unittest.TestCase):
+    splits = DatasetSplitter(train=Fraction(3, 5), val=Fraction(1, 5), test=None)
+
+    def test_interleave(self):
+        train, val, test = index_train_val_test_split(range(10), self.splits, SplitMethod.INTERLEAVE)
+        self.assertEqual(train, [0, 1, 2, 5, 6, 7])
+        self.assertEqual(val, [3, 8])
+        self.assertEqual(test, [4, 9])
+
+    def test_interleave_matches_tf_split(self):
+        indices = list(range(100, 117))
+        ds_splits = tf_train_val_test_split(tf.data.Dataset.from_tensor_slices(indices), self.splits)
+        index_splits = index_train_val_test_split(indices, self.splits, 'interleave')
+        for ds, split in zip(ds_splits, index_splits):
+            self.assertEqual(list(ds.as_numpy_iterator()), split)
+
+    def test_no_val(self):
+        splits = DatasetSplitter(train=Fraction(3, 4), test=None)
+        train, val, test = index_train_val_test_split(range(8), splits)
+        self.assertIsNone(val)
+        self.assertEqual(train, [0, 1, 2, 4, 5, 6])
+        self.assertEqual(test, [3, 7])
+
+    def test_hash(self):
+        indices = list(range(200))
+        train, val, test = index_train_val_test_split(indices, self.splits, SplitMethod.HASH, key='video')
+        self.assertCountEqual(train + val + test, indices)
+        self.assertTrue(train and val and test)
+
+        # the assignment of an index does not depend on the others
+        subset = index_train_val_test_split(indices[::3], self.splits, SplitMethod.HASH, key='video')
+        for split, subset_split in zip((train, val, test), subset):
+            self.assertEqual(subset_split, [index for index in split if index % 3 == 0])
+
+        self.assertEqual(
+            (train, val, test),
+            index_train_val_test_split(indices, self.splits, 'hash', key='video')
+        )
+
+    def test_invalid_method(self):
+        with self.assertRaises(ValueError):
+            index_train_val_test_split(range(3), self.splits, SplitMethod.WINDOW)
+        with self.assertRaises(ValueError):
+            index_train_val_test_split(range(3), self.splits, 'random')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+import unittest
+
+import tensorflow as tf
+
+from boiling_learning.preprocessing.image import (
+    crop,
+    downscale,
+    downscale_local_mean,
+    flip,
+    grayscale,
+    random_brightness,
+    random_crop,
+    shift,
+    shrink
+)
+from boiling_learning.preprocessing.transformers import (
+    ImageTransformer,
+    Transformer,
+    execution_mode,
+    fuse_transformers
+)
+from boiling_learning.utils.functional import Pack
+
+
+IMAGE_TRANSFORMERS = (
+    ImageTransformer('crop', crop, Pack(kwargs=dict(left=0.1, right=0.9, top=4, height=16))),
+    ImageTransformer('shrink', shrink, Pack(kwargs=dict(left=2, right=2, bottom=0.1, height=16))),
+    ImageTransformer('shift', shift, Pack(kwargs=dict(shift_left=3, shift_down=0.1))),
+    ImageTransformer('flip', flip, Pack(kwargs=dict(horizontal=True, vertical=True))),
+    ImageTransformer('grayscale', grayscale),
+    ImageTransformer('downscale', downscale, Pack(kwargs=dict(factors=(2, 2)))),
+    ImageTransformer('downscale_local_mean', downscale_local_mean, Pack(kwargs=dict(factors=(3, 3)))),
+    ImageTransformer('random_brightness', random_brightness, Pack(kwargs=dict(min_delta=-0.1, max_delta=0.1))),
+    ImageTransformer('random_crop', random_crop, Pack(args=((16, 16, None),))),
+)
+
+
+def _python_ops(concrete_function) -> list:
+    return [
+        op.type
+        for op in concrete_function.graph.get_operations()
+        if 'PyFunc' in op.type
+    ]
+
+
+class execution_mode_test(unittest.TestCase):
+    def test_declarations_are_inherited(self):
+        @execution_mode(graph_safe=True, batchable=True)
+        def double(x):
+            return 2 * x
+
+        self.assertTrue(Transformer('double', double).graph_safe)
+        self.assertTrue(Transformer('double', double).batchable)
+        self.assertFalse(Transformer('double', double, batchable=False).batchable)
+        self.assertFalse(Transformer('identity', lambda x: x).graph_safe)
+
+    def test_fuse_keeps_mode(self):
+        fused = fuse_transformers(IMAGE_TRANSFORMERS)
+        self.assertEqual(len(fused), 1)
+        self.assertTrue(fused[0].graph_safe)
+        self.assertTrue(fused[0].batchable)
+
+
+class graph_safe_image_transformers_test(unittest.TestCase):
+    def test_declared_graph_safe_and_batchable(self):
+        for transformer in IMAGE_TRANSFORMERS:
+            with self.subTest(transformer=transformer.name):
+                self.assertTrue(transformer.graph_safe)
+                self.assertTrue(transformer.batchable)
+
+    def test_trace_with_tf_function(self):
+        image_specs = {
+            'image': tf.TensorSpec((None, None, 3), tf.float32),
+            'batch': tf.TensorSpec((None, None, None, 3), tf.float32),
+        }
+        data_spec = tf.TensorSpec((), tf.float32)
+
+        for transformer in IMAGE_TRANSFORMERS:
+            map_fn = transformer.as_tf_function(pack_tuple=True)
+
+            for kind, image_spec in image_specs.items():
+                with self.subTest(transformer=transformer.name, kind=kind):
+                    concrete_function = map_fn.get_concrete_function(image_spec, data_spec)
+                    self.assertEqual(_python_ops(concrete_function), [])
+
+    def test_map_over_dataset(self):
+        images = tf.random.uniform((4, 32, 32, 3))
+        ds = tf.data.Dataset.from_tensor_slices((images, tf.range(4, dtype=tf.float32)))
+        for transformer in IMAGE_TRANSFORMERS:
+            with self.subTest(transformer=transformer.name):
+                image, data = next(iter(ds.map(transformer.as_tf_function(pack_tuple=True))))
+                self.assertEqual(len(image.shape), 3)
+                self.assertEqual(float(data), 0.0)
+
+
+class batched_image_transformers_test(unittest.TestCase):
+    def setUp(self):
+        tf.random.set_seed(0)
+        self.images = tf.random.uniform((4, 32, 32, 3))
+
+    def test_batches_equal_elements(self):
+        for transformer in IMAGE_TRANSFORMERS:
+            if transformer.name not in {'crop', 'flip', 'grayscale', 'downscale', 'shrink'}:
+                continue
+
+            with self.subTest(transformer=transformer.name):
+                batched = transformer.transform_image(self.images)
+                per_element = tf.stack([transformer.transform_image(image) for image in self.images])
+                self.assertEqual(batched.shape, per_element.shape)
+                self.assertTrue(bool(tf.reduce_all(tf.abs(batched - per_element) < 1e-6)))
+
+    def test_random_brightness_is_drawn_per_image(self):
+        images = tf.repeat(self.images[:1], 8, axis=0)
+        brightened = random_brightness(images, min_delta=-0.5, max_delta=0.5)
+
+        deltas = tf.reduce_mean(brightened - images, axis=(1, 2, 3))
+        self.assertTrue(bool(tf.reduce_all(tf.abs(deltas) <= 0.5)))
+        self.assertGreater(len(set(deltas.numpy().round(6).tolist())), 1)
+
+    def test_random_crop_is_drawn_per_image(self):
+        # every pixel is unique, so that equal crops come from equal positions
+        image = tf.reshape(tf.range(32 * 32 * 3, dtype=tf.float32), (32, 32, 3))
+        images = tf.repeat(image[tf.newaxis, ...], 8, axis=0)
+        cropped = random_crop(images, (16, 16, None))
+
+        self.assertEqual(cropped.shape, (8, 16, 16, 3))
+        corners = cropped[:, 0, 0, 0].numpy().tolist()
+        self.assertGreater(len(set(corners)), 1)
+
+
+class stateless_seed_test(unittest.TestCase):
+    transformers = tuple(
+        transformer
+        for transformer in IMAGE_TRANSFORMERS
+        if transformer.name in {'random_brightness', 'random_crop'}
+    )
+
+    def test_declared_seedable(self):
+        self.assertEqual(
+            [transformer.name for transformer in IMAGE_TRANSFORMERS if transformer.seedable],
+            ['random_brightness', 'random_crop']
+        )
+
+    def test_equal_seeds_give_equal_results(self):
+        image = tf.random.uniform((32, 32, 3))
+        first_seed = tf.constant([1, 2], tf.int64)
+        second_seed = tf.constant([1, 3], tf.int64)
+
+        for transformer in self.transformers:
+            with self.subTest(transformer=transformer.name):
+                first = transformer.transform_image(image, stateless_seed=first_seed)
+                self.assertAllEqual(first, transformer.transform_image(image, stateless_seed=first_seed))
+                self.assertNotAllEqual(first, transformer.transform_image(image, stateless_seed=second_seed))
+
+    def test_batch_elements_are_independent(self):
+        images = tf.repeat(tf.random.uniform((1, 32, 32, 3)), 4, axis=0)
+        for transformer in self.transformers:
+            with self.subTest(transformer=transformer.name):
+                transformed = transformer.transform_image(images, stateless_seed=tf.constant([1, 2], tf.int64))
+                self.assertNotAllEqual(transformed[0], transformed[1])
+
+    def assertAllEqual(self, first, second):
+        self.assertTrue(bool(tf.reduce_all(first == second)))
+
+    def assertNotAllEqual(self, first, second):
+        self.assertFalse(bool(tf.reduce_all(first == second)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+
+import numpy as np
+
+from boiling_learning.io.json_encoders import (
+    GenericJSONEncoder,
+    LegacyGenericJSONEncoder
+)
+from boiling_learning.utils.functional import Pack
+from boiling_learning.utils.utils import (
+    Interval,
+    json_equivalent,
+    json_fingerprint
+)
+
+
+class Interval_test(unittest.TestCase):
+    def test_contains(self):
+        interval = Interval(1, 3)
+        self.assertIn(1, interval)
+        self.assertIn(2.5, interval)
+        self.assertIn(3, interval)
+        self.assertNotIn(0.9, interval)
+        self.assertNotIn(3.1, interval)
+
+    def test_open_bounds(self):
+        interval = Interval(1, 3, lower_closed=False, upper_closed=False)
+        self.assertNotIn(1, interval)
+        self.assertIn(2, interval)
+        self.assertNotIn(3, interval)
+
+    def test_unbounded(self):
+        self.assertIn(-1e9, Interval(upper=0))
+        self.assertNotIn(1, Interval(upper=0))
+        self.assertIn(1e9, Interval(lower=0))
+        self.assertIn('anything', Interval())
+
+    def test_mask(self):
+        values = np.array([0.0, 1.0, 2.0, 3.0, np.nan])
+        np.testing.assert_array_equal(
+            Interval(1, 3).mask(values),
+            [False, True, True, True, False]
+        )
+        np.testing.assert_array_equal(
+            Interval(1, 3, lower_closed=False).mask(values),
+            [False, False, True, True, False]
+        )
+        np.testing.assert_array_equal(
+            Interval().mask(values),
+            [True, True, True, True, False]
+        )
+
+
+class json_fingerprint_test(unittest.TestCase):
+    def test_normalized(self):
+        self.assertEqual(
+            json_fingerprint({'a': 1, 'b': (1, 2)}),
+            json_fingerprint({'b': [1, 2], 'a': 1})
+        )
+        self.assertNotEqual(json_fingerprint({'a': 1}), json_fingerprint({'a': 2}))
+        self.assertEqual(len(json_fingerprint(None)), 64)
+
+    def test_consistent_with_json_equivalent(self):
+        lhs = {'x': (1, 2), 'y': {'z': 'w'}}
+        rhs = {'y': {'z': 'w'}, 'x': [1, 2]}
+        self.assertTrue(json_equivalent(lhs, rhs))
+        self.assertEqual(json_fingerprint(lhs), json_fingerprint(rhs))
+
+    def test_packs_are_told_apart(self):
+        first = {'params': Pack(args=(1,), kwargs={'a': 2})}
+        second = {'params': Pack(args=(1,), kwargs={'a': 3})}
+        self.assertNotEqual(
+            json_fingerprint(first, encoder=GenericJSONEncoder),
+            json_fingerprint(second, encoder=GenericJSONEncoder)
+        )
+        # the legacy encoding ignored the contents of packs
+        self.assertEqual(
+            json_fingerprint(first, encoder=LegacyGenericJSONEncoder),
+            json_fingerprint(second, encoder=LegacyGenericJSONEncoder)
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
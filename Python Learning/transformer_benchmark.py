@@ -0,0 +1,80 @@
+'''Compare per-element and fused-batched preprocessing throughput on a real Case.
+
+Usage:
+    python transformer_benchmark.py <case_path> [num_frames] [batch_size]
+'''
+import pprint
+import sys
+from typing import List
+
+import boiling_learning as bl
+from boiling_learning.datasets import apply_transformers, benchmark_dataset
+from boiling_learning.preprocessing.image import (
+    crop,
+    downscale,
+    flip,
+    grayscale,
+    random_brightness,
+    random_crop
+)
+from boiling_learning.preprocessing.transformers import ImageTransformer
+from boiling_learning.utils.functional import Pack
+
+
+def make_transformers(graph_safe: bool, batchable: bool):
+    def _make(name, f, pack=Pack()):
+        return ImageTransformer(name, f, pack, graph_safe=graph_safe, batchable=batchable)
+
+    return [
+        _make('grayscale', grayscale),
+        _make('crop', crop, Pack(kwargs=dict(left=0.1, right=0.9, top=0.1, bottom=0.9))),
+        _make('downscale', downscale, Pack(kwargs=dict(factors=(2, 2)))),
+        _make('flip', flip, Pack(kwargs=dict(horizontal=True))),
+        _make('random_brightness', random_brightness, Pack(kwargs=dict(min_delta=-0.1, max_delta=0.1))),
+        _make('random_crop', random_crop, Pack(args=((128, 128, None),))),
+    ]
+
+
+def main(argv: List[str]) -> None:
+    case_path = argv[1]
+    num_frames = int(argv[2]) if len(argv) > 2 else 1000
+    batch_size = int(argv[3]) if len(argv) > 3 else 32
+
+    case = bl.preprocessing.Case(case_path)
+    case.set_video_data_from_file(purge=True, remove_absent=True)
+    experiment_video = next(iter(case.values()))
+
+    def source():
+        return experiment_video.as_tf_dataset().take(num_frames)
+
+    pipelines = {
+        'per-element, python': apply_transformers(
+            source(),
+            make_transformers(graph_safe=False, batchable=False),
+            fuse=False
+        ),
+        'per-element, graph': apply_transformers(
+            source(),
+            make_transformers(graph_safe=True, batchable=False),
+            fuse=False
+        ),
+        'fused, graph': apply_transformers(
+            source(),
+            make_transformers(graph_safe=True, batchable=False)
+        ),
+        'fused-batched, graph': apply_transformers(
+            source(),
+            make_transformers(graph_safe=True, batchable=True),
+            batch_size=batch_size
+        ),
+    }
+
+    results = {
+        name: benchmark_dataset(ds)
+        for name, ds in pipelines.items()
+    }
+    pprint.pprint(results)
+
+
+if __name__ == '__main__':
+    main(sys.argv)